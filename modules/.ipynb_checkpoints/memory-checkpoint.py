@@ -9,6 +9,7 @@ class MemorySystem:
         self.stock_insights = {}
         self.industry_insights = {}
         self.general_lessons = []
+        self.research_results = {}  # symbol -> {research step: {'result', 'timestamp'}}, see ResearchPlanner.execute_plan
         self.load_memory()
     
     def load_memory(self):
@@ -20,6 +21,7 @@ class MemorySystem:
                     self.stock_insights = memory_data.get('stock_insights', {})
                     self.industry_insights = memory_data.get('industry_insights', {})
                     self.general_lessons = memory_data.get('general_lessons', [])
+                    self.research_results = memory_data.get('research_results', {})
                 print(f"Memory loaded with {len(self.stock_insights)} stock insights, "
                       f"{len(self.industry_insights)} industry insights, and "
                       f"{len(self.general_lessons)} general lessons.")
@@ -35,7 +37,8 @@ class MemorySystem:
             memory_data = {
                 'stock_insights': self.stock_insights,
                 'industry_insights': self.industry_insights,
-                'general_lessons': self.general_lessons
+                'general_lessons': self.general_lessons,
+                'research_results': self.research_results
             }
             with open(self.memory_file, 'wb') as f:
                 pickle.dump(memory_data, f)
@@ -79,6 +82,29 @@ class MemorySystem:
             'timestamp': timestamp
         })
     
+    def add_research_result(self, symbol, step, result, timestamp=None):
+        """Store the latest output of a research step for a stock (replaces the previous one)."""
+        if timestamp is None:
+            timestamp = datetime.datetime.now().isoformat()
+        
+        self.research_results.setdefault(symbol, {})[step] = {
+            'result': result,
+            'timestamp': timestamp
+        }
+    
+    def get_research_result(self, symbol, step, max_age_hours=None):
+        """Get the stored output of a research step, or None when missing or older than max_age_hours."""
+        entry = self.research_results.get(symbol, {}).get(step)
+        if entry is None:
+            return None
+        
+        if max_age_hours is not None:
+            cutoff_date = datetime.datetime.now() - datetime.timedelta(hours=max_age_hours)
+            if datetime.datetime.fromisoformat(entry['timestamp']) <= cutoff_date:
+                return None
+        
+        return entry['result']
+    
     def get_stock_insights(self, symbol, max_age_days=None):
         """Get insights for a specific stock, optionally filtering by age."""
         insights = self.stock_insights.get(symbol, [])
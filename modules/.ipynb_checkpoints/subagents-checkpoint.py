@@ -1,16 +1,16 @@
+import time
 import datetime
-import nltk
+import heapq
+from itertools import islice
 import numpy as np
 import pandas as pd
 import yfinance as yf
-from nltk.sentiment import SentimentIntensityAnalyzer
-import nltk
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize, sent_tokenize
-
-nltk.download('vader_lexicon')
-nltk.download('punkt')
-nltk.download('stopwords')
+from modules.pricestore import PriceStore
+from modules.sentiment import SentimentScorer
+from modules.dag import Step, DAGExecutor, SharedFetches
+from modules.fundamentals import RatioEngine
+from modules.fred import FredStore, interpret_indicators
+from modules.portfolio import PortfolioRisk
 
 class ResearchPlanner:
     """Plans the research steps for a given stock symbol."""
@@ -29,77 +29,258 @@ class ResearchPlanner:
                 'description': f'Gather basic information about {symbol} including company description, sector, and industry',
                 'tools': ['Yahoo Finance API'],
                 'api': '{"symbol": symbol, "step": "info"}',
+                'depends_on': [],
             },
             {
                 'step': 'Financial Analysis',
                 'description': f'Analyze the financial statements of {symbol} including income statement, balance sheet, and cash flow',
                 'tools': ['Yahoo Finance API', 'SEC EDGAR'],
                 'api': '{"symbol": symbol, "step": "financials"}',
+                'depends_on': [],
             },
             {
                 'step': 'Stock Performance',
                 'description': f'Analyze historical stock performance of {symbol} and compare with market benchmarks',
                 'tools': ['Yahoo Finance API'],
                 'api': '{"symbol": symbol, "step": "performance"}',
+                'depends_on': [],
             },
             {
                 'step': 'News Sentiment',
                 'description': f'Collect and analyze recent news articles about {symbol} to assess sentiment',
                 'tools': ['News API', 'Sentiment Analysis'],
                 'api': '{"symbol": symbol, "step": "news_sentiment"}',
+                'depends_on': [],
             },
             {
                 'step': 'Market Context',
                 'description': 'Analyze broader market trends and economic indicators',
                 'tools': ['FRED API', 'Yahoo Finance API'],
                 'api': '{"symbol": symbol, "step": "market_context"}',
+                'depends_on': [],
             },
             {
                 'step': 'Competitive Analysis',
                 'description': f'Identify and analyze key competitors of {symbol}',
                 'tools': ['Yahoo Finance API', 'News API'],
                 'api': '{"symbol": symbol, "step": "competitors"}',
+                'depends_on': ['Company Overview'],
             },
             {
                 'step': 'Risk Assessment',
                 'description': f'Identify and evaluate potential risks for {symbol}',
                 'tools': ['SEC EDGAR', 'News API', 'Financial Analysis'],
                 'api': '{"symbol": symbol, "step": "risk_assessment"}',
+                'depends_on': ['Financial Analysis', 'Stock Performance', 'News Sentiment'],
             },
             {
                 'step': 'Investment Recommendation',
                 'description': f'Synthesize findings into an investment recommendation for {symbol}',
                 'tools': ['Analysis Integration'],
-                'api': '{"symbol": symbol, "step": "investment_recommendation"}'
+                'api': '{"symbol": symbol, "step": "investment_recommendation"}',
+                'depends_on': ['Company Overview', 'Financial Analysis', 'Stock Performance', 'News Sentiment', 'Market Context', 'Competitive Analysis', 'Risk Assessment'],
             },
             {
                 'step': 'Earnings Analysis',
                 'description': f'Analyze upcoming earnings announcement for {symbol} and historical earnings patterns',
                 'tools': ['Yahoo Finance API', 'Earnings Calendar', 'SEC EDGAR'],
-                'api': '{"symbol": symbol, "step": "earnings_analysis"}'
+                'api': '{"symbol": symbol, "step": "earnings_analysis"}',
+                'depends_on': [],
             },
             {
                 'step': 'Industry Analysis',
                 'description': f'Deep dive into the industry trends and outlook for the sector of {symbol}',
                 'tools': ['Industry Reports', 'FRED API', 'News API'],
-                'api': '{"symbol": symbol, "step": "industry_analysis"}'
+                'api': '{"symbol": symbol, "step": "industry_analysis"}',
+                'depends_on': ['Company Overview', 'Market Context'],
             },
             {
                 'step': 'Previous Insights Review',
                 'description': f'Review previous research insights about {symbol}',
                 'tools': ['Memory System'],
-                'api': '{"symbol": symbol, "step": "previous_insights"}'
+                'api': '{"symbol": symbol, "step": "previous_insights"}',
+                'depends_on': [],
             }
         ]
         
         # Customize the plan based on context and previous insights
         return plan
 
+    def execute_plan(self, symbol, data_acquisition=None, steps=None, max_age_hours=24, max_workers=8):
+        """Run the research plan for a symbol as a DAG.
+        
+        Each step starts as soon as the steps it depends on ('depends_on') are done, so independent steps
+        run in parallel and the plan takes about as long as its critical path. Data fetches shared by several
+        steps (e.g. the income statement or the SPY history) are made once per run, and steps with an output
+        in memory younger than max_age_hours are not run again.
+        
+        Args:
+            symbol: Stock symbol
+            data_acquisition: DataAcquisition to fetch the data with (a new one by default)
+            steps: Names of the steps to run (all by default); the steps they depend on are added
+            max_age_hours: Maximum age of a stored step output to reuse it (None never reuses)
+            max_workers: Steps running at the same time
+        
+        Returns:
+            {'results': {step: output}, 'errors', 'skipped' (fresh in memory), 'timings', 'elapsed', 'critical_path', 'fetches'}
+        """
+        plan = {item['step']: item for item in self.available_research_steps(symbol)}
+        fetches = SharedFetches()
+        data = fetches.wrap(data_acquisition or DataAcquisition())
+        handlers = self.step_handlers(symbol, data)
+        
+        # The requested steps and everything they depend on
+        selected, pending = set(), list(steps or plan)
+        while pending:
+            name = pending.pop()
+            if name in plan and name in handlers and name not in selected:
+                selected.add(name)
+                pending.extend(plan[name]['depends_on'])
+        
+        can_reuse = max_age_hours is not None and hasattr(self.memory_system, 'get_research_result')
+        dag = []
+        for name in selected:
+            cached = None
+            if can_reuse and name != 'Previous Insights Review':
+                cached = lambda name=name: self.memory_system.get_research_result(symbol, name, max_age_hours)
+            dag.append(Step(name, handlers[name], depends_on=plan[name]['depends_on'], cached=cached))
+        run = DAGExecutor(max_workers=max_workers).run(dag)
+        
+        # Fresh outputs are kept for the next runs
+        if hasattr(self.memory_system, 'add_research_result'):
+            timestamp = datetime.datetime.now().isoformat()
+            stored = False
+            for name, result in run['results'].items():
+                if result is not None and name not in run['skipped'] and name != 'Previous Insights Review':
+                    self.memory_system.add_research_result(symbol, name, result, timestamp=timestamp)
+                    stored = True
+            if stored:
+                self.memory_system.save_memory()
+        
+        run['fetches'] = {'made': fetches.calls, 'shared': fetches.shared}
+        return run
+    
+    def step_handlers(self, symbol, data):
+        """The function of each research step: callable(inputs) -> output, inputs holding the outputs of its dependencies."""
+        financial = FinancialAnalyzer(data)
+        news = NewsSentimentAnalyzer(data)
+        market = MarketAnalyzer(data)
+        
+        def stock_performance(inputs):
+            trends = market.analyze_market_trends(benchmark_symbols=[symbol, 'SPY'])
+            performance = trends['performance']
+            stock, benchmark = performance.get(symbol), performance.get('SPY')
+            return {
+                'performance': stock,
+                'benchmark': benchmark,
+                'excess_return': stock['total_return'] - benchmark['total_return'] if stock and benchmark else None
+            }
+        
+        def sector_context(inputs):
+            overview = inputs.get('Company Overview') or {}
+            sectors = market.analyze_sector_performance()
+            sector = SECTOR_NAMES.get(overview.get('sector'), overview.get('sector'))
+            return {
+                'sector': sector,
+                'sector_performance': sectors['performance'].get(sector),
+                'top_sectors': sectors['top_sectors'],
+                'bottom_sectors': sectors['bottom_sectors']
+            }
+        
+        def industry_analysis(inputs):
+            context = inputs.get('Market Context') or {}
+            return {**sector_context(inputs), 'industry': (inputs.get('Company Overview') or {}).get('industry'),
+                    'economy': context.get('economy')}
+        
+        def risk_assessment(inputs):
+            risks = []
+            health = (inputs.get('Financial Analysis') or {}).get('health')
+            if health:
+                if health['leverage']['score'] <= 1:
+                    risks.append('High leverage')
+                if health['liquidity']['score'] <= 1:
+                    risks.append('Weak liquidity')
+                if health['profitability']['score'] <= 1:
+                    risks.append('Low profitability')
+            performance = inputs.get('Stock Performance') or {}
+            if performance.get('performance') and performance.get('benchmark'):
+                if performance['performance']['volatility'] > 1.5 * performance['benchmark']['volatility']:
+                    risks.append('Volatility well above the market')
+            sentiment = (inputs.get('News Sentiment') or {}).get('summary') or {}
+            if sentiment.get('overall_sentiment') == 'negative':
+                risks.append('Negative news sentiment')
+            return {'risks': risks, 'risk_level': 'High' if len(risks) >= 3 else 'Medium' if risks else 'Low'}
+        
+        def investment_recommendation(inputs):
+            score = 0
+            health = (inputs.get('Financial Analysis') or {}).get('health')
+            if health:
+                score += health['overall']['score'] - 2.5
+            excess = (inputs.get('Stock Performance') or {}).get('excess_return')
+            if excess is not None:
+                score += 1 if excess > 0 else -1
+            sentiment = (inputs.get('News Sentiment') or {}).get('summary') or {}
+            score += {'positive': 1, 'negative': -1}.get(sentiment.get('overall_sentiment'), 0)
+            risk_level = (inputs.get('Risk Assessment') or {}).get('risk_level')
+            score -= {'High': 1.5, 'Medium': 0.5}.get(risk_level, 0)
+            return {
+                'score': score,
+                'recommendation': 'Buy' if score >= 1.5 else 'Sell' if score <= -1.5 else 'Hold',
+                'risk_level': risk_level
+            }
+        
+        return {
+            'Company Overview': lambda inputs: data.get_stock_info(symbol),
+            'Financial Analysis': lambda inputs: {
+                'ratios': financial.calculate_financial_ratios(symbol),
+                'health': financial.evaluate_financial_health(symbol)
+            },
+            'Stock Performance': stock_performance,
+            'News Sentiment': lambda inputs: news.analyze_news_sentiment(symbol),
+            'Market Context': lambda inputs: {
+                'trends': market.analyze_market_trends(),
+                'economy': market.analyze_economic_indicators()
+            },
+            'Competitive Analysis': sector_context,
+            'Risk Assessment': risk_assessment,
+            'Investment Recommendation': investment_recommendation,
+            'Earnings Analysis': lambda inputs: {
+                'growth': financial.analyze_growth_trends(symbol),
+                'quarterly_income': data.get_financial_statements(symbol, 'income', 'quarterly')
+            },
+            'Industry Analysis': industry_analysis,
+            'Previous Insights Review': lambda inputs: self.memory_system.get_stock_insights(symbol)[-5:],
+        }
+
+# Yahoo Finance sector names -> the sector names used by MarketAnalyzer.analyze_sector_performance
+SECTOR_NAMES = {
+    'Technology': 'Technology',
+    'Financial Services': 'Financial',
+    'Healthcare': 'Healthcare',
+    'Consumer Cyclical': 'Consumer Discretionary',
+    'Consumer Defensive': 'Consumer Staples',
+    'Energy': 'Energy',
+    'Basic Materials': 'Materials',
+    'Industrials': 'Industrials',
+    'Utilities': 'Utilities',
+    'Real Estate': 'Real Estate',
+}
+
 class DataAcquisition:
     """Interfaces with external APIs and datasets to collect data."""
     
-    def __init__(self, api_keys=None):
+    def __init__(self, api_keys=None, price_store=None, statement_ttl=24 * 3600, edgar_store=None, fred_store=None):
         self.api_keys = api_keys or {}
+        # Local OHLCV store, so daily history is only downloaded once and then extended incrementally
+        self.price_store = price_store if price_store is not None else PriceStore()
+        # Financial statements only change once a quarter, so they're kept in memory and reused by every analysis
+        self.statement_ttl = statement_ttl  # Seconds a fetched statement (or market cap) is reused
+        self.statement_cache = {}  # (symbol, statement_type, period) -> (fetched at, DataFrame)
+        self.market_caps = {}  # symbol -> (fetched at, market cap)
+        # Optional offline SEC EDGAR store (modules/edgar.py); statements it has are served from disk instead of yfinance
+        self.edgar_store = edgar_store
+        # Local FRED series (modules/fred.py), loaded from CSV dumps and kept current incrementally
+        self.fred_store = fred_store if fred_store is not None else FredStore()
     
     def get_stock_info(self, symbol):
         """Get basic information about a stock."""
@@ -128,22 +309,50 @@ class DataAcquisition:
             statement_type: 'income', 'balance', or 'cash'
             period: 'annual' or 'quarterly'
         """
+        key = (symbol, statement_type, period)
+        cached = self.statement_cache.get(key)
+        if cached is not None and time.time() - cached[0] < self.statement_ttl:
+            return cached[1]
+        if self.edgar_store is not None:
+            statement = self.edgar_store.statement(symbol, statement_type, period)
+            if statement is not None:
+                self.statement_cache[key] = (time.time(), statement)
+                return statement
         try:
             stock = yf.Ticker(symbol)
             
             if statement_type == 'income':
-                return stock.income_stmt if period == 'annual' else stock.quarterly_income_stmt
+                statement = stock.income_stmt if period == 'annual' else stock.quarterly_income_stmt
             elif statement_type == 'balance':
-                return stock.balance_sheet if period == 'annual' else stock.quarterly_balance_sheet
+                statement = stock.balance_sheet if period == 'annual' else stock.quarterly_balance_sheet
             elif statement_type == 'cash':
-                return stock.cashflow if period == 'annual' else stock.quarterly_cashflow
+                statement = stock.cashflow if period == 'annual' else stock.quarterly_cashflow
             else:
                 print(f"Invalid statement type: {statement_type}")
                 return None
+            self.statement_cache[key] = (time.time(), statement)
+            return statement
         except Exception as e:
             print(f"Error getting {statement_type} statement for {symbol}: {e}")
             return None
     
+    def get_market_cap(self, symbol):
+        """Get the current market capitalization of a stock (cached like the statements)."""
+        cached = self.market_caps.get(symbol)
+        if cached is not None and time.time() - cached[0] < self.statement_ttl:
+            return cached[1]
+        try:
+            stock = yf.Ticker(symbol)
+            try:
+                market_cap = stock.fast_info['marketCap']  # Lighter than .info, which downloads the whole profile
+            except Exception:
+                market_cap = stock.info.get('marketCap')
+            self.market_caps[symbol] = (time.time(), market_cap)
+            return market_cap
+        except Exception as e:
+            print(f"Error getting market cap for {symbol}: {e}")
+            return None
+    
     def get_stock_price_history(self, symbol, period='1y', interval='1d'):
         """Get historical stock prices.
         
@@ -153,6 +362,9 @@ class DataAcquisition:
             interval: '1m', '2m', '5m', '15m', '30m', '60m', '90m', '1h', '1d', '5d', '1wk', '1mo', '3mo'
         """
         try:
+            # Daily bars are served from the local store, which only fetches the missing date range
+            if interval == '1d' and self.price_store:
+                return self.price_store.get_history(symbol, period=period)
             stock = yf.Ticker(symbol)
             history = stock.history(period=period, interval=interval)
             return history
@@ -160,6 +372,17 @@ class DataAcquisition:
             print(f"Error getting price history for {symbol}: {e}")
             return None
     
+    def get_price_arrays(self, symbol, period='1y'):
+        """Get daily OHLCV bars as a zero-copy NumPy view over the local price store.
+        
+        Columns are accessed by name, e.g. get_price_arrays('AAPL')['close'].
+        """
+        try:
+            return self.price_store.get_price_arrays(symbol, period=period)
+        except Exception as e:
+            print(f"Error getting price arrays for {symbol}: {e}")
+            return None
+    
     def get_news(self, query, num_articles=10):
         """Get news articles based on a query."""
         # This is a mock implementation since we don't have actual API keys
@@ -181,14 +404,15 @@ class DataAcquisition:
     
     def get_economic_indicators(self, indicators=None):
         """Get economic indicators from FRED."""
-        # This is a mock implementation since we don't have actual API keys
-        # In a real implementation, you would use the FRED API client
-        
         indicators = indicators or ['GDP', 'UNRATE', 'CPIAUCSL', 'FEDFUNDS']
         
-        # Simulate economic data
-        mock_data = {}
+        # Series in the local FRED store (updated from FRED at most every few hours)
+        data = self.fred_store.frames(indicators, last=120, refresh=True)
+        
+        # Simulated data for the series we don't have locally yet
         for indicator in indicators:
+            if indicator in data:
+                continue
             # Create fake time series data
             dates = [datetime.datetime.now() - datetime.timedelta(days=30*i) for i in range(12)]
             values = []
@@ -210,9 +434,9 @@ class DataAcquisition:
                 'value': values
             })
             df = df.sort_values('date')
-            mock_data[indicator] = df
+            data[indicator] = df
         
-        return mock_data
+        return data
 class FinancialAnalyzer:
     """Analyzes financial data for a stock."""
     
@@ -230,9 +454,9 @@ class FinancialAnalyzer:
             if income_stmt is None or balance_sheet is None or cash_flow is None:
                 return None
             
-            # Get stock info for market data
-            stock = yf.Ticker(symbol)
-            info = stock.info
+            # Get market data (cached by DataAcquisition, like the statements)
+            market_cap = self.data_acquisition.get_market_cap(symbol)
+            info = {'marketCap': market_cap} if market_cap else {}
             
             # Calculate ratios
             ratios = {}
@@ -417,13 +641,77 @@ class FinancialAnalyzer:
         except Exception as e:
             print(f"Error evaluating financial health for {symbol}: {e}")
             return None
+
+    def analyze_universe(self, symbols, max_workers=16):
+        """Ratios, growth and health of many stocks at once, as a DataFrame indexed by symbol.
+        
+        Same definitions as the per-symbol methods above, computed over aligned arrays of all the
+        statements instead of one symbol at a time (statements come from the DataAcquisition cache).
+        """
+        try:
+            return RatioEngine(self.data_acquisition, max_workers=max_workers).analyze(symbols)
+        except Exception as e:
+            print(f"Error analyzing financials for {len(symbols)} symbols: {e}")
+            return None
+        
+class SentimentSummary:
+    """Incrementally computed sentiment summary, so insights can be summarized without keeping them all."""
+    
+    def __init__(self, num_key_insights=5):
+        self.num_key_insights = num_key_insights
+        self.positive_count = 0
+        self.negative_count = 0
+        self.neutral_count = 0
+        self.total_score = 0.0
+        self.count = 0
+        # Min-heap holding only the strongest insights seen so far; ties keep the earliest insight
+        self._key_insights = []
+    
+    def add(self, insight):
+        """Add one insight to the running totals."""
+        if insight['type'] == 'positive':
+            self.positive_count += 1
+        elif insight['type'] == 'negative':
+            self.negative_count += 1
+        elif insight['type'] == 'neutral':
+            self.neutral_count += 1
+        self.total_score += insight['sentiment_score']
+        self.count += 1
+        
+        entry = (abs(insight['sentiment_score']), -self.count, insight)
+        if len(self._key_insights) < self.num_key_insights:
+            heapq.heappush(self._key_insights, entry)
+        elif entry[:2] > self._key_insights[0][:2]:
+            heapq.heapreplace(self._key_insights, entry)
+    
+    def result(self):
+        """Return the summary in the same format as NewsSentimentAnalyzer.summarize_sentiment."""
+        avg_sentiment = self.total_score / self.count if self.count else 0
+        
+        # Determine overall sentiment
+        if avg_sentiment > 0.1:
+            overall_sentiment = 'positive'
+        elif avg_sentiment < -0.1:
+            overall_sentiment = 'negative'
+        else:
+            overall_sentiment = 'neutral'
         
+        return {
+            'overall_sentiment': overall_sentiment,
+            'sentiment_score': avg_sentiment,
+            'positive_count': self.positive_count,
+            'negative_count': self.negative_count,
+            'neutral_count': self.neutral_count,
+            'key_insights': [entry[2] for entry in sorted(self._key_insights, key=lambda x: x[:2], reverse=True)]
+        }
+
 class NewsSentimentAnalyzer:
     """Analyzes news sentiment for a stock."""
     
-    def __init__(self, data_acquisition):
+    def __init__(self, data_acquisition, scorer=None):
         self.data_acquisition = data_acquisition
-        self.sia = SentimentIntensityAnalyzer()
+        # Batched VADER scoring with a content-hash cache; NLTK resources are only fetched on first use
+        self.scorer = scorer if scorer is not None else SentimentScorer()
     
     def preprocess_news(self, news_articles):
         """Preprocess news articles for analysis."""
@@ -447,12 +735,12 @@ class NewsSentimentAnalyzer:
         """Classify news articles by relevance and potential impact."""
         classified_articles = []
         
-        for article in preprocessed_articles:
+        # Analyze sentiment for all articles in one batch (previously scored texts come from the cache)
+        sentiments = self.scorer.score_batch([article['text'] for article in preprocessed_articles])
+        
+        for article, sentiment in zip(preprocessed_articles, sentiments):
             text = article['text']
             
-            # Analyze sentiment
-            sentiment = self.sia.polarity_scores(text)
-            
             # Classify relevance (mock implementation)
             # In a real implementation, you would use a more sophisticated approach
             relevance = 'high' if len(text) > 100 else 'medium' if len(text) > 50 else 'low'
@@ -504,47 +792,20 @@ class NewsSentimentAnalyzer:
     
     def summarize_sentiment(self, insights):
         """Summarize the overall sentiment from news insights."""
-        if not insights:
-            return {
-                'overall_sentiment': 'neutral',
-                'sentiment_score': 0,
-                'positive_count': 0,
-                'negative_count': 0,
-                'neutral_count': 0,
-                'key_insights': []
-            }
-        
-        # Count sentiment types
-        positive_count = sum(1 for insight in insights if insight['type'] == 'positive')
-        negative_count = sum(1 for insight in insights if insight['type'] == 'negative')
-        neutral_count = sum(1 for insight in insights if insight['type'] == 'neutral')
-        
-        # Calculate average sentiment score
-        avg_sentiment = sum(insight['sentiment_score'] for insight in insights) / len(insights)
-        
-        # Determine overall sentiment
-        if avg_sentiment > 0.1:
-            overall_sentiment = 'positive'
-        elif avg_sentiment < -0.1:
-            overall_sentiment = 'negative'
-        else:
-            overall_sentiment = 'neutral'
+        summary = SentimentSummary()
+        for insight in insights:
+            summary.add(insight)
+        return summary.result()
+    
+    def analyze_news_sentiment(self, symbol, stream=False, chunk_size=500):
+        """Full workflow: ingest → preprocess → classify → extract → summarize.
         
-        # Select key insights (highest impact)
-        sorted_insights = sorted(insights, key=lambda x: abs(x['sentiment_score']), reverse=True)
-        key_insights = sorted_insights[:min(5, len(sorted_insights))]
+        With stream=True the articles go through analyze_news_stream in bounded chunks,
+        and only the counts and the summary are returned.
+        """
+        if stream:
+            return self.analyze_news_stream(self.data_acquisition.get_news(symbol, num_articles=15), chunk_size=chunk_size)
         
-        return {
-            'overall_sentiment': overall_sentiment,
-            'sentiment_score': avg_sentiment,
-            'positive_count': positive_count,
-            'negative_count': negative_count,
-            'neutral_count': neutral_count,
-            'key_insights': key_insights
-        }
-    
-    def analyze_news_sentiment(self, symbol):
-        """Full workflow: ingest → preprocess → classify → extract → summarize."""
         # Ingest news
         news = self.data_acquisition.get_news(symbol, num_articles=15)
         
@@ -569,6 +830,67 @@ class NewsSentimentAnalyzer:
             'insights': insights,
             'summary': summary
         }
+    
+    def iter_chunks(self, items, chunk_size):
+        """Split any iterable into lists of at most chunk_size items, without reading ahead."""
+        iterator = iter(items)
+        while True:
+            chunk = list(islice(iterator, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+    
+    def stream_preprocess(self, article_chunks):
+        """Streaming preprocess stage: yields one chunk of preprocessed articles per input chunk."""
+        for chunk in article_chunks:
+            yield self.preprocess_news(chunk)
+    
+    def stream_classify(self, preprocessed_chunks):
+        """Streaming classify stage: each chunk is scored as one batch."""
+        for chunk in preprocessed_chunks:
+            yield self.classify_news(chunk)
+    
+    def stream_extract(self, classified_chunks):
+        """Streaming extract stage."""
+        for chunk in classified_chunks:
+            yield self.extract_insights(chunk)
+    
+    def analyze_news_stream(self, news_articles, chunk_size=500, keep_insights=False):
+        """Streaming workflow: ingest → preprocess → classify → extract → summarize, in bounded chunks.
+        
+        Args:
+            news_articles: Any iterable of articles (e.g. a generator reading an archive)
+            chunk_size: Number of articles held in memory at a time
+            keep_insights: Also return every extracted insight (memory then grows with the insight count)
+        """
+        summary = SentimentSummary()
+        news_count = 0
+        insights = [] if keep_insights else None
+        
+        def counted(articles):
+            nonlocal news_count
+            for article in articles:
+                news_count += 1
+                yield article
+        
+        chunks = self.iter_chunks(counted(news_articles), chunk_size)
+        for insight_chunk in self.stream_extract(self.stream_classify(self.stream_preprocess(chunks))):
+            for insight in insight_chunk:
+                summary.add(insight)
+            if keep_insights:
+                insights.extend(insight_chunk)
+        
+        if news_count == 0:
+            return None
+        
+        result = {
+            'news_count': news_count,
+            'summary': summary.result()
+        }
+        if keep_insights:
+            result['insights'] = insights
+        return result
+    
 class MarketAnalyzer:
     """Analyzes market context and economic indicators."""
     
@@ -615,66 +937,17 @@ class MarketAnalyzer:
         if not indicators:
             return None
         
-        # Analyze trends in economic indicators
-        analysis = {}
-        
-        for indicator, data in indicators.items():
-            if not data.empty:
-                current_value = data['value'].iloc[-1]
-                previous_value = data['value'].iloc[-2] if len(data) > 1 else None
-                change = (current_value / previous_value - 1) * 100 if previous_value else None
-                
-                # Interpret the indicator
-                interpretation = ""
-                if indicator == 'GDP':
-                    if change is not None:
-                        if change > 3:
-                            interpretation = "Strong growth"
-                        elif change > 1:
-                            interpretation = "Moderate growth"
-                        elif change > 0:
-                            interpretation = "Slow growth"
-                        elif change > -1:
-                            interpretation = "Mild contraction"
-                        else:
-                            interpretation = "Significant contraction"
-                elif indicator == 'UNRATE':
-                    if current_value < 4:
-                        interpretation = "Very low unemployment"
-                    elif current_value < 5:
-                        interpretation = "Low unemployment"
-                    elif current_value < 6:
-                        interpretation = "Moderate unemployment"
-                    else:
-                        interpretation = "High unemployment"
-                elif indicator == 'CPIAUCSL':
-                    if change is not None:
-                        if change > 4:
-                            interpretation = "High inflation"
-                        elif change > 2:
-                            interpretation = "Moderate inflation"
-                        elif change > 1:
-                            interpretation = "Low inflation"
-                        elif change > 0:
-                            interpretation = "Very low inflation"
-                        else:
-                            interpretation = "Deflation"
-                elif indicator == 'FEDFUNDS':
-                    if current_value > 4:
-                        interpretation = "Restrictive monetary policy"
-                    elif current_value > 2:
-                        interpretation = "Neutral monetary policy"
-                    else:
-                        interpretation = "Accommodative monetary policy"
-                
-                analysis[indicator] = {
-                    'current_value': current_value,
-                    'previous_value': previous_value,
-                    'change': change,
-                    'interpretation': interpretation
-                }
-        
-        return analysis
+        # Changes, z-scores and regimes of all the indicators at once (thresholds in modules/fred.py INDICATOR_RULES)
+        return interpret_indicators(indicators)
+    
+    def analyze_portfolio_risk(self, holdings, benchmark='SPY', period='3y', confidence=0.95, horizon_days=1):
+        """Analyze the risk of a portfolio ({symbol: weight or amount}): VaR, beta, correlations and risk contributions."""
+        try:
+            return PortfolioRisk(self.data_acquisition, benchmark=benchmark, period=period).analyze(
+                holdings, confidence=confidence, horizon_days=horizon_days)
+        except Exception as e:
+            print(f"Error analyzing portfolio risk: {e}")
+            return None
     
     def analyze_sector_performance(self, period='1y'):
         """Analyze performance of different market sectors."""
@@ -1,5 +1,13 @@
+from modules.subagents import Agent
+from modules.memory import ConversationHistory
+from modules.parser import XmlParser
+from modules.llm import routed_complete
+from modules.router import IntentRouter, PlanTemplateCache
+from modules.deadline import DeadlineExceeded, current_deadline, deadline_scope
+
 class OrchestratorAgent(Agent):
-    def __init__(self, model, agents=None, memory=None, parser=None, debug=0):
+    def __init__(self, model, agents=None, memory=None, parser=None, debug=0, history_tokens=1500, history_summarizer=None, writer_reserve=0.3,
+                 intent_router=None, fast_path=True, plan_cache=None, cache_plans=True):
         self.agents = agents
         #self.agents_description = "\n".join([f"- {agent.name}: {agent.role}" for agent in self.agents.items()])
         self.agents_description = ""
@@ -43,8 +51,8 @@ class OrchestratorAgent(Agent):
             parser = parser,
             debug = debug # Storing the variable debug, used for printing messages when set to 1
         )
-        self.conversation_history = []
-            # Limit for conversation history
+        # Conversation history within a token budget; older turns are compacted into a rolling summary
+        self.conversation_history = ConversationHistory(max_tokens=history_tokens, summarizer=history_summarizer)
         # print(f"Prompt Template: {self.system_prompt}")
         self.prompt_template = (
             f"{self.system_prompt}\n"
@@ -53,15 +61,23 @@ class OrchestratorAgent(Agent):
             "Current input: {input}\n"
         )
         self.parser = parser
+        self.writer_reserve = writer_reserve # Share of a request's remaining time kept for the Writer when a deadline is set
+        # Local planner for the common single-ticker requests (see modules/router.py); None always asks the LLM for the plan
+        if intent_router is None and fast_path:
+            intent_router = IntentRouter([agent.name for agent in self.agents])
+        self.intent_router = intent_router
+        # Plans the LLM made before, reused for the same kind of question about other tickers or dates (see modules/router.py)
+        self.plan_cache = plan_cache if plan_cache is not None else (PlanTemplateCache() if cache_plans else None)
         self.initialize_client()
 
-    def remember(self, message):
-        self.conversation_history.append(message)
-        if len(self.conversation_history) > self.max_history_length:
-            self.conversation_history.pop(0)
+    def remember(self, message, session=None):
+        # With a session, the message goes to that session's own history instead of the shared default one
+        history = session.history if session is not None else self.conversation_history
+        history.append(message)
     
-    def generate_response(self, input_prompt):
-        history_text = "\n".join(self.conversation_history)
+    def generate_response(self, input_prompt, session=None):
+        history = session.history if session is not None else self.conversation_history
+        history_text = history.render() # Cached, only rebuilt when older turns get summarized
         #print("Conversation History: ")
         #print(history_text)
         response = ""
@@ -72,27 +88,14 @@ class OrchestratorAgent(Agent):
         if self.debug==1:
             print(f"Orchestrator Prompt: {prompt}")
         try:
-            #For GPT models
-            if "gpt" in self.model.lower(): 
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    #messages=input_prompt,
-                    messages=[
-                        {"role": "system", "content": prompt}
-                    ],
-                    max_tokens=300,
-                    temperature=0.7
-                )
-                result = response.choices[0].message.content
-            #For Gemini models
-            elif "gemini" in self.model.lower():
-                response = self.client.models.generate_content(
-                    model=self.model, contents=str(input_prompt)
-                )
-                result = response.text
-            self.remember(f"User: {input_prompt}")
-            self.remember(f"{self.name}: {response}")
+            # The whole prompt (instructions, history and input) goes as one system message, hedged across providers
+            model, max_tokens = self.model_for_task("plan")
+            result = routed_complete(model, [{"role": "system", "content": prompt}], max_tokens=max_tokens)
+            self.remember(f"User: {input_prompt}", session)
+            self.remember(f"{self.name}: {result}", session)
             return result
+        except DeadlineExceeded:
+            raise # Out of time: reAct falls back to partial results instead of a mock answer
         except Exception as e:
             if self.debug==1:
                 print(f" API failed for {self.name} using model '{self.model}': {e}")
@@ -100,16 +103,38 @@ class OrchestratorAgent(Agent):
         return response
     
 
-    def get_specialist_opinion(self, agentName, user_input):
-        '''Agent Orchestrator can call other agents to get their opinion on specific user inputs.'''
-        MyAgentsTeam = {MyMarketResearcher, MyNewsResearcher, MyWriter}
+    def get_specialist_opinion(self, agentName, user_input, deadline=None):
+        '''Agent Orchestrator can call other agents to get their opinion on specific user inputs.
+            With a deadline, the agent's tool and LLM calls only get the time left in it.
+        '''
         for agent in self.agents:
             if agent.name == agentName:
-                return agent.processUserInput(user_input)
+                if deadline is None:
+                    return agent.processUserInput(user_input)
+                deadline.check(agentName)
+                with deadline_scope(deadline):
+                    return agent.processUserInput(user_input)
         return f"Agent {agentName} not found."
+
+    def specialist_deadline(self, deadline, pending_agents):
+        '''Splits what's left of the request time between the pending specialists, keeping a share for the Writer.'''
+        if deadline is None or deadline.remaining() is None:
+            return deadline
+        return deadline.child(deadline.remaining() * (1 - self.writer_reserve) / max(1, pending_agents))
+
+    def partial_answer(self, content_for_writer):
+        '''Answer built from whatever the specialists returned, when there's no time left for the Writer.'''
+        return "I couldn't complete the full analysis in time. Here is what I gathered so far:\n\n" + content_for_writer
         
     
-    def reAct(self, user_input:str)-> str:
+    def reAct(self, user_input:str, session=None, on_event=None, deadline=None)-> str:
+        # session: optional per-user state (see modules/sessions.py); without it the shared default history is used
+        # on_event: optional callback(event_name, data) to follow the progress of the request (e.g. for streaming)
+        # deadline: optional Deadline (modules/deadline.py) for the whole request; every layer below gets what's left of it
+        deadline = deadline if deadline is not None else current_deadline()
+        if deadline is not None and current_deadline() is not deadline:
+            with deadline_scope(deadline): # So the LLM call for the plan (and anything else below) sees the deadline
+                return self.reAct(user_input, session=session, on_event=on_event, deadline=deadline)
         # Here is the the logic to parse the response for Agents usage
         # and store the results.
         parsed_response = ""
@@ -119,8 +144,23 @@ class OrchestratorAgent(Agent):
         #We also initialize the content variable we'll pass to the writer
         content_for_writer = f'Current user prompt: {user_input}'
         if self.parser and self.agents:
-            response = self.generate_response(user_input)
-            parsed_response = self.parser.parse_all(response) ## parsed response is a dict {"InvokeTool": "tool_name", "parameters": {...}} or {"FinalAnswer": "answer"} or {"RequestMoreInfo": "info"}
+            # Fast path: predictable requests (one ticker, a clear intent) are planned locally, without the LLM round trip
+            parsed_response = self.intent_router.route(user_input) if self.intent_router is not None else None
+            if parsed_response is None and self.plan_cache is not None:
+                parsed_response = self.plan_cache.get(user_input) # Same kind of question planned before
+            if parsed_response is not None:
+                response = ""
+                self.remember(f"User: {user_input}", session)
+            else:
+                try:
+                    response = self.generate_response(user_input, session=session)
+                except DeadlineExceeded:
+                    return "I'm sorry, I couldn't answer your question in time. Please try again."
+                parsed_response = self.parser.parse_all(response) ## parsed response is a dict {"InvokeTool": "tool_name", "parameters": {...}} or {"FinalAnswer": "answer"} or {"RequestMoreInfo": "info"}
+                if self.intent_router is not None:
+                    self.intent_router.log_plan(user_input, parsed_response) # Every LLM plan is a training example for the fast path
+                if self.plan_cache is not None:
+                    self.plan_cache.put(user_input, parsed_response)
             if self.debug==1:
                 print("*" * 50)
                 print(f'Raw actions from Orchestrator: {response}')
@@ -128,9 +168,9 @@ class OrchestratorAgent(Agent):
                 print("*" * 50)
                 print(f'Actions list from Orchestrator: {parsed_response}')
                 print("*" * 50)
-            system_message = f"System: {response}"
-            self.remember(system_message)
-            self.conversation_history.append(system_message)
+            # The plan itself was already remembered by generate_response, so we don't store it a second time
+            if on_event:
+                on_event("plan", parsed_response)
             '''
             parsed_response= {
             "action": "InvokeTool",
@@ -141,36 +181,51 @@ class OrchestratorAgent(Agent):
             }
             '''
             # Next, we'll loop through all the actions in the plan to execute one at a time.
+            pending_agents = sum(1 for plan_item in parsed_response if plan_item.get("action") == "SpecializedAgent")
             for plan_item in parsed_response:
                 action = plan_item.get("action")
                 if self.debug==1:
                     print(f"Orchestrator Action: {action}")
                 if action == "SpecializedAgent":
+                    if deadline is not None and deadline.expired():
+                        break # Out of time: the Writer (or the partial answer) works with what we have
                     agent_name = plan_item["parameters"].get("agentName")
                     user_input_for_agent = plan_item["parameters"].get("user_input")
                     if self.debug==1:
                         print("-" * 50)
                         print(f'Orchestrator calling {agent_name} with prompt "{user_input_for_agent}"')
                         print("-" * 50)
-                    agent_response = self.get_specialist_opinion(agent_name, user_input_for_agent)
+                    try:
+                        agent_response = self.get_specialist_opinion(agent_name, user_input_for_agent, deadline=self.specialist_deadline(deadline, pending_agents))
+                    except DeadlineExceeded:
+                        agent_response = "No answer within the time limit."
+                    pending_agents -= 1
                     temp_agent_response = f"Agent {agent_name} Response: {agent_response}"
-                    self.remember(temp_agent_response)
-                    self.conversation_history.append(temp_agent_response)
+                    self.remember(temp_agent_response, session)
                     content_for_writer += f'\n\n{temp_agent_response}'
+                    if on_event:
+                        on_event("agent_response", {"agent": agent_name, "response": agent_response})
                     # Generate a new response based on the agent result
                     #response = self.generate_response(f"Agent {agent_name} Response: {agent_response}")
                     #parsed_response = self.parser.parse(response)   
                     temp_agent_response_count += 1
                 elif action == "FinalAnswer" or action == "RequestMoreInfo" or action == "NeedApproval":
                     print(f"Orchestrator Final Response: {response}")
-                    return parsed_response.get("content")
+                    return plan_item["parameters"].get("content", response) # Without any tags, the raw response is the answer
                 elif action == "Thought":
                     continue
                 else:
                     return f"I'm not sure how to proceed. Could you please clarify? - selected action: {action}"
             #Once the loop of actions is completed, we'll pass the information gathered by all research agents down to our writer
             #user_input_for_agent = 
-            response = self.get_specialist_opinion('Writer', content_for_writer)
+            if on_event:
+                on_event("writing", {"agent_responses": temp_agent_response_count})
+            if deadline is not None and deadline.expired():
+                return self.partial_answer(content_for_writer)
+            try:
+                response = self.get_specialist_opinion('Writer', content_for_writer, deadline=deadline)
+            except DeadlineExceeded:
+                return self.partial_answer(content_for_writer)
         else:
             parsed_response = "Error: no parser or sub agents found!"
             print('Parser:')
@@ -0,0 +1,100 @@
+import time
+import queue
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from modules.llm import batch_complete
+from modules.deadline import DeadlineExceeded, call_timeout
+
+
+# Micro-batching queue in front of the LLM backends, for background work (watchlist refreshes, bulk summaries).
+# Prompts submitted within a short window go out together (see batch_complete in modules/llm.py), so a refresh
+# of N symbols costs a few batched round trips instead of N serial ones. Callers get a Future for their answer.
+class LLMBatcher:
+    def __init__(self, model, window=0.05, max_batch=16, max_in_flight=4, dispatch=None):
+        self.model = model
+        self.window = window # Seconds to wait for more prompts after the first one of a batch
+        self.max_batch = max_batch # Prompts per batch
+        self.dispatch = dispatch or batch_complete # Callable(model, batch, max_tokens, temperature, contexts) -> results
+        self.queue = queue.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="llm-batcher") # Batches in flight at once
+        self.thread = None
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "batches": 0, "largest_batch": 0}
+
+    def _start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._collect, name=f"llm-batcher-{self.model}", daemon=True)
+                self.thread.start()
+
+    def submit(self, messages, max_tokens=300, temperature=0.7):
+        '''Queues one chat request; returns a Future with the response text.'''
+        self._start()
+        future = Future()
+        self.queue.put((messages, max_tokens, temperature, contextvars.copy_context(), future))
+        return future
+
+    def complete(self, messages, max_tokens=300, temperature=0.7):
+        '''Queues one request and waits for its answer (within the current deadline, if any).'''
+        return self.result(self.submit(messages, max_tokens, temperature))
+
+    def complete_many(self, batch, max_tokens=300, temperature=0.7):
+        '''Queues several requests at once; returns their texts in order (errors are raised).'''
+        futures = [self.submit(messages, max_tokens, temperature) for messages in batch]
+        return [self.result(future) for future in futures]
+
+    def result(self, future):
+        try:
+            return future.result(timeout=call_timeout(None, "LLM call"))
+        except FutureTimeout:
+            raise DeadlineExceeded("LLM call ran out of time waiting for its batch")
+
+    def _collect(self):
+        while True:
+            batch = [self.queue.get()]
+            closes_at = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = closes_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.executor.submit(self._send, batch) # Collecting the next batch goes on while this one is in flight
+
+    def _send(self, batch):
+        with self.lock:
+            self.stats["requests"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+        groups = {} # Requests can only share a provider call when their generation settings match
+        for item in batch:
+            groups.setdefault((item[1], item[2]), []).append(item)
+        for (max_tokens, temperature), items in groups.items():
+            try:
+                results = self.dispatch(self.model, [item[0] for item in items], max_tokens, temperature, [item[3] for item in items])
+            except Exception as e:
+                results = [e] * len(items)
+            for item, result in zip(items, results):
+                if isinstance(result, Exception):
+                    item[4].set_exception(result)
+                else:
+                    item[4].set_result(result)
+
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+def get_batcher(model, **settings):
+    '''Returns the shared LLMBatcher of a model, created on first use.'''
+    with _batchers_lock:
+        if model not in _batchers:
+            _batchers[model] = LLMBatcher(model, **settings)
+        return _batchers[model]
+
+def batcher_stats():
+    with _batchers_lock:
+        return {model: dict(batcher.stats) for model, batcher in _batchers.items()}
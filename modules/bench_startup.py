@@ -0,0 +1,40 @@
+import sys
+import json
+import argparse
+import subprocess
+
+# Packages that must not be loaded just by importing the agents: they're only needed once a request uses them
+HEAVY_MODULES = ['openai', 'google.genai', 'yfinance', 'pandas', 'nltk', 'finnhub', 'requests', 'numpy']
+
+# Runs in a fresh interpreter, so we measure a real cold start
+PROBE = '''
+import sys, time, json
+start = time.perf_counter()
+import modules.agent
+imported = time.perf_counter() - start
+print(json.dumps({"seconds": imported, "loaded": [m for m in %r if m in sys.modules]}))
+'''
+
+def measure_startup(runs=5):
+    '''Imports the agents in `runs` fresh interpreters; returns the best time and the heavy modules that got loaded.'''
+    best = None
+    loaded = set()
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', PROBE % HEAVY_MODULES], capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        best = result['seconds'] if best is None else min(best, result['seconds'])
+        loaded.update(result['loaded'])
+    return {'seconds': round(best, 4), 'heavy_modules_loaded': sorted(loaded)}
+
+
+if __name__ == '__main__':
+    # Startup guard: python -m modules.bench_startup --max-seconds 0.5 (exits with 1 when startup regressed)
+    arg_parser = argparse.ArgumentParser(description='Measure the cold import time of the agents.')
+    arg_parser.add_argument('--runs', type=int, default=5)
+    arg_parser.add_argument('--max-seconds', type=float, default=0.5, help='Fail when importing the agents takes longer')
+    args = arg_parser.parse_args()
+    result = measure_startup(args.runs)
+    print(json.dumps(result, indent=2))
+    if result['seconds'] > args.max_seconds or result['heavy_modules_loaded']:
+        print("Startup budget exceeded." if result['seconds'] > args.max_seconds else "Heavy modules loaded at import time.")
+        sys.exit(1)
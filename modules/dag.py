@@ -0,0 +1,161 @@
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, Future, FIRST_COMPLETED, wait
+
+
+class Step:
+    '''One node of a research DAG.
+
+    Args:
+        name: Unique step name (the steps it depends on are listed by name)
+        func: Callable(inputs) -> result, where inputs is {dependency name: dependency result}
+        depends_on: Names of the steps whose results this step needs
+        cached: Optional callable() -> result or None; a result means the step is fresh already and isn't run
+    '''
+    def __init__(self, name, func, depends_on=(), cached=None):
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+        self.cached = cached
+
+
+class SharedFetches:
+    '''Single-flight memo of data fetches for one DAG run: the first caller of a fetch does it,
+    concurrent and later callers with the same arguments get the same result.'''
+    def __init__(self):
+        self.futures = {} # (method name, args) -> Future
+        self.lock = threading.Lock()
+        self.calls = 0 # Fetches actually made
+        self.shared = 0 # Fetches answered from another step's call
+
+    def call(self, key, func, *args, **kwargs):
+        with self.lock:
+            future = self.futures.get(key)
+            owner = future is None
+            if owner:
+                future = self.futures[key] = Future()
+                self.calls += 1
+            else:
+                self.shared += 1
+        if owner:
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+    def wrap(self, source):
+        '''Returns a proxy of `source` (e.g. a DataAcquisition) whose method calls go through this memo.'''
+        return _SharedFetchProxy(source, self)
+
+
+class _SharedFetchProxy:
+    def __init__(self, source, fetches):
+        self._source = source
+        self._fetches = fetches
+
+    def __getattr__(self, name):
+        attribute = getattr(self._source, name)
+        if not callable(attribute):
+            return attribute
+        def shared_call(*args, **kwargs):
+            key = (name, args, tuple(sorted(kwargs.items())))
+            return self._fetches.call(key, attribute, *args, **kwargs)
+        return shared_call
+
+
+class DAGExecutor:
+    '''Runs steps as soon as their dependencies are done, independent steps in parallel.
+
+    A step that fails gets None as its result and its error is reported; the steps depending on it still run
+    with that None (the same way our analyzers return None when data is missing). With independent steps
+    running in parallel, a plan takes about as long as its critical path.
+    '''
+    def __init__(self, max_workers=8):
+        self.max_workers = max_workers
+
+    def validate(self, steps):
+        '''Checks that dependencies exist and that there are no cycles; returns the steps in a topological order.'''
+        by_name = {step.name: step for step in steps}
+        if len(by_name) != len(steps):
+            raise ValueError("Duplicate step names in the DAG")
+        for step in steps:
+            missing = [name for name in step.depends_on if name not in by_name]
+            if missing:
+                raise ValueError(f"Step '{step.name}' depends on unknown steps {missing}")
+        order, state = [], {} # state: 1 while visiting, 2 once done
+        def visit(step):
+            if state.get(step.name) == 2:
+                return
+            if state.get(step.name) == 1:
+                raise ValueError(f"Cycle in the DAG at step '{step.name}'")
+            state[step.name] = 1
+            for name in step.depends_on:
+                visit(by_name[name])
+            state[step.name] = 2
+            order.append(step)
+        for step in steps:
+            visit(step)
+        return order
+
+    def run(self, steps):
+        '''Runs the DAG; returns {'results', 'errors', 'skipped', 'timings', 'elapsed', 'critical_path'}.'''
+        order = self.validate(steps)
+        by_name = {step.name: step for step in order}
+        dependents = {step.name: [] for step in order}
+        for step in order:
+            for name in step.depends_on:
+                dependents[name].append(step.name)
+        waiting = {step.name: len(step.depends_on) for step in order}
+        results, errors, timings, skipped = {}, {}, {}, []
+        start = time.monotonic()
+
+        def execute(step):
+            step_start = time.monotonic()
+            if step.cached is not None:
+                cached = step.cached()
+                if cached is not None: # Fresh enough already: reuse instead of running the step
+                    return cached, True, time.monotonic() - step_start
+            inputs = {name: results.get(name) for name in step.depends_on}
+            return step.func(inputs), False, time.monotonic() - step_start
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="dag-step") as executor:
+            running = {}
+            def submit(name):
+                # Each step runs in a copy of the caller's context, so the request deadline (if any) still applies
+                running[executor.submit(contextvars.copy_context().run, execute, by_name[name])] = name
+            for name, count in waiting.items():
+                if count == 0:
+                    submit(name)
+            while running:
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name], was_cached, timings[name] = future.result()
+                        if was_cached:
+                            skipped.append(name)
+                    except Exception as e:
+                        results[name] = None
+                        errors[name] = str(e)
+                        timings[name] = None
+                    for dependent in dependents[name]: # Steps depending on a failed one still run, with None as its result
+                        waiting[dependent] -= 1
+                        if waiting[dependent] == 0:
+                            submit(dependent)
+        return {
+            'results': results,
+            'errors': errors,
+            'skipped': skipped,
+            'timings': timings,
+            'elapsed': time.monotonic() - start,
+            'critical_path': self.critical_path(order, timings),
+        }
+
+    def critical_path(self, order, timings):
+        '''Longest chain of step durations through the DAG: the lower bound of the run time.'''
+        longest = {}
+        for step in order:
+            longest[step.name] = (timings.get(step.name) or 0.0) + max((longest[name] for name in step.depends_on), default=0.0)
+        return max(longest.values(), default=0.0)
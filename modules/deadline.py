@@ -0,0 +1,81 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+
+class DeadlineExceeded(Exception):
+    '''Raised when a request ran out of time (or was cancelled) before a call could start or finish.'''
+
+
+# Time budget of one user request. It's handed down from the orchestrator to specialists, tools and LLM calls,
+# each of which only gets what's left of it, and it can be cancelled when the client gives up.
+class Deadline:
+    def __init__(self, timeout=None, parent=None):
+        now = time.monotonic()
+        self.expires_at = now + timeout if timeout is not None else None # None means no time limit
+        self.parent = parent
+        if parent is not None and parent.expires_at is not None:
+            self.expires_at = parent.expires_at if self.expires_at is None else min(self.expires_at, parent.expires_at)
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set() or (self.parent is not None and self.parent.cancelled)
+
+    def remaining(self):
+        '''Seconds left, or None without a time limit.'''
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.cancelled or self.remaining() == 0.0
+
+    def check(self, what="request"):
+        if self.cancelled:
+            raise DeadlineExceeded(f"{what} cancelled")
+        if self.remaining() == 0.0:
+            raise DeadlineExceeded(f"{what} ran out of time")
+
+    def timeout(self, default=None, what="request"):
+        '''Timeout to use for a blocking call: the default, capped by the time left. Raises when nothing is left.'''
+        self.check(what)
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        return remaining if default is None else min(default, remaining)
+
+    def sleep(self, seconds):
+        '''time.sleep that wakes up as soon as this deadline is cancelled (then raises DeadlineExceeded).'''
+        if self._cancelled.wait(seconds):
+            raise DeadlineExceeded("call cancelled")
+        self.check()
+
+    def child(self, timeout=None):
+        '''A deadline for a sub-task: at most `timeout` seconds, never beyond this one, cancelled with it.'''
+        return Deadline(timeout, parent=self)
+
+
+# The deadline of the request being processed, so tools and LLM calls can find it without extra parameters
+_current_deadline = contextvars.ContextVar('deadline', default=None)
+
+def current_deadline():
+    return _current_deadline.get()
+
+@contextmanager
+def deadline_scope(deadline):
+    '''Makes `deadline` the current deadline inside the with block (None keeps the calls unbounded).'''
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+def call_timeout(default=None, what="request"):
+    '''Timeout for a blocking call under the current deadline (the default when there's no deadline).'''
+    deadline = current_deadline()
+    return deadline.timeout(default, what) if deadline is not None else default
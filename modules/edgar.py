@@ -0,0 +1,251 @@
+import os
+import json
+import zipfile
+
+import numpy as np
+
+# One array per column, saved as <column>.npy and memory-mapped on load. Rows are sorted by (cik, concept, end, filed),
+# so a company's facts are one contiguous slice and a concept inside it another one, both found by binary search.
+FACT_COLUMNS = {
+    'cik': '<i8',
+    'concept': '<i4',     # Position in meta['concepts'] ("us-gaap:Revenues", ...)
+    'unit': '<i2',        # Position in meta['units'] ("USD", "shares", "USD/shares", ...)
+    'start': '<M8[D]',    # Start of the period (NaT for balance sheet items, which are measured at one date)
+    'end': '<M8[D]',      # End of the period, or the date of the measurement
+    'value': '<f8',
+    'fy': '<i2',          # Fiscal year of the filing the fact comes from (0 when missing)
+    'fp': '<i1',          # Position in meta['periods'] ("FY", "Q1", ...)
+    'form': '<i2',        # Position in meta['forms'] ("10-K", "10-Q", ...)
+    'filed': '<M8[D]',
+}
+TAXONOMIES = ('us-gaap', 'dei', 'ifrs-full')
+ANNUAL_FORMS = ('10-K', '10-K/A', '20-F', '20-F/A', '40-F', '40-F/A')
+
+# Statement lines of yfinance (the names our analyzers use) and the us-gaap concepts that report them, by preference
+STATEMENT_CONCEPTS = {
+    'income': {
+        'TotalRevenue': ['Revenues', 'RevenueFromContractWithCustomerExcludingAssessedTax', 'SalesRevenueNet'],
+        'CostOfRevenue': ['CostOfRevenue', 'CostOfGoodsAndServicesSold'],
+        'GrossProfit': ['GrossProfit'],
+        'OperatingIncome': ['OperatingIncomeLoss'],
+        'NetIncome': ['NetIncomeLoss'],
+        'DilutedEPS': ['EarningsPerShareDiluted'],
+    },
+    'balance': {
+        'TotalAssets': ['Assets'],
+        'TotalLiabilities': ['Liabilities'],
+        'StockholdersEquity': ['StockholdersEquity'],
+        'CurrentAssets': ['AssetsCurrent'],
+        'CurrentLiabilities': ['LiabilitiesCurrent'],
+        'CashAndCashEquivalents': ['CashAndCashEquivalentsAtCarryingValue'],
+    },
+    'cash': {
+        'OperatingCashFlow': ['NetCashProvidedByUsedInOperatingActivities'],
+        'CapitalExpenditure': ['PaymentsToAcquirePropertyPlantAndEquipment'],
+    },
+}
+
+
+class CompanyFactsStore:
+    '''Offline store of SEC EDGAR company facts, built from the bulk companyfacts dump.
+
+    ingest() reads companyfacts.zip (or a folder of its CIK##########.json files) once into a columnar
+    store on disk; lookups then read memory-mapped columns, without any network call. Companies can be
+    asked for by ticker (with the SEC's company_tickers.json) or by CIK.
+    '''
+    def __init__(self, store_dir='edgar_store'):
+        self.store_dir = store_dir # Folder holding one .npy file per column and meta.json
+        self.columns = {}
+        self.meta = {'concepts': [], 'units': [], 'periods': [], 'forms': [], 'tickers': {}, 'names': {}}
+        self.load()
+
+    def load(self):
+        '''Maps the columns of an ingested store (nothing happens when there's none yet).'''
+        try:
+            with open(os.path.join(self.store_dir, 'meta.json')) as f:
+                self.meta = json.load(f)
+            self.columns = {column: np.load(os.path.join(self.store_dir, f"{column}.npy"), mmap_mode='r') for column in FACT_COLUMNS}
+        except (OSError, ValueError):
+            self.columns = {}
+        self.concept_ids = {concept: i for i, concept in enumerate(self.meta['concepts'])}
+        self.unit_ids = {unit: i for i, unit in enumerate(self.meta['units'])}
+        self.form_ids = {form: i for i, form in enumerate(self.meta['forms'])}
+
+    def __len__(self):
+        return len(self.columns['cik']) if self.columns else 0
+
+    def ingest(self, source, tickers_file=None, taxonomies=TAXONOMIES):
+        '''Builds the store from companyfacts.zip or a folder of company facts JSON files; returns the number of facts.
+
+        Args:
+            source: Path of companyfacts.zip or of the folder it was extracted to
+            tickers_file: Optional path of company_tickers.json, to look companies up by ticker
+            taxonomies: Fact taxonomies to keep
+        '''
+        lookups = {name: {} for name in ('concepts', 'units', 'periods', 'forms')}
+        def code(name, value):
+            return lookups[name].setdefault(value, len(lookups[name]))
+        chunks, names = [], {}
+        for document in self._documents(source):
+            cik = int(document.get('cik') or 0)
+            names[str(cik)] = document.get('entityName')
+            columns = {column: [] for column in FACT_COLUMNS if column != 'cik'}
+            for taxonomy, concepts in (document.get('facts') or {}).items():
+                if taxonomy not in taxonomies:
+                    continue
+                for concept, fact in concepts.items():
+                    concept_id = code('concepts', f"{taxonomy}:{concept}")
+                    for unit, records in (fact.get('units') or {}).items():
+                        unit_id = code('units', unit)
+                        for record in records:
+                            columns['concept'].append(concept_id)
+                            columns['unit'].append(unit_id)
+                            columns['start'].append(record.get('start'))
+                            columns['end'].append(record.get('end'))
+                            columns['value'].append(record.get('val'))
+                            columns['fy'].append(record.get('fy') or 0)
+                            columns['fp'].append(code('periods', record.get('fp') or ''))
+                            columns['form'].append(code('forms', record.get('form') or ''))
+                            columns['filed'].append(record.get('filed'))
+            if columns['concept']:
+                # Dates are converted once per company, in bulk (missing ones become NaT)
+                chunk = np.empty(len(columns['concept']), dtype=list(FACT_COLUMNS.items()))
+                chunk['cik'] = cik
+                for column, values in columns.items():
+                    chunk[column] = np.array(values, dtype=FACT_COLUMNS[column] if column != 'value' else float)
+                chunks.append(chunk)
+        facts = np.concatenate(chunks) if chunks else np.empty(0, dtype=list(FACT_COLUMNS.items()))
+        facts = facts[np.lexsort((facts['filed'], facts['end'], facts['concept'], facts['cik']))]
+        tickers = {}
+        if tickers_file:
+            with open(tickers_file) as f:
+                for company in json.load(f).values():
+                    tickers[company['ticker'].upper()] = int(company['cik_str'])
+        os.makedirs(self.store_dir, exist_ok=True)
+        for column in FACT_COLUMNS:
+            np.save(os.path.join(self.store_dir, f"{column}.npy"), np.ascontiguousarray(facts[column]))
+        self.columns = {} # Drop the old maps before the files are replaced
+        meta = {name: sorted(values, key=values.get) for name, values in lookups.items()}
+        meta.update({'tickers': tickers, 'names': names})
+        with open(os.path.join(self.store_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        self.load()
+        return len(facts)
+
+    def _documents(self, source):
+        # Company facts documents, one at a time, from the zip dump or from an extracted folder
+        if zipfile.is_zipfile(source):
+            with zipfile.ZipFile(source) as archive:
+                for name in archive.namelist():
+                    if name.endswith('.json'):
+                        with archive.open(name) as f:
+                            yield json.load(f)
+        else:
+            for name in sorted(os.listdir(source)):
+                if name.endswith('.json'):
+                    with open(os.path.join(source, name)) as f:
+                        yield json.load(f)
+
+    def cik_for(self, company):
+        '''CIK of a ticker (or of a CIK given as a number or a string), None when unknown.'''
+        if isinstance(company, (int, np.integer)) or str(company).isdigit():
+            return int(company)
+        return self.meta['tickers'].get(str(company).upper())
+
+    def _concept_id(self, concept):
+        if ':' in concept:
+            return self.concept_ids.get(concept)
+        return next((self.concept_ids[f"{taxonomy}:{concept}"] for taxonomy in TAXONOMIES if f"{taxonomy}:{concept}" in self.concept_ids), None)
+
+    def _rows(self, company, concept):
+        # The slice of rows of one company and concept: two binary searches on the sorted columns
+        cik, concept_id = self.cik_for(company), self._concept_id(concept)
+        if not self.columns or cik is None or concept_id is None:
+            return slice(0, 0)
+        ciks = self.columns['cik']
+        first, last = np.searchsorted(ciks, cik, 'left'), np.searchsorted(ciks, cik, 'right')
+        concepts = self.columns['concept'][first:last]
+        return slice(first + np.searchsorted(concepts, concept_id, 'left'), first + np.searchsorted(concepts, concept_id, 'right'))
+
+    def facts(self, company, concept, unit='USD', annual=None):
+        '''Reported values of one concept for a company, one per period (the latest filing wins when restated).
+
+        Args:
+            company: Ticker or CIK
+            concept: Concept name, e.g. 'Revenues' or 'us-gaap:Revenues'
+            unit: Unit of the values ('USD', 'shares', 'USD/shares'...)
+            annual: True for fiscal years only (10-K style filings), False for quarters only, None for both
+        Returns a structured array with the FACT_COLUMNS fields, sorted by period end.
+        '''
+        if not self.columns: # Nothing ingested yet
+            return np.empty(0, dtype=list(FACT_COLUMNS.items()))
+        rows = self._rows(company, concept)
+        facts = np.empty(rows.stop - rows.start, dtype=list(FACT_COLUMNS.items()))
+        for column in FACT_COLUMNS:
+            facts[column] = self.columns[column][rows]
+        if unit is not None:
+            facts = facts[facts['unit'] == self.unit_ids.get(unit, -1)]
+        if annual is not None and len(facts):
+            duration = (facts['end'] - facts['start']).astype('int64')
+            instant = np.isnat(facts['start'])
+            annual_forms = np.isin(facts['form'], [self.form_ids[form] for form in ANNUAL_FORMS if form in self.form_ids])
+            if annual:
+                facts = facts[annual_forms & (instant | ((duration > 350) & (duration < 380)))]
+            else:
+                facts = facts[instant | ((duration > 80) & (duration < 100))]
+        if len(facts):
+            # Sorted by period and then filing date, the last row of each period is its latest filing
+            start = np.where(np.isnat(facts['start']), np.datetime64('1970-01-01', 'D'), facts['start'])
+            order = np.lexsort((facts['filed'], start, facts['end']))
+            facts, start = facts[order], start[order]
+            last = np.ones(len(facts), dtype=bool)
+            last[:-1] = (facts['end'][1:] != facts['end'][:-1]) | (start[1:] != start[:-1])
+            facts = facts[last]
+        return facts
+
+    def latest(self, company, concept, unit='USD', annual=True):
+        '''Latest reported value of a concept for a company, or None.'''
+        facts = self.facts(company, concept, unit=unit, annual=annual)
+        return float(facts['value'][-1]) if len(facts) else None
+
+    def cross_section(self, concept, fiscal_year=None, unit='USD', annual=True):
+        '''One value per company for a concept: the fiscal year's value (or the latest one), as {CIK: value}.
+
+        Vectorized over the whole store, so market-wide questions ("revenue of every filer in 2022") stay local and fast.
+        '''
+        concept_id = self._concept_id(concept)
+        if not self.columns or concept_id is None:
+            return {}
+        selected = np.flatnonzero((np.asarray(self.columns['concept']) == concept_id) & (np.asarray(self.columns['unit']) == self.unit_ids.get(unit, -1)))
+        start, end = self.columns['start'][selected], self.columns['end'][selected]
+        if annual:
+            duration = (end - start).astype('int64')
+            keep = np.isnat(start) | ((duration > 350) & (duration < 380))
+            selected, end = selected[keep], end[keep]
+        if fiscal_year is not None:
+            keep = end.astype('datetime64[Y]').astype(int) + 1970 == fiscal_year # Fiscal years named after the calendar year they end in
+            selected = selected[keep]
+        if not len(selected):
+            return {}
+        ciks = self.columns['cik'][selected]
+        last = np.ones(len(selected), dtype=bool) # Rows are sorted by (cik, end, filed): the last row of each company is its latest value
+        last[:-1] = ciks[1:] != ciks[:-1]
+        return dict(zip(ciks[last].tolist(), self.columns['value'][selected[last]].tolist()))
+
+    def statement(self, company, statement_type='income', period='annual'):
+        '''A financial statement shaped like yfinance's (line items x period ends, newest first), or None.'''
+        if not self.columns:
+            return None
+        import pandas as pd
+        lines = {}
+        for line, concepts in STATEMENT_CONCEPTS.get(statement_type, {}).items():
+            unit = 'USD/shares' if line.endswith('EPS') else 'USD'
+            for concept in concepts:
+                facts = self.facts(company, concept, unit=unit, annual=period == 'annual')
+                if len(facts):
+                    lines[line] = pd.Series(facts['value'], index=pd.DatetimeIndex(facts['end']))
+                    break
+        if not lines:
+            return None
+        frame = pd.DataFrame(lines).T
+        return frame[sorted(frame.columns, reverse=True)]
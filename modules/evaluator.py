@@ -0,0 +1,163 @@
+import re
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from modules.deadline import Deadline, DeadlineExceeded, current_deadline, deadline_scope
+
+
+POSITIVE_OPENERS = ("great question", "excellent question", "good question", "fantastic question", "that's a great", "what a great")
+RECOMMENDATION_WORDS = ("should i", "recommend", "buy", "sell", "invest", "hold")
+
+
+def key_facts(content, limit=40):
+    '''Facts a good report should carry over from the agents' material: numbers (prices, percentages) and tickers.'''
+    facts = re.findall(r"\b\d+(?:\.\d+)?%?|\b[A-Z]{2,5}\b", content)
+    return list(dict.fromkeys(facts))[:limit]
+
+
+def score_report(draft, content):
+    '''Cheap local evaluator of a Writer draft against the Writer's own guidelines and the source material.
+
+    Returns (score between 0 and 1, list of feedback sentences for the refinement).
+    '''
+    if not draft or draft.startswith("Mock response from"):
+        return 0.0, ["The report is missing."]
+    text = draft.strip()
+    lowered = text.lower()
+    checks, feedback = [], []
+
+    paragraphs = [p for p in re.split(r"\n\s*\n", text) if p.strip()]
+    checks.append(1.0 if 2 <= len(paragraphs) <= 3 else 0.5 if len(paragraphs) in (1, 4) else 0.0)
+    if checks[-1] < 1.0:
+        feedback.append(f"Write 2-3 paragraphs (the draft has {len(paragraphs)}).")
+
+    checks.append(1.0 if lowered.startswith(POSITIVE_OPENERS) else 0.0)
+    if checks[-1] < 1.0:
+        feedback.append("Start with a positive opener such as 'Great question'.")
+
+    checks.append(0.0 if "data provided" in lowered else 1.0)
+    if checks[-1] < 1.0:
+        feedback.append("Don't refer to the material as 'the data provided'.")
+
+    facts = key_facts(content)
+    if facts:
+        covered = sum(1 for fact in facts if fact in text) / len(facts)
+        checks.append(min(1.0, covered * 2)) # Half of the facts is enough for a short report
+        if checks[-1] < 1.0:
+            feedback.append("Use more of the figures and tickers the agents reported: " + ", ".join(f for f in facts if f not in text)[:200])
+
+    question = content.split("\n", 1)[0].lower()
+    if any(word in question for word in RECOMMENDATION_WORDS):
+        checks.append(1.0 if ("pros" in lowered or "advantage" in lowered) and ("cons" in lowered or "risk" in lowered) else 0.0)
+        if checks[-1] < 1.0:
+            feedback.append("Give guidance with pros and cons (including the risks) rather than a bare recommendation.")
+
+    words = len(text.split())
+    checks.append(1.0 if 80 <= words <= 450 else 0.5)
+    if checks[-1] < 1.0:
+        feedback.append(f"Keep the report between 80 and 450 words (the draft has {words}).")
+
+    return sum(checks) / len(checks), feedback
+
+
+class EvaluatorOptimizer:
+    '''Generates several drafts in parallel, keeps the best one by score and refines it a bounded number of times.
+
+    Args:
+        generate: Callable(content) -> draft
+        refine: Callable(content, draft, feedback) -> improved draft
+        scorer: Callable(draft, content) -> (score, feedback); score_report by default
+        candidates: Drafts generated in parallel
+        max_refinements: Refinement rounds at most (each one is a serial LLM call)
+        threshold: Score at which we stop (early exit)
+        time_budget: Seconds for the whole stage (None: only the request deadline, if any, applies)
+
+    Drafts still running once we have a good enough one (or ran out of time) are cancelled through their deadline:
+    their LLM call gives up at its next deadline check, so a losing draft may still hold a provider connection
+    for a moment, but its result is never waited for.
+    '''
+    def __init__(self, generate, refine, scorer=None, candidates=3, max_refinements=1, threshold=0.85, time_budget=None):
+        self.generate = generate
+        self.refine = refine
+        self.scorer = scorer or score_report
+        self.candidates = candidates
+        self.max_refinements = max_refinements
+        self.threshold = threshold
+        self.time_budget = time_budget
+        self._local = threading.local() # One WriterAgent serves concurrent requests, so each thread keeps its own last run
+
+    @property
+    def last_run(self):
+        '''Scores and timings of the last run made by the calling thread, for debugging and metrics.'''
+        return getattr(self._local, 'run', {})
+
+    def run(self, content):
+        parent = current_deadline()
+        budget = Deadline(self.time_budget, parent=parent) if (self.time_budget is not None or parent is not None) else None
+        start = time.monotonic()
+        with deadline_scope(budget):
+            best, best_score, feedback, scores = self._best_draft(content, budget)
+            refinements = 0
+            while (best_score < self.threshold and refinements < self.max_refinements
+                   and not (budget is not None and budget.expired())):
+                try:
+                    candidate = self.refine(content, best, feedback)
+                except DeadlineExceeded:
+                    break # Out of time: the best draft so far is the answer
+                refinements += 1
+                score, candidate_feedback = self.scorer(candidate, content)
+                scores.append(score)
+                if score <= best_score:
+                    break # Refining didn't help; another round is unlikely to
+                best, best_score, feedback = candidate, score, candidate_feedback
+        self._local.run = {'scores': scores, 'best_score': best_score, 'refinements': refinements, 'elapsed': time.monotonic() - start}
+        return best
+
+    def _best_draft(self, content, budget):
+        if self.candidates <= 1:
+            draft = self.generate(content)
+            score, feedback = self.scorer(draft, content)
+            return draft, score, feedback, [score]
+        best, best_score, best_feedback, scores = None, -1.0, [], []
+        executor = ThreadPoolExecutor(max_workers=self.candidates, thread_name_prefix="writer-draft")
+        deadlines = {}
+        try:
+            # Every draft runs under its own child of the budget, so the losers can be cancelled one by one
+            for _ in range(self.candidates):
+                deadline = Deadline(parent=budget)
+                future = executor.submit(contextvars.copy_context().run, self._generate, deadline, content)
+                deadlines[future] = deadline
+            pending = set(deadlines)
+            while pending:
+                timeout = budget.remaining() if budget is not None else None
+                if timeout == 0:
+                    break # Out of time: we go with the best draft we have (if any)
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    break # The budget ran out while waiting
+                for future in done:
+                    try:
+                        draft = future.result()
+                    except DeadlineExceeded:
+                        continue
+                    score, feedback = self.scorer(draft, content)
+                    scores.append(score)
+                    if score > best_score:
+                        best, best_score, best_feedback = draft, score, feedback
+                if best_score >= self.threshold:
+                    break # Good enough: no need to wait for the other drafts
+            if best is None:
+                raise DeadlineExceeded("No draft finished in time")
+        finally:
+            for future, deadline in deadlines.items():
+                if not future.done():
+                    deadline.cancel() # A running draft gives up at its next deadline check
+                    future.cancel() # A draft still queued never starts
+            executor.shutdown(wait=False)
+        return best, best_score, best_feedback, scores
+
+    def _generate(self, deadline, content):
+        with deadline_scope(deadline):
+            return self.generate(content)
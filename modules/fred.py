@@ -0,0 +1,210 @@
+import os
+import csv
+import json
+import time
+
+import numpy as np
+
+from modules.deadline import call_timeout
+
+# Every observation is one fixed-size binary record, so a series' file can be memory-mapped and extended by appending
+OBSERVATION_DTYPE = np.dtype([
+    ('date', '<M8[D]'),
+    ('value', '<f8'),   # NaN where FRED has no value ('.')
+])
+
+DEFAULT_SERIES = ['GDP', 'UNRATE', 'CPIAUCSL', 'FEDFUNDS']
+
+# How each indicator is read: which measure decides the regime, the thresholds and the regime names from lowest to highest.
+# side='left' means a value must be above a threshold to move up ("> 3"), side='right' means at least at it ("< 4" stays below).
+INDICATOR_RULES = {
+    'GDP': {'measure': 'change', 'side': 'left', 'thresholds': [-1, 0, 1, 3],
+            'regimes': ['Significant contraction', 'Mild contraction', 'Slow growth', 'Moderate growth', 'Strong growth']},
+    'UNRATE': {'measure': 'current', 'side': 'right', 'thresholds': [4, 5, 6],
+               'regimes': ['Very low unemployment', 'Low unemployment', 'Moderate unemployment', 'High unemployment']},
+    'CPIAUCSL': {'measure': 'yoy_change', 'side': 'left', 'thresholds': [0, 1, 2, 4],
+                 'regimes': ['Deflation', 'Very low inflation', 'Low inflation', 'Moderate inflation', 'High inflation']},
+    'FEDFUNDS': {'measure': 'current', 'side': 'left', 'thresholds': [2, 4],
+                 'regimes': ['Accommodative monetary policy', 'Neutral monetary policy', 'Restrictive monetary policy']},
+}
+
+
+def fredgraph_fetcher(series_id, start=None):
+    '''Default fetcher: downloads a series (from `start` on) as CSV from FRED's public graph endpoint.'''
+    import urllib.request
+    url = f"https://fred.stlouisfed.org/graph/fredgraph.csv?id={series_id}" + (f"&cosd={start}" if start is not None else "")
+    with urllib.request.urlopen(url, timeout=call_timeout(10, f"FRED {series_id}")) as response: # Less if the request deadline is closer
+        return parse_fred_csv(response.read().decode('utf-8').splitlines())
+
+
+def parse_fred_csv(lines):
+    '''Observations of a FRED CSV (a date column and a value column, '.' when missing) as a records array.'''
+    rows = list(csv.reader(lines))
+    rows = [row for row in rows[1:] if len(row) >= 2 and row[0]] # The first row is the header (DATE or observation_date, SERIES)
+    records = np.empty(len(rows), dtype=OBSERVATION_DTYPE)
+    records['date'] = np.array([row[0] for row in rows], dtype='M8[D]')
+    records['value'] = np.array([np.nan if row[1] in ('.', '') else float(row[1]) for row in rows])
+    return records
+
+
+class FredStore:
+    '''Local on-disk store of FRED series, one append-only memory-mapped file per series.
+
+    Series are loaded from CSV dumps (load_csv) or from FRED itself (update); both only append the
+    observations after the last stored date, so keeping the store current costs a few rows per series.
+    '''
+    def __init__(self, store_dir='fred_store', fetcher=None, refresh_hours=12, retry_minutes=15):
+        self.store_dir = store_dir # Folder holding one <SERIES>.bin (observations) and one <SERIES>.json (metadata) per series
+        self.fetcher = fetcher or fredgraph_fetcher # Function(series_id, start) returning an OBSERVATION_DTYPE array
+        self.refresh_hours = refresh_hours # Hours before update() asks FRED again for a series
+        self.retry_minutes = retry_minutes # Minutes before asking again after a failed update (e.g. when offline)
+        self._maps = {} # The folder is created on the first write, so just building a store leaves nothing behind
+
+    def _path(self, series_id, extension):
+        return os.path.join(self.store_dir, f"{series_id.upper()}.{extension}")
+
+    def _load_meta(self, series_id):
+        try:
+            with open(self._path(series_id, 'json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_meta(self, series_id, meta):
+        os.makedirs(self.store_dir, exist_ok=True)
+        with open(self._path(series_id, 'json'), 'w') as f:
+            json.dump(meta, f)
+
+    def observations(self, series_id):
+        '''Every stored observation of a series as a read-only memory-mapped records array.'''
+        series_id = series_id.upper()
+        if series_id not in self._maps:
+            path = self._path(series_id, 'bin')
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            if size == 0: # np.memmap can't map an empty file
+                self._maps[series_id] = np.empty(0, dtype=OBSERVATION_DTYPE)
+            else:
+                self._maps[series_id] = np.memmap(path, dtype=OBSERVATION_DTYPE, mode='r', shape=(size // OBSERVATION_DTYPE.itemsize,))
+        return self._maps[series_id]
+
+    def append(self, series_id, records):
+        '''Appends the observations newer than the last stored one; returns how many were added.'''
+        series_id = series_id.upper()
+        stored = self.observations(series_id)
+        if len(stored):
+            records = records[records['date'] > stored['date'][-1]]
+        records = np.sort(records, order='date')
+        if len(records):
+            self._maps.pop(series_id, None) # The old memory map no longer covers the whole file
+            os.makedirs(self.store_dir, exist_ok=True)
+            with open(self._path(series_id, 'bin'), 'ab') as f:
+                records.tofile(f)
+        return len(records)
+
+    def load_csv(self, path, series_id=None):
+        '''Loads a FRED CSV dump (series id from the header, or given); returns the number of new observations.'''
+        with open(path, newline='') as f:
+            lines = f.read().splitlines()
+        series_id = series_id or next(csv.reader(lines[:1]))[1]
+        return self.append(series_id, parse_fred_csv(lines))
+
+    def load_csv_dir(self, folder):
+        '''Loads every .csv of a folder of FRED dumps; returns {series id: new observations}.'''
+        loaded = {}
+        for name in sorted(os.listdir(folder)):
+            if name.lower().endswith('.csv'):
+                loaded[os.path.splitext(name)[0].upper()] = self.load_csv(os.path.join(folder, name), os.path.splitext(name)[0])
+        return loaded
+
+    def update(self, series_id, force=False):
+        '''Asks FRED for the observations after the last stored one, at most every refresh_hours.'''
+        series_id = series_id.upper()
+        meta = self._load_meta(series_id)
+        if not force and (time.time() - meta.get('checked_at', 0) < self.refresh_hours * 3600
+                          or time.time() - meta.get('failed_at', 0) < self.retry_minutes * 60):
+            return 0
+        stored = self.observations(series_id)
+        start = str(stored['date'][-1] + np.timedelta64(1, 'D')) if len(stored) else None
+        try:
+            added = self.append(series_id, self.fetcher(series_id, start))
+        except Exception as e:
+            print(f"Error updating FRED series {series_id}: {e}") # We keep answering from what's stored
+            meta['failed_at'] = time.time()
+            self._save_meta(series_id, meta)
+            return 0
+        meta['checked_at'] = time.time()
+        self._save_meta(series_id, meta)
+        return added
+
+    def frames(self, series_ids=None, last=None, refresh=False):
+        '''Stored series as {series id: DataFrame(date, value)}, like DataAcquisition.get_economic_indicators;
+            series with no observations are left out.'''
+        import pandas as pd
+        frames = {}
+        for series_id in series_ids or DEFAULT_SERIES:
+            if refresh:
+                self.update(series_id)
+            records = self.observations(series_id)
+            records = records[~np.isnan(records['value'])]
+            if last:
+                records = records[-last:]
+            if len(records):
+                frames[series_id] = pd.DataFrame({'date': pd.DatetimeIndex(records['date']), 'value': records['value']})
+        return frames
+
+
+def periods_per_year(dates):
+    # 4 for quarterly series, 12 for monthly ones... from the median spacing of the observations
+    if len(dates) < 2:
+        return 1
+    spacing = np.median(np.diff(np.asarray(dates, dtype='M8[D]')).astype('int64'))
+    return max(1, int(round(365.25 / max(spacing, 1))))
+
+
+def interpret_indicators(indicators, window=60):
+    '''Changes, z-scores and regimes of many indicators at once.
+
+    Args:
+        indicators: {series id: DataFrame with 'date' and 'value' columns}, oldest observation first
+        window: Observations kept per series (the z-score compares the latest value with them)
+    Returns {series id: {'date', 'current_value', 'previous_value', 'change', 'yoy_change', 'zscore', 'interpretation'}}.
+    '''
+    names = [name for name, data in indicators.items() if data is not None and not data.empty]
+    if not names:
+        return {}
+    # One row per series, right-aligned on the latest observation and NaN-padded at the front
+    values = np.full((len(names), window), np.nan)
+    lags = np.ones(len(names), dtype=int) # Observations in a year, per series
+    for row, name in enumerate(names):
+        series = indicators[name]['value'].to_numpy(dtype=float)[-window:]
+        values[row, window - len(series):] = series
+        lags[row] = periods_per_year(indicators[name]['date'].to_numpy()[-window:])
+    rows = np.arange(len(names))
+    current, previous = values[:, -1], values[:, -2]
+    year_ago = values[rows, np.maximum(window - 1 - lags, 0)]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change = (current / previous - 1) * 100
+        yoy_change = (current / year_ago - 1) * 100
+        zscore = (current - np.nanmean(values, axis=1)) / np.nanstd(values, axis=1)
+    measures = {'current': current, 'change': change, 'yoy_change': yoy_change}
+
+    analysis = {}
+    for row, name in enumerate(names):
+        rule = INDICATOR_RULES.get(name)
+        interpretation = ""
+        if rule is not None:
+            measure = measures[rule['measure']][row]
+            if np.isnan(measure) and rule['measure'] == 'yoy_change': # Less than a year of history
+                measure = change[row]
+            if not np.isnan(measure):
+                interpretation = rule['regimes'][np.searchsorted(rule['thresholds'], measure, side=rule['side'])]
+        analysis[name] = {
+            'date': str(indicators[name]['date'].iloc[-1])[:10],
+            'current_value': float(current[row]),
+            'previous_value': None if np.isnan(previous[row]) else float(previous[row]),
+            'change': None if np.isnan(change[row]) else float(change[row]),
+            'yoy_change': None if np.isnan(yoy_change[row]) else float(yoy_change[row]),
+            'zscore': None if not np.isfinite(zscore[row]) else float(zscore[row]),
+            'interpretation': interpretation,
+        }
+    return analysis
@@ -0,0 +1,129 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+# Statement lines used by the ratios, with the names yfinance has used for them over time
+LINE_ITEMS = {
+    'income': ['TotalRevenue', 'GrossProfit', 'OperatingIncome', 'NetIncome'],
+    'balance': ['TotalAssets', 'TotalLiabilities', 'StockholdersEquity', 'CurrentAssets', 'CurrentLiabilities'],
+}
+LINE_ALIASES = {
+    'TotalLiabilities': ['TotalLiabilities', 'TotalLiabilitiesNetMinorityInterest'],
+    'NetIncome': ['NetIncome', 'NetIncomeCommonStockholders'],
+}
+GROWTH_METRICS = ['TotalRevenue', 'GrossProfit', 'OperatingIncome', 'NetIncome']
+RATINGS = np.array(['Very Poor', 'Poor', 'Fair', 'Good', 'Very Good', 'Excellent'])
+
+
+def _normalize_index(statement):
+    # 'Total Revenue' and 'TotalRevenue' are the same line, depending on the yfinance version
+    return statement.rename(index=lambda name: str(name).replace(' ', ''))
+
+
+class RatioEngine:
+    '''Cross-sectional financial ratios: the statements of a whole universe of symbols in aligned arrays.
+
+    Every line item is a (symbols x years) float array, most recent fiscal year first (the yfinance column
+    order), NaN where a company has no value. Ratios, growth and health scores are then computed for all the
+    symbols at once, with the same definitions and thresholds as FinancialAnalyzer.
+    '''
+    def __init__(self, data_acquisition, max_workers=16, num_years=5):
+        self.data_acquisition = data_acquisition  # Its statement cache is reused, so loaded symbols aren't fetched again
+        self.max_workers = max_workers  # Symbols fetched in parallel (only for statements not cached yet)
+        self.num_years = num_years  # Fiscal years kept per line item
+        self.symbols = []
+        self.lines = {}  # line item -> (symbols x years) array
+        self.market_caps = np.array([])
+
+    def _fetch(self, symbol):
+        statements = {}
+        for statement_type in LINE_ITEMS:
+            statement = self.data_acquisition.get_financial_statements(symbol, statement_type, 'annual')
+            statements[statement_type] = _normalize_index(statement) if statement is not None and not statement.empty else None
+        return statements, self.data_acquisition.get_market_cap(symbol)
+
+    def load(self, symbols):
+        '''Fetches (or reuses) the annual statements of the symbols and builds the aligned arrays.'''
+        self.symbols = list(dict.fromkeys(symbols))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            fetched = list(executor.map(lambda symbol: contextvars.copy_context().run(self._fetch, symbol), self.symbols))
+        count, years = len(self.symbols), self.num_years
+        self.lines = {line: np.full((count, years), np.nan) for items in LINE_ITEMS.values() for line in items}
+        for row, (statements, _) in enumerate(fetched):
+            for statement_type, items in LINE_ITEMS.items():
+                statement = statements[statement_type]
+                if statement is None:
+                    continue
+                for line in items:
+                    name = next((alias for alias in LINE_ALIASES.get(line, [line]) if alias in statement.index), None)
+                    if name is not None:
+                        values = pd.to_numeric(statement.loc[name], errors='coerce').to_numpy(dtype=float)[:years]
+                        self.lines[line][row, :len(values)] = values
+        self.market_caps = np.array([np.nan if cap is None else float(cap) for _, cap in fetched])
+        return self
+
+    @staticmethod
+    def _divide(numerator, denominator):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = numerator / denominator
+        return np.where(np.isfinite(result), result, np.nan)
+
+    def ratios(self):
+        '''Latest fiscal year ratios for every symbol, as a DataFrame indexed by symbol.'''
+        line = {name: values[:, 0] for name, values in self.lines.items()}
+        book_value = line['TotalAssets'] - line['TotalLiabilities']
+        return pd.DataFrame({
+            'profit_margin': self._divide(line['NetIncome'], line['TotalRevenue']),
+            'return_on_assets': self._divide(line['NetIncome'], line['TotalAssets']),
+            'return_on_equity': self._divide(line['NetIncome'], line['StockholdersEquity']),
+            'current_ratio': self._divide(line['CurrentAssets'], line['CurrentLiabilities']),
+            'debt_to_assets': self._divide(line['TotalLiabilities'], line['TotalAssets']),
+            'debt_to_equity': self._divide(line['TotalLiabilities'], line['StockholdersEquity']),
+            'pe_ratio': self._divide(self.market_caps, line['NetIncome']),
+            'price_to_sales': self._divide(self.market_caps, line['TotalRevenue']),
+            'price_to_book': self._divide(self.market_caps, book_value),
+        }, index=pd.Index(self.symbols, name='symbol'))
+
+    def growth(self, num_years=None):
+        '''Latest year-over-year growth (%) and CAGR over num_years (%) of the growth metrics, per symbol.'''
+        num_years = num_years or self.num_years
+        columns = {}
+        for metric in GROWTH_METRICS:
+            values = self.lines[metric]
+            columns[f'{metric}_growth'] = (self._divide(values[:, 0], values[:, 1]) - 1) * 100
+            if values.shape[1] >= num_years:
+                # Same rule as FinancialAnalyzer.analyze_growth_trends: only with num_years of history
+                ratio = self._divide(values[:, 0], values[:, num_years - 1])
+                with np.errstate(invalid='ignore'):
+                    columns[f'{metric}_cagr_{num_years}yr'] = (np.power(ratio, 1 / (num_years - 1)) - 1) * 100
+        return pd.DataFrame(columns, index=pd.Index(self.symbols, name='symbol'))
+
+    def health(self, ratios=None, growth=None):
+        '''Financial health scores (0-5) and ratings per symbol, with FinancialAnalyzer.evaluate_financial_health's thresholds.'''
+        ratios = self.ratios() if ratios is None else ratios
+        growth = self.growth(5) if growth is None else growth
+        # A score is the number of thresholds the value beats; missing values score 0, as in the per-symbol version
+        margin = ratios['profit_margin'].to_numpy()[:, None]
+        current = ratios['current_ratio'].to_numpy()[:, None]
+        leverage = ratios['debt_to_equity'].to_numpy()[:, None]
+        cagr = growth['TotalRevenue_cagr_5yr'].to_numpy()[:, None] if 'TotalRevenue_cagr_5yr' in growth else np.full_like(margin, np.nan)
+        scores = pd.DataFrame({
+            'profitability': (margin > np.array([0, 0.05, 0.1, 0.15, 0.2])).sum(axis=1),
+            'liquidity': (current > np.array([0.5, 1, 1.5, 2, 3])).sum(axis=1),
+            'leverage': (leverage < np.array([0.3, 0.5, 1, 1.5, 2])).sum(axis=1),
+            'growth': (cagr > np.array([0, 5, 10, 15, 20])).sum(axis=1),
+        }, index=ratios.index)
+        scores['overall'] = scores[['profitability', 'liquidity', 'leverage', 'growth']].mean(axis=1)
+        scores['rating'] = RATINGS[np.minimum(5, scores['overall'].to_numpy().astype(int))]
+        return scores
+
+    def analyze(self, symbols=None):
+        '''Ratios, growth and health of the universe in one DataFrame (loads the symbols first when given).'''
+        if symbols is not None:
+            self.load(symbols)
+        ratios, growth = self.ratios(), self.growth()
+        health = self.health(ratios, growth if self.num_years == 5 else None)
+        return ratios.join(growth).join(health.add_suffix('_score').rename(columns={'rating_score': 'rating'}))
@@ -1,3 +1,14 @@
+import os
+import time
+import random
+import hashlib
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from modules.deadline import Deadline, DeadlineExceeded, call_timeout, current_deadline, deadline_scope
+
 class LLMInterface:
     def __init__(self):
         pass
@@ -41,4 +52,454 @@ class GeminiInterface(LLMInterface):
     
     def extract_insights(self, text):
         # Implement Gemini-specific insight extraction logic
-        return ["Gemini Insight 1", "Gemini Insight 2", "Gemini Insight 3"]
\ No newline at end of file
+        return ["Gemini Insight 1", "Gemini Insight 2", "Gemini Insight 3"]
+
+# Process-wide LLM clients. Each client is created the first time an agent needs it (so importing the agents
+# doesn't load any SDK) and then shared by every agent using the same provider and credentials.
+# All agents go through the same small set of HTTP connection pools, with a limit on concurrent requests.
+POOL_SETTINGS = {
+    "max_connections": 20, # Open connections per client
+    "max_keepalive_connections": 10, # Idle connections kept alive for reuse
+    "keepalive_expiry": 30, # Seconds an idle connection is kept
+    "max_concurrency": 16, # Requests in flight per client; further callers wait for a free slot
+    "timeout": 60, # Default request timeout in seconds
+}
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def configure_client_pool(**settings):
+    '''Changes the pool settings (e.g. max_concurrency=8). Only applies to clients created afterwards.'''
+    unknown = set(settings) - set(POOL_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown pool settings: {sorted(unknown)}")
+    POOL_SETTINGS.update(settings)
+
+def provider_for_model(model): # Same naming convention the agents use to pick an API
+    if "gpt" in model.lower():
+        return "openai"
+    if "gemini" in model.lower():
+        return "gemini"
+    return None
+
+def _api_key(provider):
+    if provider == "openai":
+        return os.getenv("OPENAI_API_KEY")
+    return os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+
+class SharedClient:
+    # One provider client plus the semaphore limiting how many requests go through it at the same time
+    def __init__(self, provider, client, max_concurrency):
+        self.provider = provider
+        self.client = client
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    def track(self, change):
+        with self.lock:
+            self.in_flight += change
+
+def _create_client(provider, api_key):
+    # SDKs are imported here, on first use, because importing them takes most of our startup time
+    import httpx
+    limits = httpx.Limits(
+        max_connections=POOL_SETTINGS["max_connections"],
+        max_keepalive_connections=POOL_SETTINGS["max_keepalive_connections"],
+        keepalive_expiry=POOL_SETTINGS["keepalive_expiry"],
+    )
+    if provider == "openai":
+        import openai
+        http_client_class = getattr(openai, "DefaultHttpxClient", httpx.Client) # Keeps the SDK's own defaults when available
+        return openai.OpenAI(api_key=api_key, timeout=POOL_SETTINGS["timeout"], http_client=http_client_class(limits=limits))
+    from google import genai
+    from google.genai import types
+    kwargs = {"api_key": api_key} if api_key else {}
+    try:
+        return genai.Client(http_options=types.HttpOptions(client_args={"limits": limits}), **kwargs)
+    except (TypeError, ValueError): # Older google-genai versions don't accept custom client arguments
+        return genai.Client(**kwargs)
+
+def get_shared_client(model):
+    '''Returns the SharedClient for the model's provider, creating it on first use (None for unknown models).'''
+    provider = provider_for_model(model)
+    if provider is None:
+        return None
+    api_key = _api_key(provider)
+    # Keyed by a hash of the credentials, so keys don't end up in logs or debug output
+    key = (provider, hashlib.sha256((api_key or "").encode("utf-8")).hexdigest())
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = SharedClient(provider, _create_client(provider, api_key), POOL_SETTINGS["max_concurrency"])
+        return _clients[key]
+
+def get_client(model):
+    '''Returns the shared provider client (openai.OpenAI or genai.Client) for the model.'''
+    shared = get_shared_client(model)
+    return shared.client if shared else None
+
+def complete(model, messages, max_tokens=300, temperature=0.7):
+    '''Sends a chat request through the shared client of the model's provider and returns the response text.
+
+    messages use the OpenAI format ([{"role": "system", "content": ...}, {"role": "user", "content": ...}]);
+    for Gemini models they're joined into one text, the same way the agents used to build their prompts.
+    '''
+    shared = get_shared_client(model)
+    if shared is None:
+        raise ValueError(f"No LLM provider for model '{model}'")
+    # Under a request deadline, waiting for a slot and the request itself only get the time that's left
+    if not shared.slots.acquire(timeout=call_timeout(None, "LLM call")):
+        raise DeadlineExceeded("LLM call ran out of time waiting for a free connection")
+    shared.track(1)
+    try:
+        timeout = call_timeout(POOL_SETTINGS["timeout"], "LLM call")
+        if shared.provider == "openai":
+            response = shared.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                timeout=timeout
+            )
+            return response.choices[0].message.content
+        from google.genai import types
+        response = shared.client.models.generate_content(
+            model=model, contents="\n".join(str(message["content"]) for message in messages),
+            config=types.GenerateContentConfig(http_options=types.HttpOptions(timeout=int(timeout * 1000)))
+        )
+        return response.text
+    finally:
+        shared.track(-1)
+        shared.slots.release()
+
+def pool_stats():
+    '''Number of shared clients and requests currently in flight per provider.'''
+    with _clients_lock:
+        stats = {}
+        for (provider, _), shared in _clients.items():
+            entry = stats.setdefault(provider, {"clients": 0, "in_flight": 0})
+            entry["clients"] += 1
+            entry["in_flight"] += shared.in_flight
+        return stats
+
+
+# Hedged and failover routing. A slow or failing provider shouldn't hold the whole answer: each model gets a list
+# of routes (provider + model). The first route gets the request; if it hasn't answered after its p95 latency,
+# a duplicate goes to the next route and the first answer wins. Errors move on to the next route immediately.
+# Once a route has answered, the calls still running are cancelled: queued ones never start, and cancellation is
+# checked before every blocking step (waiting for a connection slot, sending the request). An SDK request already
+# sent can't be interrupted, so it still runs to its end, but its answer is dropped.
+ROUTING_SETTINGS = {
+    "hedge_delay": 2.0, # Seconds before hedging while a route has too few latency samples
+    "min_hedge_delay": 0.2, # Never hedge sooner than this, even for very fast routes
+    "percentile": 95, # Latency percentile of the first route used as hedge delay
+    "min_samples": 20, # Latency samples needed before the percentile is trusted
+    "window": 200, # Recent calls kept per route for latency and error rate
+    "max_hedges": 1, # Duplicate requests sent on slowness (failover on errors isn't limited)
+    "max_workers": 32, # Threads running routed calls
+}
+
+# Secondary model per provider, used when its provider has credentials
+FALLBACK_MODELS = {
+    "openai": os.getenv("OPENAI_FALLBACK_MODEL", "gemini-2.5-flash"),
+    "gemini": os.getenv("GEMINI_FALLBACK_MODEL", "gpt-4o-mini"),
+}
+
+# Fast, cheap model per provider for structural tasks (entity extraction, short answers), see Agent.model_for_task
+SMALL_MODELS = {
+    "openai": os.getenv("OPENAI_SMALL_MODEL", "gpt-4o-mini"),
+    "gemini": os.getenv("GEMINI_SMALL_MODEL", "gemini-2.5-flash-lite"),
+}
+
+def small_model_for(model):
+    '''The small model of the same provider as `model` (the model itself for unknown providers).'''
+    return SMALL_MODELS.get(provider_for_model(model), model)
+
+class SDKProvider:
+    # Real provider calls, through the shared pooled clients above
+    def __init__(self, name):
+        self.name = name
+
+    def complete(self, model, messages, max_tokens=300, temperature=0.7):
+        return complete(model, messages, max_tokens=max_tokens, temperature=temperature)
+
+class FakeProvider:
+    '''Local stand-in for an LLM provider, with injected latency and failures (for testing the routing).
+
+    Args:
+        latency: Seconds a normal call takes
+        slow_rate, slow_latency: Share of calls that take slow_latency seconds instead (the tail)
+        fail_rate: Share of calls raising an error
+    '''
+    def __init__(self, name, latency=0.05, slow_rate=0.0, slow_latency=2.0, fail_rate=0.0, seed=None):
+        self.name = name
+        self.latency = latency
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.fail_rate = fail_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.cancelled = 0 # Calls stopped because another route answered first
+        self.lock = threading.Lock()
+
+    def _sleep(self, seconds):
+        # The call's deadline (see LLMRouter) interrupts the wait when the call is cancelled, like a closed connection
+        deadline = current_deadline()
+        if deadline is None:
+            time.sleep(seconds)
+            return
+        try:
+            deadline.sleep(seconds)
+        except DeadlineExceeded:
+            with self.lock:
+                self.cancelled += 1
+            raise
+
+    def complete(self, model, messages, max_tokens=300, temperature=0.7):
+        with self.lock:
+            self.calls += 1
+            slow = self.random.random() < self.slow_rate
+            fail = self.random.random() < self.fail_rate
+        latency = self.slow_latency if slow else self.latency
+        timeout = call_timeout(None, "LLM call")
+        if timeout is not None and timeout < latency: # Behaves like a real client timing out
+            self._sleep(timeout)
+            raise TimeoutError(f"{self.name} timed out after {timeout:.2f}s")
+        self._sleep(latency)
+        if fail:
+            raise RuntimeError(f"{self.name} failed")
+        return f"{self.name}/{model}: {str(messages[-1]['content'])[:50]}"
+
+class Route:
+    # One way to answer a request (a provider and a model) with its recent latencies and errors
+    def __init__(self, provider, model, window=200):
+        self.provider = provider
+        self.model = model
+        self.latencies = deque(maxlen=window) # Seconds of recent successful calls
+        self.outcomes = deque(maxlen=window) # True for recent successes, False for errors
+        self.lock = threading.Lock()
+
+    @property
+    def name(self):
+        return f"{self.provider.name}:{self.model}"
+
+    def call(self, messages, max_tokens, temperature):
+        start = time.monotonic()
+        try:
+            result = self.provider.complete(self.model, messages, max_tokens=max_tokens, temperature=temperature)
+        except DeadlineExceeded:
+            raise # Out of time or cancelled: says nothing about the route's health
+        except Exception:
+            with self.lock:
+                self.outcomes.append(False)
+            raise
+        with self.lock:
+            self.latencies.append(time.monotonic() - start)
+            self.outcomes.append(True)
+        return result
+
+    def latency_percentile(self, percentile):
+        with self.lock:
+            latencies = sorted(self.latencies)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percentile / 100))]
+
+    def error_rate(self):
+        with self.lock:
+            return (len(self.outcomes) - sum(self.outcomes)) / len(self.outcomes) if self.outcomes else 0.0
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _routing_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=ROUTING_SETTINGS["max_workers"], thread_name_prefix="llm-route")
+        return _executor
+
+class LLMRouter:
+    '''Sends a request to its routes with hedging (on slowness) and failover (on errors); the first answer wins.'''
+    def __init__(self, routes, **settings):
+        self.settings = {**ROUTING_SETTINGS, **settings}
+        self.routes = list(routes)
+        self.lock = threading.Lock()
+        self.stats = {"calls": 0, "hedges": 0, "hedge_wins": 0, "failovers": 0, "failures": 0, "cancelled": 0}
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def ordered_routes(self):
+        # Routes failing most of their recent calls go last, so a broken provider stops being tried first
+        return sorted(self.routes, key=lambda route: route.error_rate() > 0.5)
+
+    def hedge_delay(self, route):
+        # Adapts to the route: its recent p95 latency once there are enough samples
+        if len(route.latencies) < self.settings["min_samples"]:
+            return self.settings["hedge_delay"]
+        return max(self.settings["min_hedge_delay"], route.latency_percentile(self.settings["percentile"]))
+
+    def _call(self, route, deadline, messages, max_tokens, temperature):
+        with deadline_scope(deadline):
+            return route.call(messages, max_tokens, temperature)
+
+    def _cancel(self, pending):
+        # The calls that lost the race: queued ones are dropped, running ones see their deadline cancelled
+        for future, (route, deadline) in pending.items():
+            deadline.cancel()
+            future.cancel()
+            self._count("cancelled")
+        pending.clear()
+
+    def complete(self, messages, max_tokens=300, temperature=0.7):
+        self._count("calls")
+        routes = iter(self.ordered_routes())
+        pending = {} # future -> (route, deadline of that call)
+        errors = []
+        hedges = 0
+
+        def launch():
+            route = next(routes, None)
+            if route is None:
+                return None
+            # Each call runs in a copy of our context under its own child of the request deadline,
+            # so it keeps the request's time limit and can be cancelled alone when another route wins
+            context = contextvars.copy_context()
+            deadline = Deadline(parent=current_deadline())
+            future = _routing_executor().submit(context.run, self._call, route, deadline, messages, max_tokens, temperature)
+            pending[future] = (route, deadline)
+            return route
+
+        first = launch()
+        hedged_routes = []
+        if first is None:
+            raise ValueError("LLMRouter has no routes")
+        hedge_at = time.monotonic() + self.hedge_delay(first)
+        try:
+            while pending:
+                timeout = call_timeout(None, "LLM call") # Raises once the request deadline has passed
+                if hedge_at is not None:
+                    until_hedge = max(0.0, hedge_at - time.monotonic())
+                    timeout = until_hedge if timeout is None else min(timeout, until_hedge)
+                done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    route, _ = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except DeadlineExceeded:
+                        raise
+                    except Exception as e:
+                        errors.append(f"{route.name}: {e}")
+                        if launch() is not None: # Failover: the next route gets the request right away
+                            self._count("failovers")
+                        continue
+                    if route in hedged_routes:
+                        self._count("hedge_wins")
+                    return result # Slower duplicates are cancelled below
+                if not done and hedge_at is not None and time.monotonic() >= hedge_at:
+                    hedge_at = None
+                    if hedges < self.settings["max_hedges"]:
+                        hedged = launch()
+                        if hedged is not None:
+                            hedged_routes.append(hedged)
+                            hedges += 1
+                            self._count("hedges")
+                            if hedges < self.settings["max_hedges"]:
+                                hedge_at = time.monotonic() + self.hedge_delay(hedged)
+        finally:
+            self._cancel(pending) # Calls still running once we have an answer (or gave up) are cancelled
+        self._count("failures")
+        call_timeout(None, "LLM call") # Routes that timed out with the request deadline: report the deadline
+        raise RuntimeError("All LLM routes failed: " + "; ".join(errors))
+
+    def route_stats(self):
+        return {
+            route.name: {
+                "calls": len(route.outcomes),
+                "p95": route.latency_percentile(95),
+                "error_rate": round(route.error_rate(), 3),
+            }
+            for route in self.routes
+        }
+
+_routers = {}
+_routers_lock = threading.Lock()
+
+def default_routes(model):
+    '''The model itself, then the fallback model of another provider when that provider has credentials.'''
+    window = ROUTING_SETTINGS["window"]
+    routes = [Route(SDKProvider(provider_for_model(model) or "unknown"), model, window)]
+    fallback = FALLBACK_MODELS.get(provider_for_model(model))
+    if fallback and fallback != model and _api_key(provider_for_model(fallback)):
+        routes.append(Route(SDKProvider(provider_for_model(fallback)), fallback, window))
+    return routes
+
+def configure_router(model, routes=None, **settings):
+    '''Sets the routes (and routing settings) used for a model, e.g. FakeProvider routes in tests.'''
+    with _routers_lock:
+        _routers[model] = LLMRouter(routes if routes is not None else default_routes(model), **settings)
+        return _routers[model]
+
+def get_router(model):
+    with _routers_lock:
+        if model not in _routers:
+            _routers[model] = LLMRouter(default_routes(model))
+        return _routers[model]
+
+def routed_complete(model, messages, max_tokens=300, temperature=0.7):
+    '''Like complete(), but hedged and failed over across the model's routes.'''
+    return get_router(model).complete(messages, max_tokens=max_tokens, temperature=temperature)
+
+def router_stats():
+    with _routers_lock:
+        return {model: {**router.stats, "routes": router.route_stats()} for model, router in _routers.items()}
+
+def _prompt_text(messages): # Chat messages as one completion prompt
+    return "\n\n".join(str(message["content"]) for message in messages)
+
+def batch_complete(model, batch, max_tokens=300, temperature=0.7, contexts=None):
+    '''Answers several chat requests for the same model; returns one text (or exception) per request, in order.
+
+    OpenAI instruct models take all the prompts in one completions request. Other models (chat models, Gemini)
+    have no synchronous batch API, so the requests go out concurrently through the routed, pooled clients.
+    contexts (optional) are the callers' contextvars contexts, so each request keeps its caller's deadline.
+    '''
+    contexts = contexts or [contextvars.copy_context() for _ in batch]
+    if provider_for_model(model) == "openai" and "instruct" in model.lower():
+        shared = get_shared_client(model)
+        # One provider call for the whole batch: it runs under the tightest of the callers' deadlines, and the
+        # callers already out of time aren't sent at all
+        deadlines = [context.run(current_deadline) for context in contexts]
+        texts = [DeadlineExceeded("LLM call ran out of time waiting for its batch") for _ in batch]
+        live = [i for i, deadline in enumerate(deadlines) if deadline is None or not deadline.expired()]
+        if not live:
+            return texts
+        bounded = [deadlines[i] for i in live if deadlines[i] is not None and deadlines[i].remaining() is not None]
+        with deadline_scope(min(bounded, key=lambda deadline: deadline.remaining(), default=None)):
+            if not shared.slots.acquire(timeout=call_timeout(None, "LLM call")):
+                raise DeadlineExceeded("LLM call ran out of time waiting for a free connection")
+            shared.track(1)
+            try:
+                response = shared.client.completions.create(
+                    model=model, prompt=[_prompt_text(batch[i]) for i in live],
+                    max_tokens=max_tokens, temperature=temperature, timeout=call_timeout(POOL_SETTINGS["timeout"], "LLM call")
+                )
+            finally:
+                shared.track(-1)
+                shared.slots.release()
+        for choice in response.choices: # Choices come back with the index of their prompt
+            texts[live[choice.index]] = choice.text
+        return texts
+    # Own short-lived threads: routed_complete itself uses the routing executor, so we can't wait on it from there
+    with ThreadPoolExecutor(max_workers=len(batch), thread_name_prefix="llm-batch") as executor:
+        futures = [executor.submit(context.run, routed_complete, model, messages, max_tokens, temperature)
+                   for context, messages in zip(contexts, batch)]
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            results.append(e)
+    return results
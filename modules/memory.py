@@ -1,12 +1,20 @@
 import os
 import pickle
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from modules.retrieval import InsightIndex
 # We're creating a class called MemorySystem with all the learning functionality
 class MemorySystem:
     # This class stores insights and lessons from previous analyses to improve future runs.
-    def __init__(self, memory_file='agent_memory.pkl'): # It will store the learned data into the specified file, or the default file name.
+    def __init__(self, memory_file='agent_memory.pkl', embedder=None): # It will store the learned data into the specified file, or the default file name.
         self.memory_file = memory_file
         self.stock_insights = {}
         self.news_insights = {}
+        self.research_results = {} # Latest output of each research step per symbol (see ResearchPlanner.execute_plan)
+        self.embedder = embedder # Optional local embedding function for the retrieval index (e.g. retrieval.HashingEmbedder())
+        self.index = None # Retrieval index over all stored insights, built the first time we search
+        self.lock = threading.RLock() # The same memory can be shared by several agents and sessions running in parallel
         self.load_memory()
     
     def load_memory(self): # Should there be a previous file in existence, it can load it using this function
@@ -16,6 +24,7 @@ class MemorySystem:
                     memory_data = pickle.load(f) # Then, it will load the data into memory
                     self.stock_insights = memory_data.get('stock_insights', {}) # separating stock insights,
                     self.news_insights = memory_data.get('news_insights', {}) # market news insights,
+                    self.research_results = memory_data.get('research_results', {}) # and research step outputs
             else: # Should there be no prior file, it will start fresh
                 print("No memory file found. Starting with empty memory.")
         except Exception as e: # Should there be an error while loading the file, it will start fresh as well
@@ -24,41 +33,49 @@ class MemorySystem:
     
     def save_memory(self): # This method will save the memory in the file in a structured manner
         try:
-            memory_data = {
-                'stock_insights': self.stock_insights, # It will save all stock insights currently provided,
-                'news_insights': self.news_insights # followed by news insights
-            }
-            with open(self.memory_file, 'wb') as f: # It will first open the file name specified in the instance of this class
-                pickle.dump(memory_data, f) # and then write in it the contents of the memory_data dictionary
+            with self.lock: # Only one thread writes the file at a time
+                memory_data = {
+                    'stock_insights': self.stock_insights, # It will save all stock insights currently provided,
+                    'news_insights': self.news_insights, # followed by news insights
+                    'research_results': self.research_results # and the latest research step outputs
+                }
+                with open(self.memory_file, 'wb') as f: # It will first open the file name specified in the instance of this class
+                    pickle.dump(memory_data, f) # and then write in it the contents of the memory_data dictionary
             print("Memory saved successfully.")
         except Exception as e:
             print(f"Error saving memory: {e}") # Should there be any errors saving, it will print out the error
     
-    def add_stock_insight(self, symbol, insight, timestamp=None): # With this method, we'll add knowledge classified as stock insights
-        if timestamp is None:
-            timestamp = datetime.now().isoformat() # If no timestamp is specified, we'll initialize the current time stamp
+    def add_stock_insight(self, symbol, insight, timestamp=None, save=True): # With this method, we'll add knowledge classified as stock insights (save=False leaves saving to the caller, e.g. once per batch)
+        with self.lock:
+            if timestamp is None:
+                timestamp = datetime.now().isoformat() # If no timestamp is specified, we'll initialize the current time stamp
         
-        if symbol not in self.stock_insights: # If the current symbol (financial company) is not in previous insights, we'll add it
-            self.stock_insights[symbol] = []
+            if symbol not in self.stock_insights: # If the current symbol (financial company) is not in previous insights, we'll add it
+                self.stock_insights[symbol] = []
         
-        self.stock_insights[symbol].append({ # Finally, we encode the insight with its timestamp in the stock_insights dictionary of this class
-            'insight': insight,
-            'timestamp': timestamp
-        })
-        self.save_memory() # And we save the memory right away
+            self.stock_insights[symbol].append({ # Finally, we encode the insight with its timestamp in the stock_insights dictionary of this class
+                'insight': insight,
+                'timestamp': timestamp
+            })
+            self._index_item(symbol, 'stock', insight, timestamp) # Keeping the retrieval index up to date (if built)
+            if save:
+                self.save_memory() # And we save the memory right away
     
-    def add_market_news(self,symbol, news_item, timestamp=None): # This method adds market news insights for a given symbol
-        if timestamp is None:
-            timestamp = datetime.now().isoformat() # If no timestamp is specified, we'll initialize the current time stamp
+    def add_market_news(self,symbol, news_item, timestamp=None, save=True): # This method adds market news insights for a given symbol (save=False leaves saving to the caller)
+        with self.lock:
+            if timestamp is None:
+                timestamp = datetime.now().isoformat() # If no timestamp is specified, we'll initialize the current time stamp
 
-        if symbol not in self.news_insights: # If the current symbol (financial company) is not in previous insights, we'll add it
-            self.news_insights[symbol] = []
+            if symbol not in self.news_insights: # If the current symbol (financial company) is not in previous insights, we'll add it
+                self.news_insights[symbol] = []
 
-        self.news_insights[symbol].append({ # Finally, we encode the news item with its timestamp in the news_insights dictionary of this class
-            'news_item': news_item,
-            'timestamp': timestamp
-        })
-        self.save_memory() # And we save the memory right away
+            self.news_insights[symbol].append({ # Finally, we encode the news item with its timestamp in the news_insights dictionary of this class
+                'news_item': news_item,
+                'timestamp': timestamp
+            })
+            self._index_item(symbol, 'news', news_item, timestamp) # Keeping the retrieval index up to date (if built)
+            if save:
+                self.save_memory() # And we save the memory right away
 
     def get_stock_insights(self, symbol): # This method retrieves all stock insights for a given symbol
         results=self.stock_insights.get(symbol, [])
@@ -88,4 +105,115 @@ class MemorySystem:
                 if (datetime.now() - timestamp).days > 2:
                     continue
                 filtered_results.append(result)
-        return filtered_results
\ No newline at end of file
+        return filtered_results
+
+    def add_research_result(self, symbol, step, result, timestamp=None): # Keeps the latest output of a research step (not saved until save_memory)
+        with self.lock:
+            self.research_results.setdefault(symbol, {})[step] = {
+                'result': result,
+                'timestamp': timestamp or datetime.now().isoformat()
+            }
+
+    def get_research_result(self, symbol, step, max_age_hours=None): # Stored output of a research step, None when missing or too old
+        with self.lock:
+            entry = self.research_results.get(symbol, {}).get(step)
+        if entry is None:
+            return None
+        if max_age_hours is not None and datetime.fromisoformat(entry['timestamp']) <= datetime.now() - timedelta(hours=max_age_hours):
+            return None
+        return entry['result']
+
+    def _index_item(self, symbol, kind, text, timestamp): # Adds one stored item to the retrieval index, when it has been built already
+        if self.index is not None:
+            self.index.add(text, symbol=symbol, kind=kind, timestamp=datetime.fromisoformat(timestamp).timestamp())
+
+    def build_index(self): # This method (re)builds the retrieval index from every stock and news insight in memory
+        self.index = InsightIndex(embedder=self.embedder)
+        for symbol, items in self.stock_insights.items():
+            for item in items:
+                self._index_item(symbol, 'stock', item['insight'], item['timestamp'])
+        for symbol, items in self.news_insights.items():
+            for item in items:
+                self._index_item(symbol, 'news', item['news_item'], item['timestamp'])
+        return self.index
+
+    def search_insights(self, query, k=5, symbol=None, max_age_days=None, kinds=None): # This method finds the stored insights most related to a free-text query
+        # symbol can be one symbol or a list of them, and kinds can be ['stock'], ['news'] or both (None)
+        since = (datetime.now() - timedelta(days=max_age_days)).timestamp() if max_age_days is not None else None
+        with self.lock: # The index may be updated by other agents or sessions at the same time
+            if self.index is None:
+                self.build_index()
+            results = self.index.search(query, k=k, symbol=symbol, kinds=kinds, since=since)
+        return [{
+            'symbol': result['symbol'],
+            'kind': result['kind'],
+            'text': result['text'],
+            'timestamp': datetime.fromtimestamp(result['timestamp']).isoformat(),
+            'score': result['score']
+        } for result in results]
+
+
+# Short-term memory: the conversation history each agent includes in its prompts
+def estimate_tokens(text): # Rough token count (about 4 characters per token), good enough to keep prompts within a budget
+    return len(text) // 4 + 1
+
+def truncating_summarizer(summary, messages, max_chars=1200): # Default summarizer: keeps the start of each compacted message, no LLM call needed
+    lines = [summary] if summary else []
+    lines += [message if len(message) <= 160 else message[:160] + "..." for message in messages]
+    return "\n".join(lines)[-max_chars:] # When the summary itself grows too long, the oldest part goes first
+
+class ConversationHistory:
+    # Conversation history bounded by a token budget instead of a fixed number of messages.
+    # When the budget is exceeded, the oldest turns are compacted into a rolling summary, and the rendered
+    # history text is cached so it's only rebuilt when the summary changes.
+    def __init__(self, max_tokens=1500, summarizer=None, compact_to=0.6, summary_share=0.3):
+        self.max_tokens = max_tokens # Token budget for summary + recent messages
+        self.summarizer = summarizer or truncating_summarizer # Function(previous summary, compacted messages, max_chars) -> new summary
+        self.summary_share = summary_share # Share of the budget the rolling summary may use
+        self.compact_to = compact_to # When compacting, we go down to this share of the budget, so compactions are infrequent
+        self.messages = deque() # Recent messages as (text, tokens), appended on the right and compacted from the left
+        self.summary = ""
+        self.summary_tokens = 0
+        self.total_tokens = 0 # Tokens of the recent messages (without the summary)
+        self._rendered = None # Cached output of render()
+
+    def append(self, message):
+        message = str(message)
+        tokens = estimate_tokens(message)
+        self.messages.append((message, tokens))
+        self.total_tokens += tokens
+        if self.summary_tokens + self.total_tokens > self.max_tokens and len(self.messages) > 1:
+            self._compact()
+        elif self._rendered is not None:
+            self._rendered = self._rendered + "\n" + message if self._rendered else message # Reusing the cached text, only adding the new line
+
+    def _compact(self): # Moves the oldest messages into the rolling summary
+        target = self.max_tokens * self.compact_to
+        compacted = []
+        while len(self.messages) > 1 and self.summary_tokens + self.total_tokens > target:
+            message, tokens = self.messages.popleft()
+            self.total_tokens -= tokens
+            compacted.append(message)
+        self.summary = self.summarizer(self.summary, compacted, max_chars=int(self.max_tokens * self.summary_share * 4))
+        self.summary_tokens = estimate_tokens(self.summary)
+        self._rendered = None
+
+    def render(self): # Returns the history as prompt text: the summary of older turns followed by the recent messages
+        if self._rendered is None:
+            lines = [f"Summary of earlier conversation:\n{self.summary}"] if self.summary else []
+            lines += [message for message, _ in self.messages]
+            self._rendered = "\n".join(lines)
+        return self._rendered
+
+    def clear(self):
+        self.messages.clear()
+        self.summary = ""
+        self.summary_tokens = 0
+        self.total_tokens = 0
+        self._rendered = None
+
+    def __iter__(self):
+        return (message for message, _ in self.messages)
+
+    def __len__(self):
+        return len(self.messages)
@@ -0,0 +1,213 @@
+import os
+import re
+import csv
+import json
+import pickle
+import hashlib
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+
+# Common words we don't index, since nearly every headline contains them
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has', 'in', 'is', 'it', 'its',
+    'of', 'on', 'or', 's', 'that', 'the', 'to', 'was', 'were', 'will', 'with',
+}
+
+# Column names used by the usual news dumps (Kaggle, Reuters, FinnHub/NewsAPI exports) for each of our fields
+FIELD_ALIASES = {
+    'headline': ['headline', 'title'],
+    'summary': ['summary', 'description', 'content', 'text'],
+    'symbol': ['symbol', 'stock', 'ticker', 'related'],
+    'date': ['datetime', 'date', 'publishedAt', 'published', 'time', 'timestamp'],
+    'source': ['source', 'publisher'],
+    'url': ['url', 'link'],
+}
+
+
+def tokenize(text):
+    '''Splits a text into lowercase word terms, leaving out stopwords.'''
+    return [term for term in re.findall(r'[a-z0-9]+', (text or '').lower()) if term not in STOPWORDS]
+
+
+def parse_timestamp(value):
+    '''Converts the different date formats found in news dumps into a UTC epoch timestamp (or None).'''
+    if value is None or value == '':
+        return None
+    if isinstance(value, str) and len(value.strip()) == 8 and value.strip().isdigit(): # Compact dates like 20240101
+        value = f"{value.strip()[:4]}-{value.strip()[4:6]}-{value.strip()[6:]}"
+    if isinstance(value, (int, float)) or (isinstance(value, str) and value.strip().isdigit()):
+        value = float(value)
+        return value / 1000 if value > 1e11 else value # Some dumps use milliseconds
+    text = str(value).strip().replace('Z', '+00:00')
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        for date_format in ('%m/%d/%Y %H:%M', '%m/%d/%Y', '%b %d %Y', '%a, %d %b %Y %H:%M:%S %z'):
+            try:
+                parsed = datetime.strptime(text, date_format)
+                break
+            except ValueError:
+                continue
+        else:
+            return None
+    if parsed.tzinfo is None: # Dates without timezone are taken as UTC
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class NewsCorpusStore:
+    '''Local, indexed store of historical news articles.
+
+    Articles are indexed by symbol and publication date (sorted timestamps, so date ranges are binary
+    searches) and by headline terms (inverted index), and persisted in a pickle file between runs.
+    '''
+    def __init__(self, store_file='news_corpus.pkl'):
+        self.store_file = store_file
+        self.articles = [] # Every article, the position in this list is its document id
+        self.by_symbol = {} # symbol -> (sorted timestamps, document ids in the same order)
+        self.terms = {} # headline term -> set of document ids
+        self._seen = set() # Hashes of the stored articles, so ingesting the same dump twice adds nothing
+        self.load()
+
+    def load(self):
+        try:
+            if os.path.exists(self.store_file):
+                with open(self.store_file, 'rb') as f:
+                    data = pickle.load(f)
+                self.articles = data.get('articles', [])
+                self.by_symbol = data.get('by_symbol', {})
+                self.terms = data.get('terms', {})
+                self._seen = {self._article_key(article) for article in self.articles}
+        except Exception as e:
+            print(f"Error loading news corpus: {e}")
+
+    def save(self):
+        try:
+            with open(self.store_file, 'wb') as f:
+                pickle.dump({'articles': self.articles, 'by_symbol': self.by_symbol, 'terms': self.terms}, f)
+        except Exception as e:
+            print(f"Error saving news corpus: {e}")
+
+    def _article_key(self, article):
+        text = f"{article['symbol']}|{article['timestamp']}|{article['headline']}"
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def _normalize(self, record, default_symbol=None):
+        # Maps a raw row of any supported dump into our article format, one article per symbol it's about
+        # (FinnHub's 'related' field lists several symbols, e.g. "AAPL,MSFT")
+        fields = {}
+        for field, aliases in FIELD_ALIASES.items():
+            fields[field] = next((record[alias] for alias in aliases if record.get(alias) not in (None, '')), None)
+        symbols = [symbol for symbol in re.split(r'[,;|\s]+', str(fields['symbol'] or default_symbol or '').upper()) if symbol]
+        timestamp = parse_timestamp(fields['date'])
+        if not symbols or not fields['headline'] or timestamp is None:
+            return []
+        return [{
+            'symbol': symbol,
+            'headline': str(fields['headline']).strip(),
+            'summary': str(fields['summary'] or '').strip(),
+            'timestamp': timestamp,
+            'source': fields['source'] or 'Unknown',
+            'url': fields['url'] or '',
+        } for symbol in dict.fromkeys(symbols)]
+
+    def add_articles(self, records, default_symbol=None):
+        '''Adds raw records (dicts) to the store. Returns how many new articles were stored.'''
+        touched_symbols = set()
+        added = 0
+        for record in records:
+            for article in self._normalize(record, default_symbol):
+                key = self._article_key(article)
+                if key in self._seen:
+                    continue
+                self._seen.add(key)
+                doc_id = len(self.articles)
+                self.articles.append(article)
+                timestamps, doc_ids = self.by_symbol.setdefault(article['symbol'], ([], []))
+                timestamps.append(article['timestamp'])
+                doc_ids.append(doc_id)
+                touched_symbols.add(article['symbol'])
+                for term in set(tokenize(article['headline'])):
+                    self.terms.setdefault(term, set()).add(doc_id)
+                added += 1
+        # Sorting once per symbol after a bulk load is much cheaper than keeping the lists sorted on every insert
+        for symbol in touched_symbols:
+            timestamps, doc_ids = self.by_symbol[symbol]
+            order = sorted(range(len(timestamps)), key=timestamps.__getitem__)
+            self.by_symbol[symbol] = ([timestamps[i] for i in order], [doc_ids[i] for i in order])
+        return added
+
+    def _read_file(self, path):
+        # Yields raw records from CSV or JSON-lines dumps
+        if path.endswith('.jsonl') or path.endswith('.json'):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        yield json.loads(line)
+        else:
+            with open(path, newline='', encoding='utf-8') as f:
+                yield from csv.DictReader(f)
+
+    def ingest_file(self, path, default_symbol=None, save=True):
+        '''Loads a CSV or JSONL news dump into the store.'''
+        try:
+            added = self.add_articles(self._read_file(path), default_symbol=default_symbol)
+        except Exception as e:
+            print(f"Error ingesting news file {path}: {e}")
+            return 0
+        if save:
+            self.save()
+        print(f"Ingested {added} new articles from {path}.")
+        return added
+
+    def query(self, symbol=None, start=None, end=None, terms=None, limit=None):
+        '''Returns articles (newest first) filtered by symbol, date range and/or headline terms.
+
+        Args:
+            symbol: Stock symbol, or None for every symbol
+            start, end: Dates (datetime, ISO string or epoch) limiting the publication time, both inclusive
+            terms: Text whose terms must all appear in the headline
+            limit: Maximum number of articles to return
+        '''
+        start = parse_timestamp(start.isoformat() if isinstance(start, datetime) else start)
+        end = parse_timestamp(end.isoformat() if isinstance(end, datetime) else end)
+        if isinstance(end, float) and end == int(end) and end % 86400 == 0:
+            end += 86399 # A plain date as end means the whole day
+
+        candidates = None
+        if symbol is not None:
+            timestamps, doc_ids = self.by_symbol.get(symbol.upper(), ([], []))
+            low = bisect_left(timestamps, start) if start is not None else 0
+            high = bisect_right(timestamps, end) if end is not None else len(timestamps)
+            candidates = doc_ids[low:high]
+        query_terms = tokenize(terms) # Empty for only stopwords or punctuation: then there's no term to filter on
+        if query_terms:
+            matches = None
+            for term in query_terms:
+                matches = set(self.terms.get(term, ())) if matches is None else matches & self.terms.get(term, set())
+            matches = matches or set()
+            candidates = [doc_id for doc_id in candidates if doc_id in matches] if candidates is not None else list(matches)
+        if candidates is None:
+            candidates = range(len(self.articles))
+
+        results = [self.articles[doc_id] for doc_id in candidates]
+        if symbol is None: # Without a symbol, the date filter can't use the per-symbol index
+            results = [a for a in results if (start is None or a['timestamp'] >= start) and (end is None or a['timestamp'] <= end)]
+        results.sort(key=lambda a: a['timestamp'], reverse=True)
+        return results[:limit] if limit else results
+
+
+if __name__ == '__main__':
+    # Bulk ingestion from the command line: python -m modules.newsstore news1.csv news2.jsonl ...
+    import argparse
+    arg_parser = argparse.ArgumentParser(description='Load local news dumps into the news corpus store.')
+    arg_parser.add_argument('files', nargs='+', help='CSV or JSONL news files')
+    arg_parser.add_argument('--store', default='news_corpus.pkl', help='Store file')
+    arg_parser.add_argument('--symbol', default=None, help='Symbol for dumps without a symbol column')
+    args = arg_parser.parse_args()
+    store = NewsCorpusStore(args.store)
+    for file_path in args.files:
+        store.ingest_file(file_path, default_symbol=args.symbol, save=False)
+    store.save()
+    print(f"News corpus now holds {len(store.articles)} articles for {len(store.by_symbol)} symbols.")
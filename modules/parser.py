@@ -63,4 +63,174 @@ class XmlParser(Parser):
         result = {}
         for tag, value in matches:
                 result[tag.lower()] = value.strip() 
-        return result
\ No newline at end of file
+        return result
+
+# Rule-based entity extraction, so simple inputs like "How is Apple doing?" don't need an LLM call to find the symbol.
+# Company names we know map to their symbol, exchange and industry; explicit tickers ($AAPL or AAPL) are also accepted.
+KNOWN_COMPANIES = {
+    "apple": ("AAPL", "NASDAQ", "Technology"),
+    "microsoft": ("MSFT", "NASDAQ", "Technology"),
+    "alphabet": ("GOOGL", "NASDAQ", "Communication Services"),
+    "google": ("GOOGL", "NASDAQ", "Communication Services"),
+    "amazon": ("AMZN", "NASDAQ", "Consumer Cyclical"),
+    "meta": ("META", "NASDAQ", "Communication Services"),
+    "facebook": ("META", "NASDAQ", "Communication Services"),
+    "nvidia": ("NVDA", "NASDAQ", "Technology"),
+    "tesla": ("TSLA", "NASDAQ", "Consumer Cyclical"),
+    "netflix": ("NFLX", "NASDAQ", "Communication Services"),
+    "amd": ("AMD", "NASDAQ", "Technology"),
+    "intel": ("INTC", "NASDAQ", "Technology"),
+    "ibm": ("IBM", "NYSE", "Technology"),
+    "oracle": ("ORCL", "NYSE", "Technology"),
+    "salesforce": ("CRM", "NYSE", "Technology"),
+    "jpmorgan": ("JPM", "NYSE", "Financial Services"),
+    "goldman sachs": ("GS", "NYSE", "Financial Services"),
+    "bank of america": ("BAC", "NYSE", "Financial Services"),
+    "visa": ("V", "NYSE", "Financial Services"),
+    "mastercard": ("MA", "NYSE", "Financial Services"),
+    "berkshire hathaway": ("BRK-B", "NYSE", "Financial Services"),
+    "walmart": ("WMT", "NYSE", "Consumer Defensive"),
+    "coca-cola": ("KO", "NYSE", "Consumer Defensive"),
+    "coca cola": ("KO", "NYSE", "Consumer Defensive"),
+    "pepsico": ("PEP", "NASDAQ", "Consumer Defensive"),
+    "disney": ("DIS", "NYSE", "Communication Services"),
+    "exxon": ("XOM", "NYSE", "Energy"),
+    "chevron": ("CVX", "NYSE", "Energy"),
+    "pfizer": ("PFE", "NYSE", "Healthcare"),
+    "johnson & johnson": ("JNJ", "NYSE", "Healthcare"),
+    "boeing": ("BA", "NYSE", "Industrials"),
+}
+
+# Upper-case words that look like tickers but aren't: abbreviations, indicators and metrics, indexes and commodities
+NOT_TICKERS = {"I", "A", "AI", "CEO", "CFO", "USA", "US", "UK", "EU", "IPO", "ETF", "EPS", "GDP", "CPI", "FED", "SEC",
+               "PE", "P", "E", "Q1", "Q2", "Q3", "Q4", "YOY", "ESG", "API", "OK", "USD", "EUR", "NYSE", "NASDAQ", "THE", "AND",
+               "RSI", "MACD", "SMA", "EMA", "VWAP", "ATR", "ADX", "OBV", "VAR", "CVAR", "BETA", "ALPHA", "ROE", "ROA", "ROI",
+               "ROIC", "EBIT", "EBITDA", "FCF", "DCF", "CAGR", "YTD", "TTM", "FY", "H1", "H2", "PEG", "NAV", "AUM", "IRR", "WACC",
+               "DOW", "DJIA", "SPX", "VIX", "GOLD", "OIL", "WTI", "FX", "FOMC", "ECB", "BOJ", "IMF", "PPI", "PCE", "NFP", "QE",
+               "REIT", "SPAC", "OTC", "ATH", "IV", "LLC", "INC", "CO", "CORP", "LTD", "PLC", "GBP", "JPY", "CNY", "BTC",
+               "ETH", "OR", "VS", "IS", "IT", "TO", "OF", "IN", "ON", "MY", "BUY", "SELL", "HOLD", "WHAT", "HOW", "WHY", "NOW"}
+
+# Words that mark an input as related to financial markets
+MARKET_TERMS = {"stock", "stocks", "share", "shares", "market", "markets", "price", "prices", "earnings", "revenue",
+                "invest", "investing", "investment", "portfolio", "dividend", "valuation", "sentiment", "news", "trading",
+                "trend", "trends", "analyst", "buy", "sell", "bull", "bullish", "bear", "bearish", "financial", "finance",
+                "economy", "economic", "inflation", "rates", "interest", "bond", "bonds", "etf", "index", "nasdaq", "nyse",
+                "s&p", "dow", "crypto", "ticker", "quote", "profit", "growth", "volatility", "risk", "sector", "fund", "ipo",
+                "analysts", "company", "companies", "outlook", "performance", "quarter", "quarterly", "guidance", "equity",
+                "yield", "yields", "curve", "treasury", "treasuries", "fed", "fomc", "recession", "holdings", "holding",
+                "profit", "profits", "loss", "losses", "rally", "selloff", "merger", "acquisition", "takeover", "shareholders",
+                "chip", "chips", "chipmakers", "semiconductor", "semiconductors", "banks", "bank", "gold", "oil", "commodities",
+                "currency", "currencies", "dollar", "forex", "bitcoin", "ipos", "options", "futures", "hedge", "capital"}
+
+# Dates and periods the user may ask about, longest forms first: ISO and US dates, "Jan 5, 2024", "March 2024",
+# quarters, years and rolling periods ("last 30 days", "past month")
+MONTHS = {"jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6, "jul": 7, "aug": 8, "sep": 9, "oct": 10, "nov": 11, "dec": 12}
+DATE_EXPRESSION = (
+    r"\b(?P<iso>\d{4}-\d{2}-\d{2})\b|\b(?P<us>\d{1,2}/\d{1,2}/\d{4})\b"
+    r"|\b(?P<day_month>jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.? (?P<day>\d{1,2})(?:st|nd|rd|th)?,? (?P<day_year>\d{4})\b"
+    r"|\b(?P<month>jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]* (?P<month_year>\d{4})\b"
+    r"|\bq(?P<quarter>[1-4]) (?P<quarter_year>\d{4})\b|\b(?P<year>(?:19|20)\d{2})\b"
+    r"|\b(?:last|past) (?P<days>\d{1,3}) days\b|\b(?P<relative>this|last|past) (?P<unit>week|month|quarter|year)\b|\b(?P<yesterday>yesterday)\b"
+)
+ROLLING_DAYS = {"week": 7, "month": 31, "quarter": 92, "year": 366}
+
+class EntityExtractor:
+    def __init__(self, companies=None):
+        self.companies = companies if companies is not None else KNOWN_COMPANIES
+
+    def extract(self, text):
+        '''Returns the same structure as XmlParser.parseTags on an entities answer, e.g.
+            {"symbol": "AAPL", "exchange": "NASDAQ", "industry": "Technology"}, or {} when nothing was found.
+        '''
+        entities = self.extract_all(text)
+        return entities[0] if entities else {}
+
+    def extract_all(self, text):
+        '''All the companies found in the text, in order of appearance, one entities dict per symbol.'''
+        known = {symbol: (exchange, industry) for symbol, exchange, industry in self.companies.values()}
+        found = {}
+        for _, _, symbol in self.mentions(text):
+            if symbol not in found:
+                found[symbol] = {"symbol": symbol}
+                if symbol in known:
+                    found[symbol]["exchange"], found[symbol]["industry"] = known[symbol]
+        return list(found.values())
+
+    def mentions(self, text):
+        '''Where companies are mentioned: a list of (start, end, symbol) spans, by position in the text.'''
+        import re
+        lowered = text.lower()
+        spans = []
+        for name, (symbol, _, _) in self.companies.items():
+            for match in re.finditer(r'\b' + re.escape(name) + r'\b', lowered):
+                spans.append((match.start(), match.end(), symbol))
+        known = {symbol for symbol, _, _ in self.companies.values()}
+        # In an all-caps input every word looks like a ticker, so only the symbols we know count there
+        letters = [character for character in text if character.isalpha()]
+        shouting = len(letters) > 20 and sum(character.isupper() for character in letters) > 0.6 * len(letters)
+        # $AAPL is always a ticker; a bare upper-case word only when it isn't a common abbreviation
+        for match in re.finditer(r'\$([A-Za-z]{1,5}(?:[.-][A-Za-z])?)\b|\b([A-Z]{1,5}(?:[.-][A-Z])?)\b', text):
+            symbol = (match.group(1) or match.group(2)).upper()
+            if match.group(2) and (symbol in NOT_TICKERS or (shouting and symbol not in known)):
+                continue
+            if match.group(2) and len(symbol) == 1 and symbol not in known:
+                continue
+            spans.append((match.start(), match.end(), symbol))
+        result = [] # Overlapping names (e.g. "coca-cola" and "coca cola") are kept once, the longest first
+        for span in sorted(spans, key=lambda span: (span[0], -span[1])):
+            if not result or span[0] >= result[-1][1]:
+                result.append(span)
+        return result
+
+    def date_range(self, text, today=None):
+        '''The period the text asks about, as ISO (start, end) dates, both inclusive, or (None, None) when it names none.
+            Several dates or periods give the range covering all of them (e.g. "from Jan 5, 2024 to March 2024").
+        '''
+        import re
+        from datetime import date, timedelta
+        today = today or date.today()
+        periods = []
+        for match in re.finditer(DATE_EXPRESSION, text, re.IGNORECASE):
+            group = match.groupdict()
+            try:
+                if group["iso"]:
+                    day = date.fromisoformat(group["iso"])
+                    periods.append((day, day))
+                elif group["us"]:
+                    month, day, year = (int(part) for part in group["us"].split("/"))
+                    periods.append((date(year, month, day),) * 2)
+                elif group["day_month"]:
+                    day = date(int(group["day_year"]), MONTHS[group["day_month"].lower()], int(group["day"]))
+                    periods.append((day, day))
+                elif group["month"]:
+                    year, month = int(group["month_year"]), MONTHS[group["month"].lower()]
+                    periods.append((date(year, month, 1), date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)))
+                elif group["quarter"]:
+                    year, first = int(group["quarter_year"]), 3 * int(group["quarter"]) - 2
+                    periods.append((date(year, first, 1), date(year + (first + 3) // 13, (first + 2) % 12 + 1, 1) - timedelta(days=1)))
+                elif group["year"]:
+                    if int(group["year"]) <= today.year: # "2030" is more likely a target or an amount than a date
+                        periods.append((date(int(group["year"]), 1, 1), min(date(int(group["year"]), 12, 31), today)))
+                elif group["days"]:
+                    periods.append((today - timedelta(days=int(group["days"])), today))
+                elif group["relative"]:
+                    if group["relative"].lower() == "this": # From the start of the current period
+                        starts = {"week": today - timedelta(days=today.weekday()), "month": today.replace(day=1),
+                                  "quarter": today.replace(month=3 * ((today.month - 1) // 3) + 1, day=1), "year": today.replace(month=1, day=1)}
+                        periods.append((starts[group["unit"].lower()], today))
+                    else: # "last month", "past year": the rolling period ending today
+                        periods.append((today - timedelta(days=ROLLING_DAYS[group["unit"].lower()]), today))
+                elif group["yesterday"]:
+                    periods.append((today - timedelta(days=1),) * 2)
+            except ValueError:
+                continue # Not a real date (e.g. 2024-13-45)
+        if not periods:
+            return None, None
+        return min(start for start, _ in periods).isoformat(), max(end for _, end in periods).isoformat()
+
+    def is_market_related(self, text, entities=None):
+        '''True when the input mentions a company, a ticker or a market term.'''
+        import re
+        if entities if entities is not None else self.extract(text):
+            return True
+        return bool(MARKET_TERMS & set(re.findall(r"[a-z&]+", text.lower())))
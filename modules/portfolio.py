@@ -0,0 +1,189 @@
+import re
+import contextvars
+from statistics import NormalDist
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+TRADING_DAYS = 252
+
+
+def normalize_weights(holdings):
+    '''{symbol: weight, percentage or dollar amount} -> (symbols, weights summing to 1).'''
+    symbols = [symbol.upper() for symbol in holdings]
+    weights = np.array([float(value) for value in holdings.values()])
+    total = weights.sum()
+    if not len(weights) or total == 0:
+        raise ValueError("The portfolio has no holdings")
+    return symbols, weights / total
+
+
+def parse_holdings(text, extractor, price=None):
+    '''Holdings named in a question, e.g. "40% AAPL, 35% MSFT and $5,000 of NVDA" -> {symbol: amount}.
+
+    A holding's amount is the percentage or amount written next to its ticker (after it, or else before it);
+    share counts ("100 shares of AAPL") are valued at price(symbol), the last close. When no amounts are given
+    at all, the holdings are equally weighted. Raises ValueError for shares we have no price for.
+    '''
+    number = r"(\d[\d,]*(?:\.\d+)?)"
+    amount = r"\$?\s*" + number + r"\s*(%|k\b|m\b)?"
+    shares = number + r"\s*shares?\b"
+    mentions = extractor.mentions(text)
+    holdings = {}
+    for i, (start, end, symbol) in enumerate(mentions):
+        after = text[end:mentions[i + 1][0] if i + 1 < len(mentions) else len(text)]
+        before = text[mentions[i - 1][1] if i > 0 else 0:start]
+        value = None
+        # Share counts first, so the "100" of "AAPL 100 shares" isn't read as an amount
+        match = re.match(r"\s*[:=]?\s*" + shares, after) or re.search(shares + r"\s*(?:of|in)?\s*$", before)
+        if match:
+            last_close = price(symbol) if price is not None else None
+            if not last_close:
+                raise ValueError(f"no price for {symbol} to value its {match.group(1)} shares")
+            value = float(match.group(1).replace(',', '')) * last_close
+        else:
+            match = re.match(r"\s*[:=]?\s*" + amount, after) or re.search(amount + r"\s*(?:of|in)?\s*$", before)
+            if match:
+                value = float(match.group(1).replace(',', '')) * {'k': 1e3, 'm': 1e6}.get((match.group(2) or '').lower(), 1)
+        if value is not None:
+            holdings[symbol] = (holdings.get(symbol) or 0) + value
+        else:
+            holdings.setdefault(symbol, None)
+    if all(value is None for value in holdings.values()):
+        return {symbol: 1.0 for symbol in holdings}
+    return {symbol: value for symbol, value in holdings.items() if value}
+
+
+def align_closes(series):
+    '''Aligns {symbol: (dates, closes)} on the union of their dates, carrying the last close forward.
+
+    Returns (dates, closes matrix of dates x symbols); dates before a symbol's first close are NaN.
+    '''
+    dates = np.unique(np.concatenate([np.asarray(d, dtype='M8[D]') for d, _ in series.values()]))
+    closes = np.full((len(dates), len(series)), np.nan)
+    for column, (symbol_dates, symbol_closes) in enumerate(series.values()):
+        closes[np.searchsorted(dates, np.asarray(symbol_dates, dtype='M8[D]')), column] = symbol_closes
+    # Forward fill: index of the last known row at or before each row, per column
+    known = np.where(~np.isnan(closes), np.arange(len(dates))[:, None], 0)
+    np.maximum.accumulate(known, axis=0, out=known)
+    return dates, closes[known, np.arange(closes.shape[1])]
+
+
+class PortfolioRisk:
+    '''Risk of a portfolio of holdings from the daily closes of the local price store, all in matrix operations.
+
+    Args:
+        price_source: Anything with get_price_arrays(symbol, period) returning bars with 'date' and 'close'
+            (DataAcquisition or PriceStore)
+        benchmark: Symbol the betas are measured against
+        period: History used for the estimates
+        max_workers: Symbols loaded in parallel (only the missing days are downloaded by the store)
+    '''
+    def __init__(self, price_source, benchmark='SPY', period='3y', max_workers=16):
+        self.price_source = price_source
+        self.benchmark = benchmark
+        self.period = period
+        self.max_workers = max_workers
+
+    def last_price(self, symbol):
+        '''Last close of a symbol from the price source (the same history analyze() uses), or None.'''
+        try:
+            bars = self.price_source.get_price_arrays(symbol, self.period)
+        except Exception as e:
+            print(f"Error loading prices for {symbol}: {e}")
+            return None
+        return float(bars['close'][-1]) if bars is not None and len(bars) else None
+
+    def load_returns(self, symbols):
+        '''Daily simple returns (days x symbols, benchmark last) over the common history, and the symbols without data.'''
+        wanted = list(dict.fromkeys(symbols + [self.benchmark]))
+        def closes(symbol):
+            try:
+                bars = self.price_source.get_price_arrays(symbol, self.period)
+            except Exception as e:
+                print(f"Error loading prices for {symbol}: {e}") # Reported as missing
+                return None
+            return (bars['date'], bars['close']) if bars is not None and len(bars) > 1 else None
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            loaded = dict(zip(wanted, executor.map(lambda symbol: contextvars.copy_context().run(closes, symbol), wanted)))
+        missing = [symbol for symbol, data in loaded.items() if data is None]
+        if self.benchmark in missing:
+            raise ValueError(f"No price history for the benchmark {self.benchmark}")
+        series = {symbol: data for symbol, data in loaded.items() if data is not None}
+        series[self.benchmark] = series.pop(self.benchmark) # Benchmark in the last column
+        dates, prices = align_closes(series)
+        prices = prices[~np.isnan(prices).any(axis=1)] # Only the days every holding already traded
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = prices[1:] / prices[:-1] - 1
+        return list(series), returns, missing
+
+    def analyze(self, holdings, confidence=0.95, horizon_days=1):
+        '''Risk report of the holdings ({symbol: weight or amount}).
+
+        Returns covariance-based volatility, historical and parametric VaR / expected shortfall (as positive
+        fractions of the portfolio over horizon_days), betas to the benchmark, contributions to risk and the
+        most correlated pairs.
+        '''
+        symbols, weights = normalize_weights(holdings)
+        columns, returns, missing = self.load_returns(symbols)
+        if len(returns) < 20:
+            raise ValueError("Not enough common price history to estimate the risk")
+        held = [symbol for symbol in symbols if symbol in columns]
+        if not held:
+            raise ValueError("No price history for any of the holdings")
+        weights = weights[[symbols.index(symbol) for symbol in held]]
+        weights = weights / weights.sum() # Holdings without prices are left out (and reported)
+        positions = returns[:, [columns.index(symbol) for symbol in held]]
+        benchmark = returns[:, -1]
+
+        # Covariance and correlation of the holdings in one pass over the centered returns
+        centered = positions - positions.mean(axis=0)
+        covariance = centered.T @ centered / (len(positions) - 1)
+        volatility = np.sqrt(np.diag(covariance))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            correlation = covariance / np.outer(volatility, volatility)
+
+        portfolio = positions @ weights
+        mean, sigma = portfolio.mean(), np.sqrt(weights @ covariance @ weights)
+        scale = np.sqrt(horizon_days)
+
+        # Historical VaR: the loss not exceeded on `confidence` of the days; expected shortfall: the average loss beyond it
+        cutoff = np.quantile(portfolio, 1 - confidence)
+        historical_var = -cutoff * scale
+        historical_es = -portfolio[portfolio <= cutoff].mean() * scale
+        # Parametric (normal) VaR and expected shortfall from the covariance
+        z = NormalDist().inv_cdf(confidence)
+        parametric_var = -(mean * horizon_days - z * sigma * scale)
+        parametric_es = -(mean * horizon_days - sigma * scale * np.exp(-z * z / 2) / np.sqrt(2 * np.pi) / (1 - confidence))
+
+        # Betas: covariance with the benchmark over its variance, for every holding at once
+        benchmark_centered = benchmark - benchmark.mean()
+        betas = centered.T @ benchmark_centered / (benchmark_centered @ benchmark_centered)
+
+        # Contribution to risk: weight x marginal risk (covariance row . weights / sigma); they add up to sigma
+        marginal = covariance @ weights / sigma
+        contributions = weights * marginal
+
+        upper = np.triu_indices(len(held), k=1)
+        order = np.argsort(-correlation[upper])[:5]
+        return {
+            'holdings': len(held),
+            'missing': [symbol for symbol in missing if symbol != self.benchmark],
+            'days': len(returns),
+            'confidence': confidence,
+            'horizon_days': horizon_days,
+            'annual_volatility': float(sigma * np.sqrt(TRADING_DAYS)),
+            'annual_return': float(mean * TRADING_DAYS),
+            'historical_var': float(historical_var),
+            'historical_es': float(historical_es),
+            'parametric_var': float(parametric_var),
+            'parametric_es': float(parametric_es),
+            'beta': float(weights @ betas),
+            'positions': {symbol: {
+                'weight': float(weights[i]),
+                'beta': float(betas[i]),
+                'annual_volatility': float(volatility[i] * np.sqrt(TRADING_DAYS)),
+                'risk_contribution': float(contributions[i] / sigma),
+            } for i, symbol in enumerate(held)},
+            'top_correlations': [(held[upper[0][k]], held[upper[1][k]], float(correlation[upper][k])) for k in order],
+        }
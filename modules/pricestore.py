@@ -0,0 +1,179 @@
+import os
+import json
+import time
+from datetime import datetime
+
+import numpy as np
+
+# Every price bar is stored as one fixed-size binary record, so a symbol's file can be memory-mapped
+# as a NumPy structured array and extended by simply appending bytes at the end of the file.
+PRICE_DTYPE = np.dtype([
+    ('date', '<M8[D]'),   # Trading day
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<f8'),
+])
+
+# Column names used by yfinance, so the DataFrames we build look exactly like the ones analyzers used to get
+PRICE_COLUMNS = {'open': 'Open', 'high': 'High', 'low': 'Low', 'close': 'Close', 'volume': 'Volume'}
+
+
+def period_start(period, today=None):
+    '''Translates a yfinance style period ('1y', '6mo', 'ytd', 'max'...) into the first calendar day it covers.'''
+    today = today or np.datetime64(datetime.today().date(), 'D')
+    if period == 'max':
+        return np.datetime64('1970-01-01', 'D')
+    if period == 'ytd':
+        return np.datetime64(str(today)[:4] + '-01-01', 'D')
+    units = {'d': 1, 'wk': 7, 'mo': 31, 'y': 366} # Slightly generous month/year lengths, so we never cut the first bar
+    for suffix, days in units.items():
+        if period.endswith(suffix) and period[:-len(suffix)].isdigit():
+            return today - np.timedelta64(int(period[:-len(suffix)]) * days, 'D')
+    raise ValueError(f"Unsupported period: {period}")
+
+
+def yfinance_fetcher(symbol, start, end):
+    '''Default fetcher: downloads daily bars in the half-open range [start, end) from Yahoo Finance.'''
+    import yfinance as yf # Imported here so the store itself can be used (and read) without yfinance installed
+    return yf.Ticker(symbol).history(start=str(start), end=str(end), interval='1d')
+
+
+class PriceStore:
+    '''Local on-disk store of daily OHLCV history, one append-only memory-mapped file per symbol.
+
+    Only the date ranges that are not on disk yet are requested from the fetcher, and reads return
+    zero-copy views over the memory-mapped file.
+    '''
+    def __init__(self, store_dir='price_store', fetcher=None, live_ttl=60):
+        self.store_dir = store_dir # Folder holding one <SYMBOL>.bin (bars) and one <SYMBOL>.json (metadata) per symbol
+        self.fetcher = fetcher or yfinance_fetcher # Function(symbol, start, end) returning a yfinance-like DataFrame
+        self.live_ttl = live_ttl # Seconds we keep today's (still incomplete) bar before asking for it again
+        self._maps = {} # Cache of open memory maps, keyed by symbol
+        self._live = {} # Cache of today's partial bar, keyed by symbol: (fetch time, records)
+        # The folder is only created with the first file we write, so creating a store (or just reading it) leaves no trace
+
+    def _path(self, symbol, extension):
+        return os.path.join(self.store_dir, f"{symbol.upper()}.{extension}")
+
+    def _load_meta(self, symbol):
+        # The metadata remembers which calendar days we already asked the fetcher for,
+        # so weekends, holidays and empty ranges are not requested over and over again.
+        try:
+            with open(self._path(symbol, 'json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_meta(self, symbol, meta):
+        os.makedirs(self.store_dir, exist_ok=True)
+        with open(self._path(symbol, 'json'), 'w') as f:
+            json.dump(meta, f)
+
+    def bars(self, symbol):
+        '''Returns every stored bar of a symbol as a read-only memory-mapped structured array.'''
+        symbol = symbol.upper()
+        if symbol not in self._maps:
+            path = self._path(symbol, 'bin')
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            if size == 0: # np.memmap can't map an empty file, so we return an empty array instead
+                self._maps[symbol] = np.empty(0, dtype=PRICE_DTYPE)
+            else:
+                self._maps[symbol] = np.memmap(path, dtype=PRICE_DTYPE, mode='r', shape=(size // PRICE_DTYPE.itemsize,))
+        return self._maps[symbol]
+
+    def _to_records(self, history):
+        # Converts a yfinance DataFrame into our binary records, dropping any timezone information
+        if history is None or len(history) == 0:
+            return np.empty(0, dtype=PRICE_DTYPE)
+        index = history.index
+        if getattr(index, 'tz', None) is not None:
+            index = index.tz_localize(None)
+        records = np.empty(len(history), dtype=PRICE_DTYPE)
+        records['date'] = np.asarray(index.values).astype('datetime64[D]')
+        for field, column in PRICE_COLUMNS.items():
+            records[field] = history[column].to_numpy(dtype='f8')
+        return records
+
+    def _write(self, symbol, records, mode):
+        # 'ab' appends new bars at the end of the file, 'wb' rewrites it (only needed for backfills)
+        self._maps.pop(symbol, None) # The old memory map no longer covers the whole file
+        path = self._path(symbol, 'bin')
+        tmp_path = path + '.tmp' if mode == 'wb' else path
+        os.makedirs(self.store_dir, exist_ok=True)
+        with open(tmp_path, mode) as f:
+            records.tofile(f)
+        if mode == 'wb':
+            os.replace(tmp_path, path) # Atomic swap, so readers never see a half-written file
+
+    def update(self, symbol, start, today=None):
+        '''Makes sure all completed bars from `start` up to yesterday are on disk, fetching only what is missing.'''
+        symbol = symbol.upper()
+        today = today or np.datetime64(datetime.today().date(), 'D')
+        yesterday = today - np.timedelta64(1, 'D')
+        meta = self._load_meta(symbol)
+        checked_from = np.datetime64(meta['checked_from'], 'D') if 'checked_from' in meta else None
+        checked_through = np.datetime64(meta['checked_through'], 'D') if 'checked_through' in meta else None
+
+        if checked_from is None: # Nothing stored yet, so we download the whole range once
+            records = self._to_records(self.fetcher(symbol, start, today))
+            self._write(symbol, records[records['date'] < today], 'wb')
+            checked_from, checked_through = start, yesterday
+        else:
+            # Forward fill: only the days after the last time we checked
+            if checked_through < yesterday:
+                records = self._to_records(self.fetcher(symbol, checked_through + np.timedelta64(1, 'D'), today))
+                stored = self.bars(symbol)
+                last_date = stored['date'][-1] if len(stored) else np.datetime64('NaT')
+                records = records[(records['date'] < today) & ~(records['date'] <= last_date)]
+                if len(records):
+                    self._write(symbol, records, 'ab')
+                checked_through = yesterday
+            # Backfill: a longer period than ever requested before, which means rewriting the file once
+            if start < checked_from:
+                records = self._to_records(self.fetcher(symbol, start, checked_from))
+                stored = self.bars(symbol)
+                if len(stored):
+                    records = records[records['date'] < stored['date'][0]]
+                if len(records):
+                    self._write(symbol, np.concatenate([records, np.asarray(stored)]), 'wb')
+                checked_from = start
+
+        self._save_meta(symbol, {'checked_from': str(checked_from), 'checked_through': str(checked_through)})
+        return self.bars(symbol)
+
+    def live_bar(self, symbol, today=None):
+        '''Returns today's partial bar (if the market already traded today), cached for `live_ttl` seconds.'''
+        symbol = symbol.upper()
+        today = today or np.datetime64(datetime.today().date(), 'D')
+        cached = self._live.get(symbol)
+        if cached and cached[0] > time.time() - self.live_ttl and cached[1] == today:
+            return cached[2]
+        records = self._to_records(self.fetcher(symbol, today, today + np.timedelta64(1, 'D')))
+        records = records[records['date'] == today]
+        self._live[symbol] = (time.time(), today, records)
+        return records
+
+    def get_price_arrays(self, symbol, period='1y'):
+        '''Returns the stored bars for the period as a zero-copy view over the memory-mapped file.
+
+        Individual columns are views as well, e.g. get_price_arrays('AAPL')['close'].
+        '''
+        start = period_start(period)
+        bars = self.update(symbol, start)
+        first = np.searchsorted(bars['date'], start) # Dates are sorted, so a binary search finds the slice
+        return bars[first:]
+
+    def get_history(self, symbol, period='1y', include_live=True):
+        '''Returns the period as a DataFrame with the same columns as yfinance's Ticker.history().'''
+        import pandas as pd
+        bars = self.get_price_arrays(symbol, period)
+        if include_live:
+            live = self.live_bar(symbol)
+            if len(live):
+                bars = np.concatenate([np.asarray(bars), live])
+        return pd.DataFrame(
+            {column: bars[field] for field, column in PRICE_COLUMNS.items()},
+            index=pd.DatetimeIndex(bars['date'], name='Date'),
+        )
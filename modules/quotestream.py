@@ -0,0 +1,300 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime
+
+import numpy as np
+
+import modules.tools as tools
+
+# Recent trades and the bars built from them are kept per symbol in fixed-size ring buffers: appending never
+# allocates, the oldest records are overwritten, and a quote lookup is a couple of array reads.
+TICK_DTYPE = np.dtype([
+    ('time', '<f8'),     # Epoch seconds
+    ('price', '<f8'),
+    ('volume', '<f8'),
+])
+BAR_DTYPE = np.dtype([
+    ('time', '<f8'),     # Epoch seconds of the start of the bar
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<f8'),
+])
+
+STREAM_SETTINGS = {
+    "tick_capacity": 4096, # Trades kept per symbol
+    "bar_capacity": 1440, # Bars kept per symbol (a full day of 1-minute bars)
+    "bar_seconds": 60,
+    "max_age": 300, # Seconds after which a symbol's last trade is too old to answer a quote with
+}
+
+
+class RingBuffer:
+    '''Fixed-size buffer of NumPy records; the newest record overwrites the oldest once full.'''
+    def __init__(self, capacity, dtype):
+        self.data = np.zeros(capacity, dtype=dtype)
+        self.capacity = capacity
+        self.count = 0 # Records written since the start (the next one goes to count % capacity)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, record):
+        self.data[self.count % self.capacity] = record
+        self.count += 1
+
+    def latest(self):
+        return self.data[(self.count - 1) % self.capacity] if self.count else None
+
+    def last(self, n=None):
+        '''The last n records (all by default), oldest first, as a copy.'''
+        size = len(self)
+        n = size if n is None else min(n, size)
+        end = self.count % self.capacity
+        indices = (np.arange(end - n, end) + self.capacity) % self.capacity
+        return self.data[indices]
+
+
+class SymbolBuffer:
+    '''Trades and bars of one symbol, with the day's high and low kept up to date.'''
+    def __init__(self, symbol, tick_capacity, bar_capacity, bar_seconds):
+        self.symbol = symbol
+        self.ticks = RingBuffer(tick_capacity, TICK_DTYPE)
+        self.bars = RingBuffer(bar_capacity, BAR_DTYPE)
+        self.bar_seconds = bar_seconds
+        self.bar = None # Bar being built: [start, open, high, low, close, volume]
+        self.day = None
+        self.day_high = self.day_low = np.nan
+        self.previous_close = np.nan # Last price of the previous day seen on the stream
+        self.lock = threading.Lock()
+
+    def on_trade(self, price, volume, timestamp):
+        with self.lock:
+            day = datetime.fromtimestamp(timestamp).date()
+            if day != self.day:
+                if self.ticks.count:
+                    self.previous_close = self.ticks.latest()['price']
+                self.day, self.day_high, self.day_low = day, price, price
+            else:
+                self.day_high, self.day_low = max(self.day_high, price), min(self.day_low, price)
+            self.ticks.append((timestamp, price, volume))
+            start = timestamp - timestamp % self.bar_seconds
+            if self.bar is not None and self.bar[0] != start:
+                self.bars.append(tuple(self.bar)) # The bar is complete once a trade of the next one arrives
+                self.bar = None
+            if self.bar is None:
+                self.bar = [start, price, price, price, price, volume]
+            else:
+                self.bar[2], self.bar[3] = max(self.bar[2], price), min(self.bar[3], price)
+                self.bar[4] = price
+                self.bar[5] += volume
+
+    def quote(self):
+        with self.lock:
+            tick = self.ticks.latest()
+            if tick is None:
+                return None
+            return {
+                "symbol": self.symbol,
+                "last_price": float(tick['price']),
+                "day_high": float(self.day_high),
+                "day_low": float(self.day_low),
+                "previous_close": None if np.isnan(self.previous_close) else float(self.previous_close),
+                "timestamp": datetime.fromtimestamp(tick['time']).strftime("%Y-%m-%d %H:%M:%S"),
+                "source": "stream",
+                "age": time.time() - float(tick['time']),
+            }
+
+    def recent_bars(self, n=None, include_partial=True):
+        with self.lock:
+            bars = self.bars.last(n)
+            if include_partial and self.bar is not None:
+                bars = np.concatenate([bars, np.array([tuple(self.bar)], dtype=BAR_DTYPE)])[-n if n else 0:]
+            return bars
+
+
+class QuoteStream:
+    '''In-memory quotes of the symbols a trade feed sends us (see WebSocketFeed and ReplayFeed).
+
+    Messages are Finnhub-style trade messages: {"type": "trade", "data": [{"s": "AAPL", "p": 190.1, "v": 100, "t": 1700000000000}]}.
+    '''
+    def __init__(self, **settings):
+        self.settings = {**STREAM_SETTINGS, **settings}
+        self.buffers = {}
+        self.lock = threading.Lock()
+        self.stats = {"messages": 0, "trades": 0, "quotes_served": 0, "quotes_missed": 0}
+
+    def buffer(self, symbol):
+        symbol = symbol.upper()
+        buffer = self.buffers.get(symbol)
+        if buffer is None:
+            with self.lock:
+                buffer = self.buffers.setdefault(symbol, SymbolBuffer(
+                    symbol, self.settings["tick_capacity"], self.settings["bar_capacity"], self.settings["bar_seconds"]))
+        return buffer
+
+    def _count(self, **changes):
+        # The feed thread and the request threads update the counters at the same time
+        with self.lock:
+            for name, change in changes.items():
+                self.stats[name] += change
+
+    def on_message(self, message):
+        '''Handles one feed message (a JSON string or an already parsed dict).'''
+        if isinstance(message, (str, bytes)):
+            try:
+                message = json.loads(message)
+            except ValueError:
+                return
+        if message.get("type") != "trade":
+            self._count(messages=1)
+            return # Pings and subscription acknowledgements
+        trades = 0
+        for trade in message.get("data") or []:
+            try:
+                self.buffer(trade["s"]).on_trade(float(trade["p"]), float(trade.get("v") or 0), trade["t"] / 1000)
+                trades += 1
+            except (KeyError, TypeError, ValueError):
+                continue
+        self._count(messages=1, trades=trades) # Once per message, not per trade
+
+    def quote(self, symbol, max_age=None):
+        '''Latest streamed quote of a symbol, or None when we have none recent enough (the REST tools answer then).'''
+        buffer = self.buffers.get(str(symbol).upper())
+        quote = buffer.quote() if buffer is not None else None
+        max_age = self.settings["max_age"] if max_age is None else max_age
+        if quote is None or quote["age"] > max_age:
+            self._count(quotes_missed=1)
+            return None
+        self._count(quotes_served=1)
+        return quote
+
+    def bars(self, symbol, n=None):
+        '''Recent bars of a symbol (oldest first, the bar in progress last) as a BAR_DTYPE array.'''
+        buffer = self.buffers.get(str(symbol).upper())
+        return buffer.recent_bars(n) if buffer is not None else np.empty(0, dtype=BAR_DTYPE)
+
+
+class WebSocketFeed:
+    '''Finnhub trade WebSocket feeding a QuoteStream; needs the optional websocket-client package.'''
+    def __init__(self, stream, symbols, url=None, reconnect_delay=1, max_reconnect_delay=60):
+        self.stream = stream
+        self.symbols = [symbol.upper() for symbol in symbols]
+        self.url = url or f"wss://ws.finnhub.io?token={os.getenv('FINNHUB_API_KEY')}"
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.running = False
+        self.app = None
+        self.thread = None
+
+    def _on_open(self, app):
+        for symbol in self.symbols:
+            app.send(json.dumps({"type": "subscribe", "symbol": symbol}))
+
+    def _run(self):
+        import websocket # Optional dependency (websocket-client), only needed when streaming
+        delay = self.reconnect_delay
+        while self.running:
+            started = time.time()
+            self.app = websocket.WebSocketApp(self.url, on_open=self._on_open, on_message=lambda app, message: self.stream.on_message(message),
+                                              on_error=lambda app, error: print(f"Quote stream error: {error}"))
+            self.app.run_forever(ping_interval=30)
+            if not self.running:
+                break
+            delay = self.reconnect_delay if time.time() - started > 60 else min(delay * 2, self.max_reconnect_delay) # Backoff when it keeps dropping
+            time.sleep(delay)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True, name="quote-websocket")
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.app is not None:
+            self.app.close()
+
+
+class ReplayFeed:
+    '''Replays recorded feed messages (a JSON lines file, or a list of messages) into a QuoteStream.
+
+    Stand-in for the live feed in development and load tests. Trade times are shifted to now, so replayed
+    quotes are fresh; speed=2 replays twice as fast, speed=None as fast as possible.
+    '''
+    def __init__(self, stream, source, speed=1.0, loop=False):
+        self.stream = stream
+        self.source = source
+        self.speed = speed
+        self.loop = loop
+        self.running = False
+        self.thread = None
+
+    def messages(self):
+        if isinstance(self.source, str):
+            with open(self.source) as f:
+                return [json.loads(line) for line in f if line.strip()]
+        return list(self.source)
+
+    def _run(self):
+        messages = self.messages()
+        times = [min((trade["t"] for trade in message.get("data") or []), default=None) for message in messages]
+        first = next((t for t in times if t is not None), None)
+        scale = 1 / self.speed if self.speed else 0 # Recorded milliseconds -> replayed milliseconds
+        while self.running:
+            start = time.time()
+            for message, t in zip(messages, times):
+                if not self.running:
+                    return
+                if t is not None:
+                    wait = (t - first) / 1000 * scale - (time.time() - start)
+                    if wait > 0:
+                        time.sleep(wait)
+                    # Recorded times moved to the replay clock
+                    message = {**message, "data": [{**trade, "t": start * 1000 + (trade["t"] - first) * scale} for trade in message["data"]]}
+                self.stream.on_message(message)
+            if not self.loop:
+                break
+        self.running = False
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True, name="quote-replay")
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+
+
+_stream = None
+_feed = None
+
+def start_stream(symbols=(), replay=None, url=None, speed=1.0, **settings):
+    '''Starts the quote stream and makes the quote tools read from it first.
+
+    Args:
+        symbols: Symbols to subscribe to on the WebSocket feed
+        replay: Recorded messages (JSON lines path or list) to replay instead of connecting to the feed
+        url: WebSocket URL (Finnhub by default, or a local replay server)
+        speed: Replay speed
+    '''
+    global _stream, _feed
+    stop_stream()
+    _stream = QuoteStream(**settings)
+    _feed = (ReplayFeed(_stream, replay, speed=speed) if replay is not None else WebSocketFeed(_stream, symbols, url=url)).start()
+    tools.set_quote_source(_stream.quote)
+    return _stream
+
+def stop_stream():
+    global _stream, _feed
+    if _feed is not None:
+        _feed.stop()
+    tools.set_quote_source(None)
+    _stream, _feed = None, None
+
+def get_stream():
+    return _stream
@@ -0,0 +1,129 @@
+import math
+import hashlib
+
+from modules.newsstore import tokenize
+
+
+class HashingEmbedder:
+    '''Local text embeddings without any model download: hashed word and word-pair counts, L2 normalized.'''
+    def __init__(self, dim=512):
+        self.dim = dim
+
+    def __call__(self, texts):
+        import numpy as np
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            terms = tokenize(text)
+            for feature in terms + [f"{a}_{b}" for a, b in zip(terms, terms[1:])]:
+                digest = hashlib.md5(feature.encode('utf-8')).digest()
+                matrix[row, int.from_bytes(digest[:4], 'little') % self.dim] += 1.0
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+
+class InsightIndex:
+    '''Retrieval index over stored texts: BM25 over an inverted index, optionally blended with embeddings.
+
+    Each document carries a symbol, a kind (e.g. 'stock' or 'news') and a timestamp, so searches can be
+    filtered by symbol and time. Embeddings (when an embedder is given) are kept in one NumPy matrix.
+    '''
+    def __init__(self, embedder=None, k1=1.5, b=0.75):
+        self.embedder = embedder # Callable(list of texts) -> matrix with one row per text; None disables vectors
+        self.k1 = k1 # BM25 term frequency saturation
+        self.b = b # BM25 document length normalization
+        self.docs = [] # Stored documents; the position in the list is the document id
+        self.postings = {} # term -> {document id: term frequency}
+        self.doc_lengths = []
+        self.total_length = 0
+        self._vectors = [] # Embedding rows not yet stacked into the matrix
+        self._matrix = None
+
+    def add(self, text, symbol=None, kind=None, timestamp=None, payload=None):
+        '''Indexes one text and returns its document id.'''
+        text = str(text)
+        doc_id = len(self.docs)
+        terms = tokenize(text)
+        self.docs.append({'text': text, 'symbol': symbol, 'kind': kind, 'timestamp': timestamp, 'payload': payload})
+        for term in terms:
+            postings = self.postings.setdefault(term, {})
+            postings[doc_id] = postings.get(doc_id, 0) + 1
+        self.doc_lengths.append(len(terms))
+        self.total_length += len(terms)
+        if self.embedder is not None:
+            self._vectors.append(self.embedder([text])[0])
+        return doc_id
+
+    @property
+    def matrix(self):
+        # Embeddings are stacked lazily, so adding many documents doesn't copy the matrix every time
+        import numpy as np
+        if self._vectors:
+            rows = np.vstack(self._vectors)
+            self._matrix = rows if self._matrix is None else np.vstack([self._matrix, rows])
+            self._vectors = []
+        return self._matrix
+
+    def _allowed(self, doc, symbols, kinds, since, until):
+        if symbols is not None and doc['symbol'] not in symbols:
+            return False
+        if kinds is not None and doc['kind'] not in kinds:
+            return False
+        if since is not None and (doc['timestamp'] is None or doc['timestamp'] < since):
+            return False
+        if until is not None and (doc['timestamp'] is None or doc['timestamp'] > until):
+            return False
+        return True
+
+    def bm25_scores(self, query, allowed=None):
+        '''Returns {document id: BM25 score} for the documents containing at least one query term.'''
+        scores = {}
+        count = len(self.docs)
+        if count == 0:
+            return scores
+        average_length = self.total_length / count or 1
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings.items():
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                length_norm = 1 - self.b + self.b * self.doc_lengths[doc_id] / average_length
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+        return scores
+
+    def search(self, query, k=5, symbol=None, kinds=None, since=None, until=None, vector_weight=0.5):
+        '''Top-k documents for the query, filtered by symbol(s), kind(s) and timestamp range.
+
+        Args:
+            query: Free text
+            k: Number of results
+            symbol: One symbol or a list of symbols, or None for all
+            kinds: List of document kinds, or None for all
+            since, until: Timestamp bounds (inclusive), compared with the timestamps given to add()
+            vector_weight: Share of the embedding similarity in the final score (only with an embedder)
+        '''
+        symbols = None if symbol is None else ({symbol} if isinstance(symbol, str) else set(symbol))
+        kinds = None if kinds is None else set(kinds)
+        filtered = symbols is not None or kinds is not None or since is not None or until is not None
+        allowed = None
+        if filtered:
+            allowed = {doc_id for doc_id, doc in enumerate(self.docs) if self._allowed(doc, symbols, kinds, since, until)}
+
+        scores = self.bm25_scores(query, allowed)
+        if scores: # BM25 scores are normalized to [0, 1] so they can be blended with cosine similarities
+            top = max(scores.values())
+            scores = {doc_id: score / top for doc_id, score in scores.items()}
+
+        if self.embedder is not None and self.docs:
+            import numpy as np
+            similarities = self.matrix @ self.embedder([query])[0]
+            candidates = np.fromiter(allowed, dtype=np.int64) if allowed is not None else np.arange(len(self.docs))
+            for doc_id in candidates:
+                similarity = float(similarities[doc_id])
+                if similarity > 0 or doc_id in scores:
+                    scores[int(doc_id)] = (1 - vector_weight) * scores.get(int(doc_id), 0.0) + vector_weight * similarity
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [{**self.docs[doc_id], 'score': score} for doc_id, score in ranked]
@@ -0,0 +1,339 @@
+import os
+import re
+import json
+import math
+import time
+import threading
+from collections import Counter, OrderedDict, deque
+
+from modules.newsstore import tokenize
+from modules.parser import EntityExtractor
+
+
+MARKET_AGENT = "Market Research Agent"
+SENTIMENT_AGENT = "Market News Sentiment Agent"
+
+# Intents the router can plan by itself, and the specialists each of them needs
+INTENT_AGENTS = {
+    "market": [MARKET_AGENT], # Quotes, price moves, financials, summaries
+    "sentiment": [SENTIMENT_AGENT], # News, headlines, sentiment, analyst recommendations
+    "both": [MARKET_AGENT, SENTIMENT_AGENT], # Overall picture / should I buy
+}
+LLM_INTENT = "llm" # Label of plans the router can't reproduce (no specialists, several tickers...): the LLM plans those
+
+# Keyword rules: the words that point to each intent
+INTENT_KEYWORDS = {
+    "market": {"price", "prices", "quote", "trading", "performance", "performing", "summary", "financials", "financial",
+               "earnings", "revenue", "income", "valuation", "score", "change", "chart", "moved", "move", "doing",
+               "high", "low", "volume", "dividend", "eps", "margin", "statement"},
+    "sentiment": {"news", "sentiment", "headlines", "headline", "mood", "saying", "say", "recommendation",
+                  "recommendations", "analysts", "analyst", "buzz", "press", "rumors", "opinion", "feel"},
+    "both": {"buy", "sell", "invest", "hold", "outlook", "overview", "everything", "worth", "recommend"},
+}
+
+
+def plan_intent(parsed_plan):
+    '''The intent label of a parsed plan (XmlParser.parse_all output), used to learn from the LLM's plans.'''
+    agents = {item["parameters"].get("agentName") for item in parsed_plan
+              if item.get("action") == "SpecializedAgent" and isinstance(item.get("parameters"), dict)}
+    for intent, intent_agents in INTENT_AGENTS.items():
+        if agents == set(intent_agents):
+            return intent
+    return LLM_INTENT
+
+
+class LinearIntentModel:
+    '''Small TF-IDF + multinomial logistic regression classifier, in plain Python (sparse dict features).'''
+    def __init__(self, epochs=30, learning_rate=0.5, l2=1e-4):
+        self.epochs = epochs
+        self.learning_rate = learning_rate
+        self.l2 = l2
+        self.idf = {}
+        self.classes = []
+        self.weights = {} # class -> {term: weight}
+        self.bias = {}
+
+    def features(self, text):
+        counts = Counter(tokenize(text))
+        vector = {term: (1 + math.log(count)) * self.idf[term] for term, count in counts.items() if term in self.idf}
+        norm = math.sqrt(sum(value * value for value in vector.values())) or 1.0
+        return {term: value / norm for term, value in vector.items()}
+
+    def fit(self, texts, labels):
+        documents = [set(tokenize(text)) for text in texts]
+        frequencies = Counter(term for document in documents for term in document)
+        self.idf = {term: math.log((1 + len(texts)) / (1 + count)) + 1 for term, count in frequencies.items()}
+        self.classes = sorted(set(labels))
+        self.weights = {label: {} for label in self.classes}
+        self.bias = {label: 0.0 for label in self.classes}
+        samples = [(self.features(text), label) for text, label in zip(texts, labels)]
+        for epoch in range(self.epochs):
+            rate = self.learning_rate / (1 + epoch * 0.1)
+            for vector, label in samples:
+                probabilities = self.predict_proba_vector(vector)
+                for cls in self.classes:
+                    gradient = probabilities[cls] - (1.0 if cls == label else 0.0)
+                    weights = self.weights[cls]
+                    for term, value in vector.items():
+                        weight = weights.get(term, 0.0)
+                        weights[term] = weight - rate * (gradient * value + self.l2 * weight)
+                    self.bias[cls] -= rate * gradient
+        return self
+
+    def predict_proba_vector(self, vector):
+        scores = {cls: self.bias[cls] + sum(self.weights[cls].get(term, 0.0) * value for term, value in vector.items())
+                  for cls in self.classes}
+        top = max(scores.values())
+        exps = {cls: math.exp(score - top) for cls, score in scores.items()}
+        total = sum(exps.values())
+        return {cls: value / total for cls, value in exps.items()}
+
+    def predict(self, text):
+        '''Returns (label, probability) of the most likely intent, or (None, 0.0) before training.'''
+        if not self.classes:
+            return None, 0.0
+        vector = self.features(text)
+        if not vector:
+            return None, 0.0
+        probabilities = self.predict_proba_vector(vector)
+        label = max(probabilities, key=probabilities.get)
+        return label, probabilities[label]
+
+
+class IntentRouter:
+    '''Plans the common single-ticker requests locally, so they don't need the orchestrator's LLM call.
+
+    Keyword rules decide first; when they can't, a linear model trained on the plans the LLM made before
+    (recorded with log_plan) gives an intent and a confidence. Below the threshold, route() returns None
+    and the orchestrator asks the LLM as usual.
+
+    The examples are kept in memory. Writing them to disk (they contain the users' raw questions) is opt-in:
+    with a log_file, they're appended to it and the router starts from it the next time.
+    '''
+    def __init__(self, agent_names, log_file=None, threshold=0.75, min_examples=30, retrain_every=50, max_examples=5000):
+        self.agent_names = set(agent_names) # Intents needing an agent the team doesn't have are never routed locally
+        self.log_file = log_file # Optional JSON lines file with the user inputs and the intents of the LLM's plans
+        self.threshold = threshold # Minimum confidence to skip the LLM
+        self.min_examples = min_examples # Logged plans needed before the model is used
+        self.retrain_every = retrain_every # New logged plans before the model is trained again
+        self.records = deque(maxlen=max_examples) # The latest examples, which the model is trained on
+        self.extractor = EntityExtractor()
+        self.model = LinearIntentModel()
+        self.examples = 0
+        self.new_examples = 0
+        self.training = False # A background training is running (at most one at a time)
+        self.lock = threading.Lock()
+        self.stats = {"routed_by_rules": 0, "routed_by_model": 0, "fallback": 0}
+        self.load_log()
+        self.train()
+
+    def rule_intent(self, user_input):
+        '''Intent from the keyword rules with its confidence, or (None, 0.0) when the rules don't decide.'''
+        terms = set(tokenize(user_input))
+        hits = {intent: len(terms & keywords) for intent, keywords in INTENT_KEYWORDS.items()}
+        if hits["both"] or (hits["market"] and hits["sentiment"]):
+            return "both", 0.8
+        if hits["market"] and not hits["sentiment"]:
+            return "market", 0.9
+        if hits["sentiment"] and not hits["market"]:
+            return "sentiment", 0.9
+        return None, 0.0
+
+    def classify(self, user_input):
+        '''Returns (intent, confidence, source) for the input.'''
+        intent, confidence = self.rule_intent(user_input)
+        if intent is not None:
+            return intent, confidence, "rules"
+        with self.lock:
+            intent, confidence = self.model.predict(user_input) if self.examples >= self.min_examples else (None, 0.0)
+        return intent, confidence, "model"
+
+    def build_plan(self, intent, user_input):
+        # Same structure XmlParser.parse_all returns for the LLM's plan; each specialist gets the user's question
+        return [{"action": "SpecializedAgent", "parameters": {"agentName": agent_name, "user_input": user_input}}
+                for agent_name in INTENT_AGENTS[intent]]
+
+    def route(self, user_input):
+        '''A parsed plan for the input, or None when the LLM should plan it.'''
+        entities = self.extractor.extract_all(user_input)
+        if len(entities) != 1: # No ticker or several (comparisons...): left to the LLM
+            return self._fallback()
+        intent, confidence, source = self.classify(user_input)
+        if intent is None or intent == LLM_INTENT or confidence < self.threshold:
+            return self._fallback()
+        if not set(INTENT_AGENTS[intent]) <= self.agent_names:
+            return self._fallback()
+        with self.lock:
+            self.stats["routed_by_rules" if source == "rules" else "routed_by_model"] += 1
+        return self.build_plan(intent, user_input)
+
+    def _fallback(self):
+        with self.lock:
+            self.stats["fallback"] += 1
+        return None
+
+    def load_log(self):
+        '''Loads the latest examples of the plan log (when there is one).'''
+        if not self.log_file or not os.path.exists(self.log_file):
+            return
+        with open(self.log_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    self.records.append(json.loads(line))
+                except ValueError:
+                    continue # A partly written line
+
+    def log_plan(self, user_input, parsed_plan):
+        '''Records the LLM's plan for this input as a training example; retrains once enough new ones came in.'''
+        record = {"user_input": user_input, "intent": plan_intent(parsed_plan)}
+        with self.lock:
+            self.records.append(record)
+            if self.log_file:
+                with open(self.log_file, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record) + "\n")
+            self.new_examples += 1
+            retrain = self.new_examples >= self.retrain_every and not self.training
+            if retrain: # Claimed under the lock, so the requests arriving during the training don't start another one
+                self.training = True
+                self.new_examples = 0
+        if retrain: # Trained in the background, the current request doesn't wait for it
+            threading.Thread(target=self._train_in_background, daemon=True).start()
+
+    def _train_in_background(self):
+        try:
+            self.train()
+        finally:
+            with self.lock:
+                self.training = False
+
+    def train(self, records=None):
+        '''Trains the model on the given records, or on the recorded examples.'''
+        if records is None:
+            with self.lock:
+                records = list(self.records)
+        if not records or len({record["intent"] for record in records}) < 2:
+            return False
+        model = LinearIntentModel().fit([record["user_input"] for record in records], [record["intent"] for record in records])
+        with self.lock:
+            self.model = model
+            self.examples = len(records)
+        return True
+
+
+# Dates in user inputs and plans: ISO and US dates, "Jan 5, 2024", "March 2024", quarters, years and relative days
+DATE_PATTERN = re.compile(
+    r"\b\d{4}-\d{2}-\d{2}\b|\b\d{1,2}/\d{1,2}/\d{2,4}\b"
+    r"|\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.? \d{1,2}(?:st|nd|rd|th)?(?:,? \d{4})?\b"
+    r"|\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]* \d{4}\b"
+    r"|\bq[1-4] \d{4}\b|\b(?:19|20)\d{2}\b"
+    r"|\b(?:today|yesterday|tomorrow|(?:this|last|next|past) (?:week|month|quarter|year))\b",
+    re.IGNORECASE)
+
+
+class PlanTemplateCache:
+    '''Caches the orchestrator's plans per normalized intent, so the same kind of question about another
+    ticker or date reuses a plan instead of asking the LLM again.
+
+    Inputs are normalized by replacing the companies (names or tickers) with {TICKER0}, {TICKER1}... and the dates
+    with {DATE0}, {DATE1}... in order of appearance. The plan is stored with the same placeholders and filled in
+    with the new input's values on a hit. Entries are evicted least-recently-used first, and expire after ttl seconds.
+    '''
+    def __init__(self, max_entries=1000, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.extractor = EntityExtractor()
+        self.entries = OrderedDict() # template key -> (expires at, plan with placeholders); least recently used first
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+
+    def normalize(self, text):
+        '''Returns (template, values): the text with placeholders, and {placeholder: value in this text}.'''
+        spans = [(start, end, "TICKER", symbol) for start, end, symbol in self.extractor.mentions(text)]
+        spans += [(match.start(), match.end(), "DATE", match.group(0)) for match in DATE_PATTERN.finditer(text)
+                  if not any(start < match.end() and match.start() < end for start, end, _, _ in spans)]
+        spans.sort()
+        values, pieces, position, numbers, seen = {}, [], 0, {"TICKER": 0, "DATE": 0}, {}
+        for start, end, kind, value in spans:
+            key = (kind, value.lower())
+            if key not in seen: # The same company or date mentioned twice gets the same placeholder
+                seen[key] = "{%s%d}" % (kind, numbers[kind])
+                numbers[kind] += 1
+                values[seen[key]] = value
+            pieces.append(text[position:start])
+            pieces.append(seen[key])
+            position = end
+        pieces.append(text[position:])
+        template = re.sub(r"\s+", " ", re.sub(r"[^\w{}$&-]+", " ", "".join(pieces).lower())).strip()
+        return template, values
+
+    def abstract(self, value, replacements):
+        # Puts placeholders back into one plan parameter, wherever the original values show up
+        if isinstance(value, str):
+            for original, placeholder in replacements:
+                value = re.sub(r"(?<![\w$])\$?" + re.escape(original) + r"\b", placeholder, value, flags=re.IGNORECASE)
+            return value
+        if isinstance(value, dict):
+            return {key: self.abstract(item, replacements) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.abstract(item, replacements) for item in value]
+        return value
+
+    def instantiate(self, value, values):
+        if isinstance(value, str):
+            for placeholder, replacement in values.items():
+                value = value.replace(placeholder, replacement)
+            return value
+        if isinstance(value, dict):
+            return {key: self.instantiate(item, values) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.instantiate(item, values) for item in value]
+        return value
+
+    def get(self, user_input):
+        '''The cached plan for this kind of input, filled in with its tickers and dates, or None.'''
+        template, values = self.normalize(user_input)
+        with self.lock:
+            entry = self.entries.get(template)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self.entries[template]
+                self.stats["expired"] += 1
+                entry = None
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(template)
+            self.stats["hits"] += 1
+        return self.instantiate(entry[1], values)
+
+    def put(self, user_input, parsed_plan):
+        '''Stores the LLM's plan for this input. Only self-contained plans made of specialist calls are cached,
+            for inputs naming at least one company (their plan doesn't depend on the conversation).'''
+        steps = [item for item in parsed_plan if item.get("action") != "Thought"]
+        if not steps or any(item.get("action") != "SpecializedAgent" or "error" in item for item in steps):
+            return False
+        template, values = self.normalize(user_input)
+        if not any(placeholder.startswith("{TICKER") for placeholder in values):
+            return False
+        # Company names and tickers of the input both map to their placeholder, longest first
+        replacements = []
+        for placeholder, value in values.items():
+            replacements.append((value, placeholder))
+            if placeholder.startswith("{TICKER"):
+                symbol = self.extractor.extract(value).get("symbol")
+                names = [name for name, company in self.extractor.companies.items() if company[0] == symbol]
+                replacements += [(other, placeholder) for other in [symbol] + names if other and other.lower() != value.lower()]
+        replacements.sort(key=lambda item: len(item[0]), reverse=True)
+        plan = [{"action": item["action"], "parameters": self.abstract(item["parameters"], replacements)} for item in steps]
+        with self.lock:
+            self.entries[template] = (time.monotonic() + self.ttl, plan)
+            self.entries.move_to_end(template)
+            self.stats["stores"] += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats["evictions"] += 1
+        return True
+
+    def metrics(self):
+        with self.lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {**self.stats, "entries": len(self.entries), "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0}
@@ -0,0 +1,371 @@
+import os
+import re
+import time
+import pickle
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from modules.parser import KNOWN_COMPANIES
+from modules.tools import FinancialScore, IncomeStatement, StockPriceChange, StockQuote
+
+
+# Default universe: the companies the entity extractor knows, with their exchange and sector
+UNIVERSE = {symbol: (exchange, sector) for symbol, exchange, sector in KNOWN_COMPANIES.values()}
+
+# Numeric columns of the screener table and where they come from
+PRICE_CHANGES = {'1D': 'change_1d', '5D': 'change_5d', '1M': 'change_1m', '3M': 'change_3m', '6M': 'change_6m',
+                 'ytd': 'change_ytd', '1Y': 'change_1y'} # StockPriceChange fields (percent) -> columns
+RATIO_COLUMNS = ['profit_margin', 'return_on_assets', 'return_on_equity', 'current_ratio', 'debt_to_equity',
+                 'pe_ratio', 'price_to_sales', 'price_to_book', 'overall_score'] # From FinancialAnalyzer.analyze_universe
+CATEGORY_COLUMNS = ['sector', 'exchange'] # Columns with bitmap indexes
+
+# Phrases of a screening question and the column they refer to (checked in order, the first match wins)
+METRIC_PATTERNS = [
+    (r"piotroski(?:\s+f)?(?:[\s-]*score)?", 'piotroski_score'),
+    (r"altman(?:\s+z)?(?:[\s-]*score)?|z[\s-]score", 'altman_z_score'),
+    (r"p\s*/\s*e(?:\s+ratio)?|pe\s+ratio|price[\s-]to[\s-]earnings", 'pe_ratio'),
+    (r"p\s*/\s*s|price[\s-]to[\s-]sales", 'price_to_sales'),
+    (r"p\s*/\s*b|price[\s-]to[\s-]book", 'price_to_book'),
+    (r"return\s+on\s+equity|\broe\b", 'return_on_equity'),
+    (r"return\s+on\s+assets|\broa\b", 'return_on_assets'),
+    (r"current\s+ratio", 'current_ratio'),
+    (r"debt[\s-]to[\s-]equity|\bd\s*/\s*e\b|leverage", 'debt_to_equity'),
+    (r"revenue\s+growth|sales\s+growth", 'revenue_growth'),
+    (r"earnings\s+per\s+share|\beps\b", 'eps'),
+    (r"(?:profit|net)\s+margin|margins?", 'profit_margin'),
+    (r"health\s+score|financial\s+health", 'overall_score'),
+]
+MOMENTUM_PATTERN = (r"(?:(\d+)[\s-]*(day|week|month|year|d|w|m|y)s?[\s-]+|(ytd|year[\s-]to[\s-]date)\s+)?"
+                    r"(?:price\s+)?(?:momentum|performance|returns?|change|gains?)")
+MOMENTUM_PERIODS = {('1', 'day'): 'change_1d', ('5', 'day'): 'change_5d', ('1', 'week'): 'change_5d',
+                    ('1', 'month'): 'change_1m', ('3', 'month'): 'change_3m', ('6', 'month'): 'change_6m',
+                    ('1', 'year'): 'change_1y', ('12', 'month'): 'change_1y'}
+PERIOD_UNITS = {'d': 'day', 'w': 'week', 'm': 'month', 'y': 'year'}
+SECTOR_WORDS = {
+    'tech': 'Technology', 'technology': 'Technology', 'software': 'Technology', 'semiconductor': 'Technology',
+    'bank': 'Financial Services', 'banks': 'Financial Services', 'financials': 'Financial Services',
+    'energy': 'Energy', 'oil': 'Energy', 'healthcare': 'Healthcare', 'health care': 'Healthcare', 'pharma': 'Healthcare',
+    'industrial': 'Industrials', 'industrials': 'Industrials', 'media': 'Communication Services',
+    'communication': 'Communication Services', 'retail': 'Consumer Defensive', 'staples': 'Consumer Defensive',
+    'consumer cyclical': 'Consumer Cyclical', 'consumer defensive': 'Consumer Defensive',
+}
+COMPARATORS = [(r"between", 'between'), (r">=|at\s+least|no\s+less\s+than", '>='), (r"<=|at\s+most|no\s+more\s+than", '<='),
+               (r">|above|over|greater\s+than|more\s+than|higher\s+than|exceeds?", '>'),
+               (r"<|below|under|less\s+than|lower\s+than", '<'), (r"=|equal\s+to", '==')]
+NUMBER = r"(-?\d+(?:\.\d+)?)\s*(%?)"
+# "a P/E of 20 or less": a bound given by a trailing "or less/or more" (a bare "of 20" is no condition, an exact
+# float match would select almost nothing)
+OR_BOUND = r"(?:\bof\s+|=\s*)?" + NUMBER + r"\s+or\s+(less|lower|below|under|fewer|more|higher|above|greater|over)\b"
+FRACTION_COLUMNS = {'profit_margin', 'return_on_assets', 'return_on_equity'} # Stored as fractions, asked as percentages
+
+
+def _first(result):
+    # FMP answers with a list of records (newest first) or, for some endpoints, one record
+    if isinstance(result, list):
+        return result[0] if result and isinstance(result[0], dict) else {}
+    return result if isinstance(result, dict) else {}
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _momentum_column(match):
+    count, unit, ytd = match.groups()
+    if ytd:
+        return 'change_ytd'
+    if count:
+        return MOMENTUM_PERIODS.get((count, PERIOD_UNITS.get(unit, unit)), 'change_1m')
+    return 'change_1m' # "momentum" alone: the last month
+
+
+def _threshold(column, number, percent):
+    value = float(number)
+    if column in FRACTION_COLUMNS and (percent or abs(value) > 1): # "margin above 20%" means 0.2
+        value /= 100
+    return value
+
+
+def parse_screen(text):
+    '''Turns a screening question into (criteria, sort_by, descending, limit).
+
+    criteria is a list of (column, operator, value), e.g. "tech names with a Piotroski score above 7 and
+    positive 1-month momentum" -> [('sector', '==', 'Technology'), ('piotroski_score', '>', 7.0), ('change_1m', '>', 0.0)].
+    '''
+    lowered = text.lower()
+    criteria, mentioned = [], []
+    sectors = list(dict.fromkeys(sector for word, sector in SECTOR_WORDS.items() if re.search(r'\b' + word + r'\b', lowered)))
+    if sectors: # "tech or energy stocks": one condition matching any of the sectors (the criteria are ANDed)
+        criteria.append(('sector', '==', sectors[0] if len(sectors) == 1 else sectors))
+    mentions = [] # (start, end, column) of every metric named in the question
+    for pattern, column in METRIC_PATTERNS + [(MOMENTUM_PATTERN, None)]: # Momentum last, so "return on equity" isn't a return
+        for match in re.finditer(pattern, lowered):
+            if not any(start < match.end() and match.start() < end for start, end, _ in mentions):
+                mentions.append((match.start(), match.end(), column or _momentum_column(match)))
+    mentions.sort()
+    for i, (start, end, column) in enumerate(mentions):
+        # The condition is in the words right after the metric ("score above 7"), or an adjective before it ("positive momentum")
+        following = lowered[end:mentions[i + 1][0] if i + 1 < len(mentions) else len(lowered)][:60]
+        preceding = lowered[max(0, start - 25):start]
+        condition = None
+        match = re.search(OR_BOUND, following)
+        if match:
+            operator = '<=' if match.group(3) in ('less', 'lower', 'below', 'under', 'fewer') else '>='
+            condition = (column, operator, _threshold(column, match.group(1), match.group(2)))
+        for pattern, operator in COMPARATORS if condition is None else []:
+            if operator == 'between':
+                match = re.search(r"\bbetween\s+" + NUMBER + r"\s+and\s+" + NUMBER, following)
+                if match:
+                    percent = bool(match.group(2) or match.group(4))
+                    condition = (column, 'between', (_threshold(column, match.group(1), percent), _threshold(column, match.group(3), percent)))
+                    break
+                continue
+            match = re.search(r"(?:" + pattern + r")\s*" + NUMBER, following)
+            if match:
+                condition = (column, operator, _threshold(column, match.group(1), match.group(2)))
+                break
+        if condition is None and re.search(r"\b(positive|rising|up|growing)\b", preceding + following[:20]):
+            condition = (column, '>', 0.0)
+        elif condition is None and re.search(r"\b(negative|falling|down|declining)\b", preceding + following[:20]):
+            condition = (column, '<', 0.0)
+        if condition is not None:
+            criteria.append(condition)
+        mentioned.append(column)
+    ascending = bool(re.search(r"\b(lowest|cheapest|smallest)\b|(?<!at\s)\bleast\b", lowered)) # Not "at least"
+    sort_by = next((column for column, operator, _ in criteria if column not in CATEGORY_COLUMNS), mentioned[0] if mentioned else None)
+    limit = re.search(r"\btop\s+(\d+)\b", lowered)
+    return criteria, sort_by, not ascending, int(limit.group(1)) if limit else 20
+
+
+class ScreenerTable:
+    '''Column table of screening metrics with an index per column, built once and queried many times.
+
+    Numeric columns get a sorted index (the symbols ordered by value), so a range condition is two binary
+    searches; categorical columns (sector, exchange) get one bitmap per value. Every condition becomes a
+    bitmap over the symbols and a multi-criteria query is the AND of those bitmaps.
+    '''
+    def __init__(self, rows):
+        self.symbols = np.array(sorted(rows))
+        self.size = len(self.symbols)
+        columns = sorted({column for row in rows.values() for column in row})
+        self.numeric = {} # column -> float array (NaN when unknown)
+        self.sorted_index = {} # column -> (row order by value, sorted values), without the NaNs
+        self.ranks = {} # column -> position of each row in the sorted order (unknown values last)
+        self.bitmaps = {} # column -> {lower-case value: packed bitmap}
+        self.labels = {} # column -> value of each row, for the results
+        for column in columns:
+            values = [rows[symbol].get(column) for symbol in self.symbols]
+            if column in CATEGORY_COLUMNS:
+                self.labels[column] = values
+                self.bitmaps[column] = {}
+                for value in set(str(v).lower() for v in values if v is not None):
+                    self.bitmaps[column][value] = np.packbits(np.array([v is not None and str(v).lower() == value for v in values]))
+                continue
+            array = np.array([_number(v) for v in values], dtype=float)
+            known = np.flatnonzero(~np.isnan(array))
+            order = known[np.argsort(array[known], kind='stable')]
+            ranks = np.full(self.size, self.size, dtype=np.int64)
+            ranks[order] = np.arange(len(order))
+            self.numeric[column] = array
+            self.sorted_index[column] = (order, array[order])
+            self.ranks[column] = ranks
+
+    def _range_bitmap(self, column, operator, value):
+        order, values = self.sorted_index[column]
+        if operator == 'between':
+            low, high = np.searchsorted(values, value[0], 'left'), np.searchsorted(values, value[1], 'right')
+        elif operator == '>':
+            low, high = np.searchsorted(values, value, 'right'), len(values)
+        elif operator == '>=':
+            low, high = np.searchsorted(values, value, 'left'), len(values)
+        elif operator == '<':
+            low, high = 0, np.searchsorted(values, value, 'left')
+        elif operator == '<=':
+            low, high = 0, np.searchsorted(values, value, 'right')
+        elif operator == '==':
+            low, high = np.searchsorted(values, value, 'left'), np.searchsorted(values, value, 'right')
+        else:
+            raise ValueError(f"Unsupported operator: {operator}")
+        bits = np.zeros(self.size, dtype=bool)
+        bits[order[low:high]] = True
+        return np.packbits(bits)
+
+    def _category_bitmap(self, column, value):
+        wanted = value if isinstance(value, (list, tuple, set)) else [value]
+        bitmap = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        for item in wanted:
+            bitmap |= self.bitmaps[column].get(str(item).lower(), 0)
+        return bitmap
+
+    def has(self, column):
+        '''Whether the table can screen on a column: it exists and at least one symbol has a value.'''
+        return column in self.bitmaps or (column in self.sorted_index and len(self.sorted_index[column][0]) > 0)
+
+    def bitmap(self, column, operator, value):
+        '''Bitmap of the rows meeting one condition; an unknown column matches nothing.'''
+        if column in self.bitmaps:
+            return self._category_bitmap(column, value)
+        if column in self.sorted_index:
+            return self._range_bitmap(column, operator, value)
+        return np.zeros((self.size + 7) // 8, dtype=np.uint8)
+
+    def select(self, criteria, sort_by=None, descending=True, limit=20):
+        '''Row positions meeting all the criteria, ordered by sort_by (unknown values last).'''
+        if not self.size:
+            return np.array([], dtype=np.int64)
+        bitmap = np.full((self.size + 7) // 8, 0xFF, dtype=np.uint8)
+        for column, operator, value in criteria:
+            bitmap &= self.bitmap(column, operator, value)
+        rows = np.flatnonzero(np.unpackbits(bitmap, count=self.size))
+        if sort_by in self.ranks:
+            ranks = self.ranks[sort_by][rows]
+            if descending: # Known values from the highest down, unknown ones still at the end
+                ranks = np.where(ranks == self.size, -1, ranks)
+                rows = rows[np.argsort(-ranks, kind='stable')]
+            else:
+                rows = rows[np.argsort(ranks, kind='stable')]
+        return rows[:limit] if limit else rows
+
+    def row(self, position, columns=None):
+        record = {'symbol': str(self.symbols[position])}
+        for column in columns if columns is not None else list(self.bitmaps) + list(self.numeric):
+            if column in self.numeric:
+                value = self.numeric[column][position]
+                record[column] = None if np.isnan(value) else float(value)
+            elif column in self.labels:
+                record[column] = self.labels[column][position]
+        return record
+
+
+class Screener:
+    '''Stock screener over a precomputed local table of fundamentals, scores and price changes.
+
+    The table is built in bulk (FinancialScore, IncomeStatement and StockPriceChange for every symbol, plus the
+    FinancialAnalyzer ratios when an analyzer is given), saved to disk and refreshed in the background once it's
+    older than max_age_hours, so screening questions are answered from the indexes in milliseconds.
+    '''
+    def __init__(self, table_file='screener_table.pkl', universe=None, financial_analyzer=None, max_age_hours=24, max_workers=8):
+        self.table_file = table_file
+        self.universe = universe if universe is not None else UNIVERSE # {symbol: (exchange, sector)}
+        self.financial_analyzer = financial_analyzer # Optional FinancialAnalyzer, for the ratio columns (analyze_universe)
+        self.max_age_hours = max_age_hours
+        self.max_workers = max_workers # Symbols fetched in parallel when building the table
+        self.rows = {} # symbol -> {column: value}
+        self.built_at = None
+        self.table = ScreenerTable({})
+        self.refreshing = False # A background refresh is running
+        self.lock = threading.Lock()
+        self.load_table()
+
+    def load_table(self):
+        try:
+            if os.path.exists(self.table_file):
+                with open(self.table_file, 'rb') as f:
+                    data = pickle.load(f)
+                self.rows, self.built_at = data.get('rows', {}), data.get('built_at')
+                self.table = ScreenerTable(self.rows) # Indexes are rebuilt on load, they're cheap
+        except Exception as e:
+            print(f"Error loading screener table: {e}")
+
+    def save_table(self):
+        try:
+            with open(self.table_file, 'wb') as f:
+                pickle.dump({'rows': self.rows, 'built_at': self.built_at}, f)
+        except Exception as e:
+            print(f"Error saving screener table: {e}")
+
+    def fetch_row(self, symbol):
+        '''Screening metrics of one symbol from our FMP tools (missing values are left out).'''
+        exchange, sector = self.universe.get(symbol, (None, None))
+        row = {'exchange': exchange, 'sector': sector}
+        score = _first(FinancialScore().invoke(symbol=symbol))
+        row['piotroski_score'] = _number(score.get('piotroskiScore'))
+        row['altman_z_score'] = _number(score.get('altmanZScore'))
+        statements = IncomeStatement().invoke(symbol=symbol)
+        statements = statements if isinstance(statements, list) else [statements] if isinstance(statements, dict) else []
+        latest = statements[0] if statements and isinstance(statements[0], dict) else {}
+        previous = statements[1] if len(statements) > 1 and isinstance(statements[1], dict) else {}
+        revenue, net_income = _number(latest.get('revenue')), _number(latest.get('netIncome'))
+        row['revenue'], row['net_income'], row['eps'] = revenue, net_income, _number(latest.get('eps'))
+        row['profit_margin'] = net_income / revenue if revenue else np.nan # Replaced by the analyzer's ratio when we have it
+        previous_revenue = _number(previous.get('revenue'))
+        row['revenue_growth'] = (revenue / previous_revenue - 1) * 100 if previous_revenue else np.nan
+        quote = _first(StockQuote().invoke(symbol=symbol))
+        price, market_cap = _number(quote.get('price')), _number(quote.get('marketCap'))
+        # Valuation ratios from the quote and the latest statement (the analyzer's ratios replace them when we have them)
+        row['pe_ratio'] = price / row['eps'] if row['eps'] > 0 else np.nan # No meaningful P/E on losses
+        row['price_to_sales'] = market_cap / revenue if revenue > 0 else np.nan
+        changes = _first(StockPriceChange().invoke(symbol=symbol))
+        for field, column in PRICE_CHANGES.items():
+            row[column] = _number(changes.get(field))
+        return row
+
+    def refresh(self, symbols=None):
+        '''Rebuilds the whole table (tool calls in parallel) and saves it; returns the number of symbols.'''
+        symbols = list(dict.fromkeys(symbols if symbols is not None else self.universe))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            rows = dict(zip(symbols, executor.map(lambda symbol: contextvars.copy_context().run(self.fetch_row, symbol), symbols)))
+        if self.financial_analyzer is not None:
+            ratios = self.financial_analyzer.analyze_universe(symbols)
+            if ratios is not None:
+                for symbol in symbols:
+                    for column in RATIO_COLUMNS:
+                        if column in ratios.columns and not np.isnan(ratios.at[symbol, column]):
+                            rows[symbol][column] = float(ratios.at[symbol, column])
+        table = ScreenerTable(rows)
+        with self.lock:
+            self.rows, self.table, self.built_at = rows, table, time.time()
+        self.save_table()
+        return len(rows)
+
+    def is_stale(self):
+        return self.built_at is None or time.time() - self.built_at > self.max_age_hours * 3600
+
+    def _refresh_in_background(self):
+        with self.lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+        def run():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error refreshing screener table: {e}")
+            finally:
+                with self.lock:
+                    self.refreshing = False
+        threading.Thread(target=run, daemon=True, name="screener-refresh").start()
+
+    def prepare(self):
+        '''Starts building the table in the background when there's none or it's stale (e.g. at server startup).'''
+        if not self.rows or self.is_stale():
+            self._refresh_in_background() # Queries keep using the previous table meanwhile
+
+    def current_table(self):
+        '''The table to query, never built inside a request: empty until the first background build is done.'''
+        self.prepare()
+        return self.table
+
+    def unavailable(self, criteria):
+        '''Columns of the criteria the current table has no values for (e.g. ratios that need a FinancialAnalyzer).'''
+        table = self.current_table()
+        return list(dict.fromkeys(column for column, _, _ in criteria if not table.has(column)))
+
+    def screen(self, criteria, sort_by=None, descending=True, limit=20):
+        '''Symbols meeting all the criteria, as a list of {symbol, sector, criteria and sort columns...}.'''
+        table = self.current_table()
+        columns = list(dict.fromkeys(['sector'] + [column for column, _, _ in criteria] + ([sort_by] if sort_by else [])))
+        return [table.row(position, columns) for position in table.select(criteria, sort_by, descending, limit)]
+
+    def screen_text(self, question):
+        '''Screens for a question in plain words; returns (criteria, results), with no results when nothing was understood.'''
+        criteria, sort_by, descending, limit = parse_screen(question)
+        if not criteria:
+            return criteria, []
+        return criteria, self.screen(criteria, sort_by, descending, limit)
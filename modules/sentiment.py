@@ -0,0 +1,153 @@
+import os
+import pickle
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+# NLTK resources needed for sentiment analysis, with the path nltk.data.find() uses to look them up
+NLTK_RESOURCES = {
+    'vader_lexicon': 'sentiment/vader_lexicon.zip',
+    'punkt': 'tokenizers/punkt',
+    'stopwords': 'corpora/stopwords',
+}
+_checked_resources = set() # Resources already confirmed in this process, so we only look them up once
+
+
+def ensure_nltk_resources(*names):
+    '''Downloads the given NLTK resources only if they're not installed yet (instead of on every import).'''
+    import nltk
+    for name in names or NLTK_RESOURCES:
+        if name in _checked_resources:
+            continue
+        try:
+            nltk.data.find(NLTK_RESOURCES[name])
+        except LookupError:
+            nltk.download(name, quiet=True)
+        _checked_resources.add(name)
+
+
+def content_hash(text):
+    '''Stable key for a text, so identical headlines share one cached score.'''
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+# Each worker process of the pool keeps its own analyzer, built the first time it scores a chunk
+_worker_analyzer = None
+
+def _score_chunk(texts):
+    global _worker_analyzer
+    if _worker_analyzer is None:
+        from nltk.sentiment import SentimentIntensityAnalyzer
+        ensure_nltk_resources('vader_lexicon')
+        _worker_analyzer = SentimentIntensityAnalyzer()
+    return [_worker_analyzer.polarity_scores(text) for text in texts]
+
+
+class SentimentScorer:
+    '''Batched VADER scoring with a content-hash cache of article scores.
+
+    Texts that were scored before (in this run or, when a cache file is given, in previous runs) are
+    never scored again. Large batches of new texts can optionally be spread over a process pool.
+    The cache keeps the max_entries most recently used scores; the cache file is an append-only log of
+    the new scores of each batch, rewritten (compacted) only once it has grown well past the cache.
+    '''
+    def __init__(self, cache_file=None, max_workers=None, pool_threshold=2000, chunk_size=500, max_entries=200000):
+        self.cache_file = cache_file # Optional pickle file to keep scores across runs
+        self.max_workers = max_workers # Number of processes for large batches; None or 1 disables the pool
+        self.pool_threshold = pool_threshold # Minimum number of new texts before a pool is worth its startup cost
+        self.chunk_size = chunk_size # Texts sent to each worker at a time
+        self.max_entries = max_entries # Scores kept in memory (and on disk after a compaction), least recently used dropped first
+        self.cache = OrderedDict()
+        self._logged = 0 # Scores in the cache file: the cache plus what was appended (or evicted) since the last compaction
+        self.hits = 0
+        self.misses = 0
+        self._analyzer = None
+        self.load_cache()
+
+    def load_cache(self):
+        if self.cache_file and os.path.exists(self.cache_file):
+            try:
+                with open(self.cache_file, 'rb') as f:
+                    while True: # One pickled dict per saved batch, oldest first (a whole cache after a compaction)
+                        try:
+                            scores = pickle.load(f)
+                        except EOFError:
+                            break
+                        self.cache.update(scores)
+                        self._logged += len(scores)
+            except Exception as e:
+                print(f"Error loading sentiment cache: {e}")
+            self._evict()
+
+    def save_cache(self):
+        '''Rewrites the cache file with the current cache only (dropping the evicted and duplicated scores).'''
+        if not self.cache_file:
+            return
+        try:
+            with open(self.cache_file + '.tmp', 'wb') as f:
+                pickle.dump(dict(self.cache), f)
+            os.replace(self.cache_file + '.tmp', self.cache_file) # Atomic swap, so a crash never leaves half a cache
+            self._logged = len(self.cache)
+        except Exception as e:
+            print(f"Error saving sentiment cache: {e}")
+
+    def _append_cache(self, scores):
+        # Only the new scores of a batch are written, so saving costs the size of the batch, not of the cache
+        if not self.cache_file:
+            return
+        if self._logged + len(scores) > 2 * self.max_entries:
+            self.save_cache() # The log is mostly stale entries by now
+            return
+        try:
+            with open(self.cache_file, 'ab') as f:
+                pickle.dump(scores, f)
+            self._logged += len(scores)
+        except Exception as e:
+            print(f"Error saving sentiment cache: {e}")
+
+    def _evict(self):
+        while len(self.cache) > self.max_entries:
+            self.cache.popitem(last=False)
+
+    @property
+    def analyzer(self):
+        # The VADER analyzer (and its lexicon) is only loaded when we actually need to score something
+        if self._analyzer is None:
+            from nltk.sentiment import SentimentIntensityAnalyzer
+            ensure_nltk_resources('vader_lexicon')
+            self._analyzer = SentimentIntensityAnalyzer()
+        return self._analyzer
+
+    def score(self, text):
+        return self.score_batch([text])[0]
+
+    def score_batch(self, texts):
+        '''Returns the VADER polarity scores for each text, in the same order.'''
+        keys = [content_hash(text) for text in texts]
+        # Collecting the distinct texts we haven't seen yet
+        pending = {}
+        for key, text in zip(keys, texts):
+            if key in self.cache:
+                self.cache.move_to_end(key) # Recently used scores are the last to be evicted
+            elif key not in pending:
+                pending[key] = text
+        self.hits += len(texts) - len(pending)
+        self.misses += len(pending)
+
+        if pending:
+            pending_keys = list(pending)
+            pending_texts = list(pending.values())
+            if self.max_workers and self.max_workers > 1 and len(pending_texts) >= self.pool_threshold:
+                chunks = [pending_texts[i:i + self.chunk_size] for i in range(0, len(pending_texts), self.chunk_size)]
+                with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+                    scores = [score for chunk_scores in pool.map(_score_chunk, chunks) for score in chunk_scores]
+            else:
+                scores = [self.analyzer.polarity_scores(text) for text in pending_texts]
+            new_scores = dict(zip(pending_keys, scores))
+            self.cache.update(new_scores)
+            self._append_cache(new_scores)
+            results = [self.cache[key] for key in keys] # Before evicting, in case the batch alone is larger than the cache
+            self._evict()
+            return results
+
+        return [self.cache[key] for key in keys]
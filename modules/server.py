@@ -0,0 +1,418 @@
+import sys
+import json
+import time
+import queue
+import signal
+import argparse
+import threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from modules.sessions import SessionManager
+from modules.deadline import Deadline
+
+
+# One user request waiting for (or being processed by) a worker
+class Job:
+    def __init__(self, session_id, message, timeout=None):
+        self.session_id = session_id
+        self.message = message
+        self.deadline = Deadline(timeout) # Request budget, handed down to the agents; cancelled when the client goes away
+        self.events = queue.Queue() # Progress events for streaming clients: (event name, data)
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.abandoned = False # Set when the client went away, so a still queued job is skipped
+        self.enqueued = time.time()
+        self.started = None
+        self.finished = None
+
+    def emit(self, event, data):
+        self.events.put((event, data))
+
+    def abandon(self):
+        self.abandoned = True
+        self.deadline.cancel() # Running work stops before its next tool or LLM call
+
+
+# Rolling request metrics, so throughput and latency can be read from /health while the server runs
+class RequestStats:
+    def __init__(self, window=1000):
+        self.latencies = deque(maxlen=window) # End-to-end seconds of the last requests
+        self.queue_waits = deque(maxlen=window) # Seconds spent waiting for a worker
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.started_at = time.time()
+        self.lock = threading.Lock()
+
+    def record(self, job):
+        with self.lock:
+            self.latencies.append(job.finished - job.enqueued)
+            self.queue_waits.append(job.started - job.enqueued)
+            if job.error:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    def percentile(self, values, share):
+        if not values:
+            return None
+        ordered = sorted(values)
+        return round(ordered[min(len(ordered) - 1, int(share * len(ordered)))], 4)
+
+    def snapshot(self):
+        with self.lock:
+            elapsed = time.time() - self.started_at
+            return {
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'throughput_rps': round((self.completed + self.failed) / elapsed, 3) if elapsed else 0,
+                'latency_p50': self.percentile(self.latencies, 0.50),
+                'latency_p95': self.percentile(self.latencies, 0.95),
+                'latency_p99': self.percentile(self.latencies, 0.99),
+                'queue_wait_p95': self.percentile(self.queue_waits, 0.95),
+            }
+
+
+# Runs user requests on a fixed pool of workers, behind a bounded queue
+class OrchestratorService:
+    def __init__(self, manager, workers=4, max_queue=64, request_timeout=120):
+        self.manager = manager # SessionManager wrapping the shared orchestrator
+        self.request_timeout = request_timeout # Seconds each request may take, queue time included
+        self.workers = workers # Concurrency limit: requests processed at the same time
+        self.jobs = queue.Queue(maxsize=max_queue) # Backpressure: when it's full, new requests are rejected right away
+        self.stats = RequestStats()
+        self.accepting = True
+        self.in_flight = 0
+        self.lock = threading.Lock()
+        self.threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"orchestrator-worker-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, session_id, message):
+        '''Queues a request. Returns the Job, or None when the server is full or shutting down.'''
+        if not self.accepting:
+            return None
+        job = Job(session_id, message, timeout=self.request_timeout)
+        try:
+            self.jobs.put_nowait(job)
+        except queue.Full:
+            with self.stats.lock:
+                self.stats.rejected += 1
+            return None
+        job.emit('queued', {'position': self.jobs.qsize()})
+        return job
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            if job is None: # Shutdown signal
+                return
+            if job.abandoned or job.deadline.expired(): # Nobody is waiting for this answer anymore
+                job.done.set()
+                continue
+            with self.lock:
+                self.in_flight += 1
+            job.started = time.time()
+            job.emit('started', {'queue_wait': round(job.started - job.enqueued, 4)})
+            try:
+                job.result = self.manager.handle(job.session_id, job.message, on_event=job.emit, deadline=job.deadline)
+            except Exception as e:
+                print(f"Error processing request for session {job.session_id}: {e}")
+                job.error = str(e)
+            job.finished = time.time()
+            with self.lock:
+                self.in_flight -= 1
+            self.stats.record(job)
+            job.emit('error' if job.error else 'response', {'error': job.error} if job.error else {'response': job.result})
+            job.emit('done', {'latency': round(job.finished - job.enqueued, 4)})
+            job.done.set()
+
+    def shutdown(self, timeout=30):
+        '''Stops accepting requests, lets queued and running ones finish, then stops the workers.'''
+        self.accepting = False
+        deadline = time.time() + timeout
+        for _ in self.threads:
+            self.jobs.put(None) # Queued after the pending jobs, so those are still processed first
+        for thread in self.threads:
+            thread.join(max(0, deadline - time.time()))
+
+    def health(self):
+        return {
+            'accepting': self.accepting,
+            'workers': self.workers,
+            'queued': self.jobs.qsize(),
+            'in_flight': self.in_flight,
+            **self.stats.snapshot(),
+            **self.manager.stats(),
+            **self.planning_stats(),
+            **self.stream_stats(),
+        }
+
+    def stream_stats(self):
+        # Trades received and quotes answered from memory, when the quote stream runs
+        quotestream = sys.modules.get('modules.quotestream') # Never imported (nor started) otherwise
+        stream = quotestream.get_stream() if quotestream is not None else None
+        return {'quote_stream': {**stream.stats, 'symbols': len(stream.buffers)}} if stream is not None else {}
+
+    def planning_stats(self):
+        # How many plans skipped the orchestrator's LLM call (only for orchestrators that have these features)
+        orchestrator = self.manager.orchestrator
+        stats = {}
+        if getattr(orchestrator, 'intent_router', None) is not None:
+            stats['fast_path'] = dict(orchestrator.intent_router.stats)
+        if getattr(orchestrator, 'plan_cache', None) is not None:
+            stats['plan_cache'] = orchestrator.plan_cache.metrics()
+        return stats
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    # POST /chat            {"session_id": "...", "message": "..."} -> JSON response once the answer is ready
+    # POST /chat/stream     same body -> Server-Sent Events with the progress of the request
+    # GET  /health          server, queue, latency and session metrics
+    server_version = "CapitalMindServer/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, self.server.service.health())
+        else:
+            self._send_json(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        if self.path not in ('/chat', '/chat/stream'):
+            self._send_json(404, {'error': 'Not found'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length) or b'{}')
+            message = str(payload['message'])
+        except (ValueError, KeyError, TypeError):
+            self._send_json(400, {'error': 'Expected a JSON body with a "message" field'})
+            return
+
+        service = self.server.service
+        session_id = payload.get('session_id') or service.manager.create_session_id()
+        job = service.submit(session_id, message)
+        if job is None: # Queue full or shutting down: tell the client to retry instead of piling up requests
+            self._send_json(503, {'error': 'Server busy, please retry'}, headers={'Retry-After': '1'})
+            return
+
+        if self.path == '/chat/stream':
+            self._stream(job)
+            return
+        if not job.done.wait(self.server.request_timeout):
+            job.abandon()
+            self._send_json(504, {'error': 'Request timed out', 'session_id': session_id})
+            return
+        if job.error:
+            self._send_json(500, {'error': job.error, 'session_id': session_id})
+            return
+        self._send_json(200, {
+            'session_id': session_id,
+            'response': job.result,
+            'queue_wait': round(job.started - job.enqueued, 4),
+            'latency': round(job.finished - job.enqueued, 4),
+        })
+
+    def _stream(self, job):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self._send_event('session', {'session_id': job.session_id})
+        deadline = time.time() + self.server.request_timeout
+        try:
+            while True:
+                try:
+                    event, data = job.events.get(timeout=max(0.01, deadline - time.time()))
+                except queue.Empty:
+                    job.abandon()
+                    self._send_event('error', {'error': 'Request timed out'})
+                    return
+                self._send_event(event, data)
+                if event == 'done':
+                    return
+        except (BrokenPipeError, ConnectionResetError): # The client disconnected
+            job.abandon()
+
+    def _send_event(self, event, data):
+        self.wfile.write(f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n".encode('utf-8'))
+        self.wfile.flush()
+
+
+class AgentHTTPServer(ThreadingHTTPServer):
+    daemon_threads = False # server_close() then waits for open requests, so answers aren't cut off on shutdown
+    request_queue_size = 128 # Listen backlog; the default of 5 resets connections under load before we can answer 503
+
+    def __init__(self, address, service, request_timeout=120, verbose=False):
+        super().__init__(address, RequestHandler)
+        self.service = service
+        self.request_timeout = request_timeout
+        self.verbose = verbose
+
+
+class StubOrchestrator:
+    '''Stand-in for OrchestratorAgent with fake LLM and tool latencies, to test the server locally
+    without API keys. It follows the same steps as reAct: plan, specialist calls, writer.'''
+    def __init__(self, llm_latency=0.3, tool_latency=0.1, agents=('Market Research Agent', 'Market News Sentiment Agent')):
+        self.llm_latency = llm_latency
+        self.tool_latency = tool_latency
+        self.agents = agents
+
+    def reAct(self, user_input, session=None, on_event=None, deadline=None):
+        deadline = deadline or Deadline()
+        deadline.check('plan')
+        time.sleep(self.llm_latency) # Orchestrator plan
+        plan = [{'action': 'SpecializedAgent', 'parameters': {'agentName': name, 'user_input': user_input}} for name in self.agents]
+        if on_event:
+            on_event('plan', plan)
+        for name in self.agents:
+            if deadline.expired():
+                return f"Partial stub report for: {user_input}"
+            time.sleep(self.tool_latency + self.llm_latency) # Tool calls + specialist summary
+            if on_event:
+                on_event('agent_response', {'agent': name, 'response': f"Stub answer from {name}."})
+        if on_event:
+            on_event('writing', {'agent_responses': len(self.agents)})
+        time.sleep(self.llm_latency) # Writer
+        response = f"Stub report for: {user_input}"
+        if session is not None:
+            session.history.append(f"User: {user_input}")
+            session.history.append(f"Writer: {response}")
+        return response
+
+
+def build_orchestrator(orchestrator_model="gpt-3.5-turbo", agent_model="gemini-2.5-flash", plan_log=None):
+    # Same team as in the notebook, but sharing one memory between the research agents.
+    # plan_log: file keeping the fast path's training examples (the users' questions) across restarts, off by default
+    from modules.memory import MemorySystem
+    from modules.router import IntentRouter
+    from modules.subagents import MarketResearchAgent, MarketSentimentAgent, ScreenerAgent, PortfolioRiskAgent, WriterAgent
+    from modules.agent import OrchestratorAgent
+    from modules.screener import Screener
+    memory = MemorySystem()
+    screener = Screener()
+    screener.prepare() # The screening table is built (or refreshed) in the background from startup, not in the first request
+    team = [
+        MarketResearchAgent(model=agent_model, memory_system=memory),
+        MarketSentimentAgent(model=agent_model, memory_system=memory),
+        ScreenerAgent(model=agent_model, screener=screener),
+        PortfolioRiskAgent(model=agent_model),
+        WriterAgent(model=agent_model),
+    ]
+    return OrchestratorAgent(model=orchestrator_model, agents=team, intent_router=IntentRouter([agent.name for agent in team], log_file=plan_log))
+
+
+def run_load(url, total=100, concurrency=10, message="What's the outlook for AAPL?"):
+    '''Small load generator: sends `total` chat requests with `concurrency` clients and prints latency numbers.'''
+    import urllib.request
+    import urllib.error
+    from concurrent.futures import ThreadPoolExecutor
+
+    def one_request(i):
+        body = json.dumps({'session_id': f"load-{i % concurrency}", 'message': message}).encode('utf-8')
+        request = urllib.request.Request(url.rstrip('/') + '/chat', data=body, headers={'Content-Type': 'application/json'})
+        start = time.time()
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                return response.status, time.time() - start
+        except urllib.error.HTTPError as e:
+            return e.code, time.time() - start
+        except (urllib.error.URLError, ConnectionError):
+            return 'connection error', time.time() - start
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one_request, range(total)))
+    elapsed = time.time() - start
+    latencies = sorted(latency for status, latency in results if status == 200)
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    summary = {
+        'requests': total,
+        'statuses': statuses,
+        'throughput_rps': round(len(latencies) / elapsed, 3),
+        'latency_p50': round(latencies[len(latencies) // 2], 4) if latencies else None,
+        'latency_p95': round(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 4) if latencies else None,
+    }
+    print(json.dumps(summary, indent=2))
+    return summary
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Serve the orchestrator over HTTP (JSON and Server-Sent Events).')
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=8000)
+    arg_parser.add_argument('--workers', type=int, default=4, help='Requests processed concurrently')
+    arg_parser.add_argument('--max-queue', type=int, default=64, help='Requests waiting before new ones get a 503')
+    arg_parser.add_argument('--timeout', type=float, default=120, help='Seconds a client waits for its answer')
+    arg_parser.add_argument('--max-sessions', type=int, default=1000)
+    arg_parser.add_argument('--stub', action='store_true', help='Use a stub orchestrator (no API keys needed)')
+    arg_parser.add_argument('--stub-llm-latency', type=float, default=0.3)
+    arg_parser.add_argument('--stub-tool-latency', type=float, default=0.1)
+    arg_parser.add_argument('--orchestrator-model', default='gpt-3.5-turbo')
+    arg_parser.add_argument('--agent-model', default='gemini-2.5-flash')
+    arg_parser.add_argument('--load', metavar='URL', help='Run the load generator against a running server instead')
+    arg_parser.add_argument('--load-requests', type=int, default=100)
+    arg_parser.add_argument('--load-concurrency', type=int, default=10)
+    arg_parser.add_argument('--stream-symbols', default='', help='Comma-separated symbols to stream quotes for (Finnhub WebSocket)')
+    arg_parser.add_argument('--stream-replay', metavar='FILE', help='Replay recorded feed messages (JSON lines) instead of the live feed')
+    arg_parser.add_argument('--stream-url', help='WebSocket URL of the feed (e.g. a local replay server)')
+    arg_parser.add_argument('--plan-log', metavar='FILE', help="Keep the fast path's training examples (user questions and plan intents) in this file")
+    arg_parser.add_argument('--verbose', action='store_true')
+    args = arg_parser.parse_args()
+
+    if args.load:
+        run_load(args.load, total=args.load_requests, concurrency=args.load_concurrency)
+        return
+
+    if args.stub:
+        orchestrator = StubOrchestrator(llm_latency=args.stub_llm_latency, tool_latency=args.stub_tool_latency)
+    else:
+        orchestrator = build_orchestrator(args.orchestrator_model, args.agent_model, plan_log=args.plan_log)
+    service = OrchestratorService(SessionManager(orchestrator, max_sessions=args.max_sessions), workers=args.workers, max_queue=args.max_queue, request_timeout=args.timeout)
+    service.start()
+    if args.stream_symbols or args.stream_replay:
+        # Quote tools answer from memory for the streamed symbols (see modules/quotestream.py)
+        from modules.quotestream import start_stream
+        start_stream([symbol for symbol in args.stream_symbols.split(',') if symbol], replay=args.stream_replay, url=args.stream_url)
+    httpd = AgentHTTPServer((args.host, args.port), service, request_timeout=args.timeout, verbose=args.verbose)
+
+    def stop(signum, frame):
+        # serve_forever() runs in this thread, so the shutdown has to happen from another one
+        print("Shutting down: finishing queued requests...")
+        threading.Thread(target=httpd.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    print(f"Serving on http://{args.host}:{args.port} with {args.workers} workers")
+    httpd.serve_forever() # Returns once a signal stopped the server: no new connections from here on
+    service.shutdown() # Queued and running requests finish
+    httpd.server_close() # Their clients get their answers
+    print("Server stopped.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import time
+import threading
+import uuid
+from collections import OrderedDict
+
+from modules.memory import ConversationHistory
+
+
+# Per-user state for the orchestrator: everything that differs between two users talking to the same agents
+class SessionState:
+    def __init__(self, session_id, history_tokens=1500, history_summarizer=None):
+        self.session_id = session_id
+        self.history = ConversationHistory(max_tokens=history_tokens, summarizer=history_summarizer) # This user's own conversation
+        self.context = {} # Free-form per-session data (e.g. last symbol discussed, user preferences)
+        self.created = time.time()
+        self.last_active = self.created
+        self.turns = 0
+        self.lock = threading.Lock() # Turns of one session run one at a time, so its history stays in order
+
+    def size(self): # Approximate memory use of the session, in tokens
+        return self.history.total_tokens + self.history.summary_tokens
+
+
+# Serves many users from one process: the agents team, its LLM clients and memory are shared,
+# and each user only gets a lightweight SessionState.
+class SessionManager:
+    def __init__(self, orchestrator, max_sessions=1000, max_total_tokens=2_000_000, idle_timeout=1800,
+                 history_tokens=1500, history_summarizer=None):
+        self.orchestrator = orchestrator # The shared OrchestratorAgent (with its shared sub-agents)
+        self.max_sessions = max_sessions # Maximum number of sessions kept at once
+        self.max_total_tokens = max_total_tokens # Memory cap: total history tokens across all sessions
+        self.idle_timeout = idle_timeout # Seconds without activity before a session is dropped
+        self.history_tokens = history_tokens # Token budget of each session's history
+        self.history_summarizer = history_summarizer
+        self.sessions = OrderedDict() # Least recently used session first
+        self.lock = threading.Lock()
+        self.evicted = 0
+
+    def create_session_id(self):
+        return uuid.uuid4().hex
+
+    def get(self, session_id=None):
+        '''Returns the session for this id, creating it when needed, and marks it as most recently used.'''
+        with self.lock:
+            session_id = session_id or self.create_session_id()
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = SessionState(session_id, self.history_tokens, self.history_summarizer)
+                self.sessions[session_id] = session
+            else:
+                self.sessions.move_to_end(session_id)
+            session.last_active = time.time()
+            self._evict(keep=session_id)
+            return session
+
+    def end(self, session_id):
+        with self.lock:
+            return self.sessions.pop(session_id, None) is not None
+
+    def _evict(self, keep=None):
+        # Drops idle sessions first, then least recently used ones until we're back under both caps
+        now = time.time()
+        for session_id in [sid for sid, s in self.sessions.items() if now - s.last_active > self.idle_timeout and sid != keep]:
+            del self.sessions[session_id]
+            self.evicted += 1
+        total_tokens = sum(s.size() for s in self.sessions.values())
+        for session_id in list(self.sessions):
+            if len(self.sessions) <= self.max_sessions and total_tokens <= self.max_total_tokens:
+                break
+            if session_id == keep:
+                continue
+            total_tokens -= self.sessions.pop(session_id).size()
+            self.evicted += 1
+
+    def handle(self, session_id, user_input, **kwargs):
+        '''Runs one user turn through the shared orchestrator, using this session's state.'''
+        session = self.get(session_id)
+        with session.lock:
+            response = self.orchestrator.reAct(user_input, session=session, **kwargs)
+            session.turns += 1
+            session.last_active = time.time()
+        with self.lock:
+            self._evict(keep=session.session_id) # The history just grew, so the memory cap may be exceeded now
+        return response
+
+    def stats(self):
+        with self.lock:
+            return {
+                'sessions': len(self.sessions),
+                'total_tokens': sum(s.size() for s in self.sessions.values()),
+                'evicted': self.evicted,
+            }
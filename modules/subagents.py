@@ -1,23 +1,55 @@
-#First, we'll initialize the Google GenAI and OpenAI
-from google import genai
-import openai
+import dotenv
+import contextvars
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 #Make sure to load the environmental variables
 dotenv.load_dotenv(dotenv_path=".env")
 
-import nltk
-import numpy as np
-import pandas as pd
-import yfinance as yf
-from nltk.sentiment import SentimentIntensityAnalyzer
-import nltk
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize, sent_tokenize
+# The LLM SDKs (Google GenAI and OpenAI) are only imported when the first client is needed, see modules/llm.py
+from modules.llm import get_client, routed_complete, small_model_for
+from modules.batching import get_batcher
+from modules.evaluator import EvaluatorOptimizer
+from modules.deadline import DeadlineExceeded
+from modules.memory import MemorySystem, ConversationHistory
+from modules.parser import XmlParser, EntityExtractor
+from modules.tools import nothing_to_summarize, FinancialScore, IncomeStatement, StockQuote, StockPriceChange, FinancialNews, NewsArchive, RecommendationTrends, EarningSurprise, EdgarFacts
+# The screener and the portfolio analytics (NumPy) are imported by their agents when created, not when importing the agents
+# NLTK resources are downloaded on first use by modules/sentiment.py (ensure_nltk_resources), not when importing the agents
 
+# Which model handles each kind of task, and how many tokens it may generate. Tiers:
+#   "rules": no model, a rule-based shortcut (e.g. EntityExtractor), with the small model only when the rules can't decide
+#   "small": the fast, cheap model of the agent's provider (see SMALL_MODELS in modules/llm.py)
+#   "large": the agent's own model, kept for synthesis (market/news summaries, the Writer's report, the plan)
+TASK_ROUTING = {
+    "entities": {"tier": "rules", "max_tokens": 60}, # Tag extraction (<SYMBOL>, <EXCHANGE>, <INDUSTRY>)
+    "relevance": {"tier": "rules", "max_tokens": 20}, # Off-topic check before doing any work
+    "answer": {"tier": "small", "max_tokens": 250}, # Specialists' short answers built from a summary
+    "summary": {"tier": "large", "max_tokens": 400}, # Market and news summaries built from tool data
+    "report": {"tier": "large", "max_tokens": 600}, # The Writer's final report
+    "plan": {"tier": "large", "max_tokens": 300}, # The Orchestrator's plan
+    "default": {"tier": "large", "max_tokens": 300},
+}
 
-# Downloading necessary libraries and functionality - uncomment when needed.
-nltk.download('vader_lexicon')
-nltk.download('punkt')
-nltk.download('stopwords')
+OFF_TOPIC_ANSWER = "I'm sorry, I can only assist with financial market-related queries."
+SCREENER_HELP = ("I couldn't tell which conditions to screen for. Ask for example for tech names with a Piotroski score "
+                 "above 7 and positive 1-month momentum, or banks with a P/E below 15 and revenue growth above 5%.")
+SCREENER_BUILDING = "The screening table is still being built (it takes a few minutes the first time). Please ask again shortly."
+SCREENER_METRICS = ("Available metrics: Piotroski and Altman Z scores, P/E, P/S, EPS, revenue growth, profit margin "
+                    "and price changes (1 day to 1 year).")
+PORTFOLIO_HELP = ("Tell me the holdings of the portfolio, e.g. 40% AAPL, 35% MSFT and 25% NVDA "
+                  "(or amounts like $10,000 in AAPL, or share counts like 100 shares of AAPL; without amounts the holdings "
+                  "are equally weighted).")
+RELEVANCE_PROMPT = ("Is the following user input about financial markets, investing, companies or the economy? "
+                    "Answer only YES or NO.\nUser input: \"{input}\"")
+DATA_UNAVAILABLE = "{kind} data for {symbol} is temporarily unavailable: our data providers are not responding." # When all tools failed
+
+def is_failed_response(response):
+    # call_llm answers "Mock response from ..." when every provider failed: not something to store or build on
+    return not response or str(response).startswith("Mock response from")
+
+def configure_task_routing(task, **settings):
+    '''Changes the routing of a task for agents created afterwards, e.g. configure_task_routing("answer", tier="large").'''
+    TASK_ROUTING.setdefault(task, dict(TASK_ROUTING["default"])).update(settings)
 
 class Agent: # This will be our base class for all our agents
     def __init__(self, name, role, system_prompt, model, generate_response, agents=None, tools=None, memory_system=None, parser=None, debug=0): # This is the initialization method of the Agent class
@@ -30,8 +62,10 @@ class Agent: # This will be our base class for all our agents
         self.generate_response = generate_response # Placeholder for the generate response method
         self.agents = agents 
         self.tools = tools # Placeholder for the tools passed on to this agent, which should be a list
-        self.conversation_history = [] # Initializing a blank conversation history
-        self.max_history_length = 10 # Initializing a default max number of history length
+        self.max_history_tokens = 1500 # Initializing a default token budget for the conversation history
+        self.conversation_history = ConversationHistory(max_tokens=self.max_history_tokens) # Initializing a blank conversation history, older turns get summarized
+        self.task_routing = {task: dict(settings) for task, settings in TASK_ROUTING.items()} # Per-agent copy, so one agent can be tuned alone
+        self.entity_extractor = EntityExtractor() # Rule-based entities, used before asking a model
 
         self.prompt_template = (
             "You are {agent_name}, an AI agent. Use the following tools as needed:\n"
@@ -45,12 +79,13 @@ class Agent: # This will be our base class for all our agents
         self.debug = debug #Setting the debug local variable, used to print certain validation statements when set to 1
     #We want our Agent class to support multiple LLMs, so this function will help initialize its internal client dynamically.
     def initialize_client(self):
-        #For GPT models
-        if "gpt" in self.model.lower(): 
-            self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        #For Gemini models
-        elif "gemini" in self.model.lower():
-            self.client = genai.Client()
+        # The client itself is only created on first use (see the client property below)
+        self._client = None
+    @property
+    def client(self): # The LLM client for this agent's model, shared with every other agent using the same provider
+        if self._client is None:
+            self._client = get_client(self.model)
+        return self._client
     def to_dict(self): # The structure of each class will always be a standard dictionary object that can be easily interpreted by the Agents
         return {
             "name": self.name,
@@ -60,44 +95,74 @@ class Agent: # This will be our base class for all our agents
     def register_tool(self, tool): #This function helps register tools that the agent will have access to.
         self.tools.append(tool) 
     def remember(self, message): #This function enables the agent to remember a message in its conversation history
-        self.conversation_history.append(message)
-        if len(self.conversation_history) > self.max_history_length:
-            self.conversation_history.pop(0)
-    def call_llm(self, input_prompt): #This is the generic call to LLM that agents can use. They may have a different version if needs are unique
+        self.conversation_history.append(message) # The history keeps itself within its token budget
+    def model_for_task(self, task):
+        '''Returns (model, max_tokens) for a task; "rules" tasks fall back to the small model.'''
+        settings = self.task_routing.get(task) or self.task_routing["default"]
+        model = self.model if settings["tier"] == "large" else small_model_for(self.model)
+        return model, settings["max_tokens"]
+    def call_llm(self, input_prompt, task="default"): #This is the generic call to LLM that agents can use. They may have a different version if needs are unique
+        model, max_tokens = self.model_for_task(task)
         try:
-            #For GPT models
-            if "gpt" in self.model.lower(): 
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": self.system_prompt},
-                        {"role": "user", "content": input_prompt}
-                    ],
-                    max_tokens=300,
-                    temperature=0.7
-                )
-                result = response.choices[0].message.content
-            #For Gemini models
-            elif "gemini" in self.model.lower():
-                prompt = self.system_prompt
-                prompt += "\n" + input_prompt
-                response = self.client.models.generate_content(
-                    model=self.model, contents=str(prompt)
-                )
-                result = response.text
-            #print(f"{self.name} using model '{self.model}': {result[:60]}...")
-            #print(result)
-            return result
+            # Every agent goes through the shared, pooled clients, hedged and failed over across providers (see modules/llm.py)
+            return routed_complete(model, [
+                {"role": "system", "content": self.system_prompt},
+                {"role": "user", "content": str(input_prompt)}
+            ], max_tokens=max_tokens)
+        except DeadlineExceeded:
+            raise # The request ran out of time; the orchestrator decides what to return
         except Exception as e:
             if self.debug == 1:
-                print(f" API failed for {self.name} using model '{self.model}': {e}")
-            return f"Mock response from {self.name} with model '{self.model}': {input_prompt[:50]}..."
+                print(f" API failed for {self.name} using model '{model}': {e}")
+            return f"Mock response from {self.name} with model '{model}': {str(input_prompt)[:50]}..."
+    def call_llm_batch(self, input_prompts, task="default"): #Same as call_llm for many prompts at once, for background jobs (e.g. watchlist refreshes)
+        model, max_tokens = self.model_for_task(task)
+        batcher = get_batcher(model) # Prompts from every agent using this model within a short window go out together
+        futures = [batcher.submit([
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": str(input_prompt)}
+        ], max_tokens=max_tokens) for input_prompt in input_prompts]
+        results = []
+        for input_prompt, future in zip(input_prompts, futures):
+            try:
+                results.append(batcher.result(future))
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                if self.debug == 1:
+                    print(f" API failed for {self.name} using model '{model}': {e}")
+                results.append(f"Mock response from {self.name} with model '{model}': {str(input_prompt)[:50]}...")
+        return results
     def generate_response(self, **kwargs): # This is the placeholder of the generative function for the agent, which will receive a variable number of parameters
         if self.debug == 1:
             print(f"Invoking {self.name} generative response function with arguments {kwargs}")
         return self.generate_response(**kwargs) # Returning the results of the function
+    def extract_entities(self, user_input, prompt):
+        '''Entities of the user input: rule-based when the routing allows it, otherwise (or when the rules find nothing,
+            e.g. a company we don't know like "Snowflake") the prompt goes to the model picked for the "entities" task.
+        '''
+        if self.task_routing["entities"]["tier"] == "rules":
+            entities = self.entity_extractor.extract(user_input)
+            if entities:
+                return entities
+        response = self.call_llm(prompt, task="entities")
+        if self.debug == 1:
+            print(f'Response: {response}')
+        tags = XmlParser().parseTags(response)
+        if tags.get("symbol", "").strip(" .").upper() in ("", "N/A", "NA", "NONE", "NULL", "UNKNOWN"):
+            tags.pop("symbol", None) # The model found no company (or echoed the template)
+        return tags
+    def is_off_topic(self, user_input, entities):
+        # The refusal rule in our prompts. The rules only recognize market inputs ("Is the yield curve inverted?" has
+        # no ticker and maybe none of our words), so when they don't, the small model decides instead of refusing outright
+        if self.task_routing["relevance"]["tier"] != "rules":
+            return False # Left to the model answering the query
+        if self.entity_extractor.is_market_related(user_input, entities):
+            return False
+        answer = self.call_llm(RELEVANCE_PROMPT.format(input=user_input), task="relevance")
+        return answer.strip().upper().startswith("NO") # Anything else (including a failed call) goes on to the answer
 class MarketResearchAgent(Agent):
-    def __init__(self, model="gemini-2.5-flash", debug=0):
+    def __init__(self, model="gemini-2.5-flash", memory_system=None, debug=0):
         name="Market Research Agent"
         model=model
         role="Market Research Agent specialized in financial data analysis and market trends"
@@ -107,64 +172,75 @@ class MarketResearchAgent(Agent):
          Based on the data retrieved from the tools at your disposal, provide comprehensive answers to user queries related to stock performance, market analysis, and financial news.
         
         """
-        self.memory_system=MemorySystem()
+        self.memory_system=memory_system if memory_system is not None else MemorySystem() # Agents can share one memory instead of each loading its own copy
         super().__init__(name=name,system_prompt=system_prompt,model=model,generate_response=self.generate_response,role=role,agents=None,tools=None,memory_system=self.memory_system,parser=None, debug=debug) 
     
     def generate_response(self, **kwargs): # This is the placeholder of the generative function for the agent, which will receive a variable number of parameters
         if self.debug == 1:
             print(f"Invoking {self.name} generative response function with arguments {kwargs}")
         input_prompt=kwargs.get("prompt",[])
-        try:
-            #For GPT models
-            if "gpt" in self.model.lower(): 
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": self.system_prompt},
-                        {"role": "user", "content": input_prompt}
-                    ],
-                    #messages=input_prompt,
-                    max_tokens=300,
-                    temperature=0.7
-                )
-                result = response.choices[0].message.content
-            #For Gemini models
-            elif "gemini" in self.model.lower():
-                response = self.client.models.generate_content(
-                    model=self.model, contents=str(input_prompt)
-                )
-                result = response.text
-            return result
-        except Exception as e:
-            if self.debug == 1:
-                print(f" API failed for {self.name} using model '{self.model}': {e}")
-            return f"Mock response from {self.name} with model '{self.model}': {input_prompt[:50]}..."
+        return self.call_llm(input_prompt, task=kwargs.get("task","default")) # Shared LLM call, with the model and limits of the task
 
-    def getMarketSummary(self,symbol:str  ) -> str:
+    def marketSummaryPrompt(self, symbol: str) -> str: # Summary prompt with the data of our market tools for the symbol
         prompt=f"""Provide a comprehensive market summary for the stock symbol: {symbol}. 
                 Include recent performance, key financial metrics, and any notable news or trends affecting the stock.
                 Use data from Yahoo Finance, Financial Modeling Prep, and FinnHub to inform your summary.
                 Format the response in a clear and concise manner suitable for a financial report."""
+        tools_list=[FinancialScore(),IncomeStatement(),StockQuote(),StockPriceChange(),EdgarFacts()]
+        for tool in tools_list:
+            tool_response=tool.invoke(symbol=symbol)
+            prompt+=f"\nData from {tool.name}: {tool_response}"
+        if nothing_to_summarize(tools_list):
+            return None # Every data provider is down and our local stores had nothing: there's nothing to summarize
+        return prompt
+
+    def getMarketSummary(self,symbol:str  ) -> str:
         insights = self.memory_system.get_stock_insights(symbol)
         if insights:
             if self.debug == 1:
                 print(f"Using cached insight for symbol {symbol}.")
             return insights[-1]['insight']
         else:
-            tools_list=[FinancialScore(),IncomeStatement(),StockQuote(),StockPriceChange()]
-            for tool in tools_list:
-                tool_response=tool.invoke(symbol=symbol)
-                prompt+=f"\nData from {tool.name}: {tool_response}"
-            response=self.generate_response(prompt=prompt)
-            self.memory_system.add_stock_insight(symbol, response,timestamp=datetime.now().isoformat())
+            prompt=self.marketSummaryPrompt(symbol)
+            if prompt is None: # No LLM call (and nothing stored) when all our tools failed
+                return DATA_UNAVAILABLE.format(kind="Market", symbol=symbol)
+            response=self.generate_response(prompt=prompt, task="summary")
+            if not is_failed_response(response): # A failed call isn't cached as the symbol's insight
+                self.memory_system.add_stock_insight(symbol, response,timestamp=datetime.now().isoformat())
         return response  
+
+    def refresh_watchlist(self, symbols, max_workers=8) -> dict:
+        '''Rebuilds the market summaries of all the symbols (e.g. from a scheduled job) and stores them as new insights.
+            Tool data is fetched in parallel and the summaries go to the model in batches instead of one by one.
+            Returns {symbol: summary} (without the symbols whose data sources were all down or whose LLM call failed).
+        '''
+        symbols=list(dict.fromkeys(symbols))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            prompts=dict(zip(symbols, executor.map(lambda symbol: contextvars.copy_context().run(self.marketSummaryPrompt, symbol), symbols)))
+        available=[symbol for symbol in symbols if prompts[symbol] is not None] # Symbols whose data sources all failed are skipped
+        summaries=dict(zip(available, self.call_llm_batch([prompts[symbol] for symbol in available], task="summary")))
+        summaries={symbol: summary for symbol, summary in summaries.items() if not is_failed_response(summary)}
+        timestamp=datetime.now().isoformat()
+        for symbol, summary in summaries.items():
+            self.memory_system.add_stock_insight(symbol, summary, timestamp=timestamp, save=False)
+        if summaries:
+            self.memory_system.save_memory() # Once for the whole batch
+        return summaries
     
     def  processUserInput(self, user_input: str) -> str:
         tags=self.getEntities(user_input=user_input)
+        if self.is_off_topic(user_input, tags):
+            return OFF_TOPIC_ANSWER # No model call needed to refuse
+        marketSummary="no summary available" # Default when no symbol was found in the input
         if "symbol" in tags:
             marketSummary=self.getMarketSummary(symbol=tags.get("symbol"))
+        # Related analyses we stored before (for any symbol), so the answer can build on prior work
+        priorInsights=self.memory_system.search_insights(user_input, k=3, max_age_days=7, kinds=['stock'])
+        priorWork="\n".join(f"- [{item['symbol']} {item['timestamp'][:10]}] {item['text'][:300]}" for item in priorInsights)
         prompt=f"""Based on the {marketSummary} Analyze the following user input
                 and provide a short answer for the user query.
+                Related prior analysis:
+                {priorWork}
                 Rules:
                 - If the user input is related to stock performance, provide insights based on the market summary.
                 - If the user input is unrelated to financial markets, respond with "I'm sorry, I can only assist with financial market-related queries."
@@ -176,8 +252,8 @@ class MarketResearchAgent(Agent):
 
 
                 Answer:
-                """,
-        response=self.generate_response(prompt=prompt)
+                """
+        response=self.generate_response(prompt=prompt, task="answer")
         return response
 
     def getEntities(self, user_input: str) -> str:
@@ -188,14 +264,9 @@ class MarketResearchAgent(Agent):
                 Extracted Entities:
                     <SYMBOL>...</SYMBOL>
                     <EXCHANGE>...</EXCHANGE><INDUSTRY>...</INDUSTRY>  """
-        response=self.generate_response(prompt=prompt)
-        if self.debug == 1:
-            print(f'Response: {response}')
-        parser=XmlParser()
-        parsed_response=parser.parseTags(response)
-        return parsed_response
+        return self.extract_entities(user_input, prompt) # Rule-based first, a small model only when needed
 class MarketSentimentAgent(Agent):
-    def __init__(self, model="gemini-2.5-flash", debug=0):
+    def __init__(self, model="gemini-2.5-flash", memory_system=None, debug=0):
         name="Market News Sentiment Agent"
         model=model
         role="Market News Sentiment Agent specialized in financial news sentiment analysis"
@@ -205,53 +276,68 @@ class MarketSentimentAgent(Agent):
          Based on the news data retrieved from FinnHub, provide comprehensive sentiment analysis to help users understand market mood and potential impacts on stock performance.
         
         """
-        self.memory_system=MemorySystem()
+        self.memory_system=memory_system if memory_system is not None else MemorySystem() # Agents can share one memory instead of each loading its own copy
         super().__init__(name=name,system_prompt=system_prompt,model=model,generate_response=self.generate_response,role=role,agents=None,tools=None,memory_system=self.memory_system,parser=None, debug=debug)
         
     def generate_response(self, **kwargs): # This is the placeholder of the generative function for the agent, which will receive a variable number of parameters
         if self.debug==1:
             print(f"Invoking {self.name} generative response function with arguments {kwargs}")
         input_prompt=kwargs.get("prompt",[])
-        try:
-            #For GPT models
-            if "gpt" in self.model.lower(): 
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=input_prompt,
-                    max_tokens=300,
-                    temperature=0.7
-                )
-                result = response.choices[0].message.content
-            #For Gemini models
-            elif "gemini" in self.model.lower():
-                response = self.client.models.generate_content(
-                    model=self.model, contents=str(input_prompt)
-                )
-                result = response.text
-            return result
-        except Exception as e:
-            if self.debug==1:
-                print(f" API failed for {self.name} using model '{self.model}': {e}")
-            return f"Mock response from {self.name} with model '{self.model}': {input_prompt[:50]}..."
-        
-    def getNewsSummary(self,symbol:str  ) -> str:
-            prompt=f"""Provide a comprehensive news summary for the stock symbol: {symbol}.
-                    Include recent news articles, key events, and any notable trends affecting the stock.
-                    Use data from FinnHub and other news sources to inform your summary.
-                    Format the response in a clear and concise manner suitable for a financial report."""
+        return self.call_llm(input_prompt, task=kwargs.get("task","default")) # Shared LLM call, with the model and limits of the task
+
+    def getNewsSummary(self,symbol:str, start_date:str=None, end_date:str=None) -> str:
+            if start_date or end_date: # A past period: summarized from the news archive, and not stored as the symbol's latest news
+                prompt=self.newsSummaryPrompt(symbol, start_date=start_date, end_date=end_date)
+                return self.generate_response(prompt=prompt, task="summary")
             insights = self.memory_system.get_news_insights(symbol)
             if insights:
                 if self.debug==1:
                     print(f"Using cached insight for symbol {symbol}.")
                 return insights[-1]['news_item']
             else:
-                tools_list=[FinancialNews(),RecommendationTrends(),EarningSurprise()]
-                for tool in tools_list:
-                    tool_response=tool.invoke(symbol=symbol)
-                    prompt+=f"\nData from {tool.name}: {tool_response}"
-                response=self.generate_response(prompt=prompt)
-                self.memory_system.add_market_news(symbol, response,timestamp=datetime.now().isoformat())
+                prompt=self.newsSummaryPrompt(symbol)
+                if prompt is None: # No LLM call (and nothing stored) when all our tools failed
+                    return DATA_UNAVAILABLE.format(kind="News", symbol=symbol)
+                response=self.generate_response(prompt=prompt, task="summary")
+                if not is_failed_response(response): # A failed call isn't cached as the symbol's news
+                    self.memory_system.add_market_news(symbol, response,timestamp=datetime.now().isoformat())
             return response
+
+    def newsSummaryPrompt(self, symbol: str, start_date: str=None, end_date: str=None) -> str: # Summary prompt with the data of our news tools for the symbol
+        if start_date or end_date: # Only the archive has the news of a past period
+            prompt=f"""Provide a comprehensive news summary for the stock symbol: {symbol} from {start_date or 'the start of our archive'} to {end_date or 'today'}.
+                Include the news articles of that period, key events, and any notable trends affecting the stock.
+                Format the response in a clear and concise manner suitable for a financial report."""
+            tool=NewsArchive()
+            return prompt+f"\nData from {tool.name}: {tool.invoke(symbol=symbol, start_date=start_date, end_date=end_date)}"
+        prompt=f"""Provide a comprehensive news summary for the stock symbol: {symbol}.
+                Include recent news articles, key events, and any notable trends affecting the stock.
+                Use data from FinnHub and other news sources to inform your summary.
+                Format the response in a clear and concise manner suitable for a financial report."""
+        tools_list=[FinancialNews(),NewsArchive(),RecommendationTrends(),EarningSurprise()]
+        for tool in tools_list:
+            tool_response=tool.invoke(symbol=symbol)
+            prompt+=f"\nData from {tool.name}: {tool_response}"
+        if nothing_to_summarize(tools_list):
+            return None # Every data provider is down and our local stores had nothing: there's nothing to summarize
+        return prompt
+
+    def refresh_news_summaries(self, symbols, max_workers=8) -> dict:
+        '''Rebuilds the news summaries of all the symbols in bulk (parallel tool calls, batched LLM calls).
+            Returns {symbol: summary} (without the symbols whose data sources were all down or whose LLM call failed).
+        '''
+        symbols=list(dict.fromkeys(symbols))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            prompts=dict(zip(symbols, executor.map(lambda symbol: contextvars.copy_context().run(self.newsSummaryPrompt, symbol), symbols)))
+        available=[symbol for symbol in symbols if prompts[symbol] is not None] # Symbols whose data sources all failed are skipped
+        summaries=dict(zip(available, self.call_llm_batch([prompts[symbol] for symbol in available], task="summary")))
+        summaries={symbol: summary for symbol, summary in summaries.items() if not is_failed_response(summary)}
+        timestamp=datetime.now().isoformat()
+        for symbol, summary in summaries.items():
+            self.memory_system.add_market_news(symbol, summary, timestamp=timestamp, save=False)
+        if summaries:
+            self.memory_system.save_memory() # Once for the whole batch
+        return summaries
         
     def processUserInput(self, user_input: str) -> str:
         if self.debug==1:
@@ -259,10 +345,19 @@ class MarketSentimentAgent(Agent):
             print(f'{self.name}" received input: {user_input}')
             print("-" * 50)
         tags=self.getEntities(user_input=user_input)
+        if self.is_off_topic(user_input, tags):
+            return OFF_TOPIC_ANSWER # No model call needed to refuse
+        newsSummary="no summary available" # Default when no symbol was found in the input
         if "symbol" in tags:
-            newsSummary=self.getNewsSummary(symbol=tags.get("symbol"))
+            start_date, end_date=self.entity_extractor.date_range(user_input) # e.g. "Apple news in March 2024"
+            newsSummary=self.getNewsSummary(symbol=tags.get("symbol"), start_date=start_date, end_date=end_date)
+        # Related analyses we stored before (for any symbol), so the answer can build on prior work
+        priorInsights=self.memory_system.search_insights(user_input, k=3, max_age_days=7, kinds=['news'])
+        priorWork="\n".join(f"- [{item['symbol']} {item['timestamp'][:10]}] {item['text'][:300]}" for item in priorInsights)
         prompt=f"""Based on the {newsSummary} Analyze the following user input
                 and provide a short answer for the user query.
+                Related prior analysis:
+                {priorWork}
                 Rules:
                 - If the user input is related to financial news sentiment, provide insights based on the news summary.
                 - If the user input is unrelated to financial markets, respond with "I'm sorry, I can only assist with financial market-related queries."
@@ -274,8 +369,8 @@ class MarketSentimentAgent(Agent):
 
 
                 Answer:
-                """,
-        response=self.generate_response(prompt=prompt)
+                """
+        response=self.generate_response(prompt=prompt, task="answer")
         return response
     def getEntities(self, user_input: str) -> str:
         prompt=f"""Determine entities the following user input related to financial markets and stock analysis:
@@ -285,14 +380,12 @@ class MarketSentimentAgent(Agent):
                 Extracted Entities:
                     <SYMBOL>...</SYMBOL>
                     <EXCHANGE>...</EXCHANGE><INDUSTRY>...</INDUSTRY>  """
-        response=self.generate_response(prompt=prompt)
-        parser=XmlParser()
-        parsed_response=parser.parseTags(response)
-        return parsed_response
+        return self.extract_entities(user_input, prompt) # Rule-based first, a small model only when needed
         
 class WriterAgent(Agent):
     # This agent takes the results of other agents (like news or market research) and creates a professional report that will be returned to the Orchestrator for the Final Response to the user.
-    def __init__ (self, model="gpt-3.5-turbo", agents=None, memory_system=None, debug=0):
+    def __init__ (self, model="gpt-3.5-turbo", agents=None, memory_system=None, debug=0,
+                  candidates=3, max_refinements=1, score_threshold=0.85, time_budget=None, scorer=None):
         super().__init__(
             name="Writer", #Name of the Writer class
             role="Writer Agent specialized in polished Financial Content", #Role of this class
@@ -313,10 +406,128 @@ class WriterAgent(Agent):
             memory_system = memory_system,
             debug=debug
         )
+        # Evaluate-then-refine stage: parallel drafts, scored locally, and a bounded number of refinements of the best one
+        # (candidates=1 and max_refinements=0 give back the single Writer call)
+        self.optimizer = EvaluatorOptimizer(
+            generate=lambda content: self.generate_response(input_prompt=content),
+            refine=self.refine,
+            scorer=scorer, # Callable(draft, content) -> (score, feedback); the local heuristic scorer by default
+            candidates=candidates,
+            max_refinements=max_refinements,
+            threshold=score_threshold,
+            time_budget=time_budget
+        )
     def generate_response(self, input_prompt):
-        result = self.call_llm(input_prompt)
+        result = self.call_llm(input_prompt, task="report") # The final report is synthesis, so it keeps the large model
         return result
+    def refine(self, input_prompt, draft, feedback): # One refinement round of a draft, guided by the evaluator's feedback
+        prompt=(f"Here is the material from the other agents:\n{input_prompt}\n\n"
+                f"Here is your draft report:\n{draft}\n\n"
+                "Rewrite the report, keeping what works and fixing the following:\n- " + "\n- ".join(feedback))
+        return self.generate_response(input_prompt=prompt)
     def processUserInput(self, input_prompt: str) -> str:
         prompt=input_prompt
-        response=self.generate_response(input_prompt=prompt)
+        response=self.optimizer.run(prompt)
+        if self.debug==1:
+            print(f"Writer drafts: {self.optimizer.last_run}")
         return response    
+
+class ScreenerAgent(Agent):
+    # This agent answers screening questions ("which tech names have a Piotroski score above 7?") from the screener's
+    # precomputed, indexed table (modules/screener.py) instead of researching every symbol one by one.
+    def __init__(self, model="gemini-2.5-flash", screener=None, memory_system=None, debug=0):
+        super().__init__(
+            name="Stock Screener Agent",
+            role="Stock Screener Agent that finds the stocks meeting conditions on financial scores, ratios, growth and price momentum",
+            system_prompt=(
+                "You are a Stock Screener Agent. You find the stocks that meet the user's conditions on Piotroski and Altman Z "
+                "scores, financial ratios, revenue growth and price changes, using a precomputed screening table."
+            ),
+            model=model,
+            generate_response=self.generate_response,
+            memory_system=memory_system,
+            debug=debug
+        )
+        if screener is None:
+            from modules.screener import Screener
+            screener = Screener() # Its table is built (and saved) in the background the first time it's needed
+        self.screener = screener
+    def generate_response(self, **kwargs):
+        return self.call_llm(kwargs.get("prompt",""), task=kwargs.get("task","default"))
+    def processUserInput(self, user_input: str) -> str:
+        # No LLM call: the conditions are parsed with rules and answered from the screener's indexes
+        criteria, results = self.screener.screen_text(user_input)
+        if self.debug==1:
+            print(f"Screener criteria: {criteria}")
+        if not criteria:
+            return SCREENER_HELP
+        if not self.screener.table.size:
+            return SCREENER_BUILDING
+        missing = self.screener.unavailable(criteria)
+        if missing: # An unknown column would match nothing, which reads as "no stocks qualify"
+            return f"The screening table has no data for {', '.join(missing)}, so we can't screen on it. " + SCREENER_METRICS
+        conditions = ", ".join(f"{column} {operator} {value}" for column, operator, value in criteria)
+        if not results:
+            return f"No stocks in our screening universe meet all the conditions ({conditions})."
+        lines = []
+        for record in results:
+            values = ", ".join(f"{column}: {value:.2f}" if isinstance(value, float) else f"{column}: {value}"
+                               for column, value in record.items() if column != "symbol" and value is not None)
+            lines.append(f"- {record['symbol']} ({values})")
+        return f"{len(results)} stocks meet the conditions ({conditions}):\n" + "\n".join(lines)
+
+class PortfolioRiskAgent(Agent):
+    # This agent answers questions about a whole portfolio (volatility, VaR, beta, where the risk comes from)
+    # from the local price history (modules/portfolio.py), instead of reasoning about one ticker at a time.
+    def __init__(self, model="gemini-2.5-flash", price_source=None, benchmark="SPY", period="3y", confidence=0.95, memory_system=None, debug=0):
+        super().__init__(
+            name="Portfolio Risk Agent",
+            role="Portfolio Risk Agent that measures the risk of a portfolio of holdings: volatility, Value at Risk, beta to the market, correlations and each holding's contribution to risk",
+            system_prompt=(
+                "You are a Portfolio Risk Agent. You measure the risk of a portfolio of holdings and weights from historical "
+                "daily prices: volatility, historical and parametric Value at Risk, beta to the S&P 500, correlations and "
+                "contributions to risk."
+            ),
+            model=model,
+            generate_response=self.generate_response,
+            memory_system=memory_system,
+            debug=debug
+        )
+        from modules.portfolio import PortfolioRisk
+        if price_source is None:
+            from modules.pricestore import PriceStore
+            price_source = PriceStore() # Daily closes are downloaded once, then only the new days
+        self.risk = PortfolioRisk(price_source, benchmark=benchmark, period=period)
+        self.confidence = confidence
+    def generate_response(self, **kwargs):
+        return self.call_llm(kwargs.get("prompt",""), task=kwargs.get("task","default"))
+    def processUserInput(self, user_input: str) -> str:
+        # No LLM call: the holdings are parsed with rules and the risk is computed locally
+        from modules.portfolio import parse_holdings
+        try:
+            holdings = parse_holdings(user_input, self.entity_extractor, price=self.risk.last_price)
+        except ValueError as e:
+            return f"I couldn't value this portfolio: {e}."
+        if self.debug==1:
+            print(f"Portfolio holdings: {holdings}")
+        if not holdings:
+            return PORTFOLIO_HELP
+        try:
+            report = self.risk.analyze(holdings, confidence=self.confidence)
+        except ValueError as e:
+            return f"I couldn't measure the risk of this portfolio: {e}."
+        lines = [
+            f"Portfolio of {report['holdings']} holdings, {report['days']} trading days of history:",
+            f"- Annualized volatility: {report['annual_volatility']:.1%}, annualized return: {report['annual_return']:.1%}",
+            f"- 1-day {report['confidence']:.0%} VaR: {report['historical_var']:.2%} historical, {report['parametric_var']:.2%} parametric "
+            f"(expected shortfall {report['historical_es']:.2%} / {report['parametric_es']:.2%})",
+            f"- Beta to {self.risk.benchmark}: {report['beta']:.2f}",
+            "- Holdings (weight, beta, share of the portfolio risk):",
+        ]
+        for symbol, position in sorted(report['positions'].items(), key=lambda item: -item[1]['risk_contribution']):
+            lines.append(f"  - {symbol}: {position['weight']:.1%}, beta {position['beta']:.2f}, {position['risk_contribution']:.1%} of the risk")
+        if report['top_correlations']:
+            lines.append("- Most correlated pairs: " + ", ".join(f"{a}/{b} {c:.2f}" for a, b, c in report['top_correlations']))
+        if report['missing']:
+            lines.append(f"- No price history for {', '.join(report['missing'])} (left out)")
+        return "\n".join(lines)
@@ -1,24 +1,122 @@
 import dotenv
 import os
+import time
+import threading
 #import modules.tools as tools
-import yfinance as yf
-import requests
-import finnhub
 from typing import Callable
-from datetime import datetime, timedelta
-from google import genai
-import openai
+from datetime import datetime, timedelta, timezone
+from modules.deadline import current_deadline, call_timeout
+# yfinance, requests and finnhub are imported inside the tools that use them, so importing the tools stays fast
 
 # For privacy reasons, we'll store our token keys on a .env file, which we'll load here:
 dotenv.load_dotenv(dotenv_path=".env")
 
+# Failure handling shared by all tools. When a provider is down, each endpoint has a circuit breaker that stops
+# calling it after repeated errors (failing fast instead of waiting for a timeout every time) and lets one probe
+# call through now and then to detect recovery. Empty or not-found answers (e.g. an invalid symbol) are cached
+# for a short time, so they aren't requested again on every user question.
+TOOL_SETTINGS = {
+    "failure_threshold": 3, # Consecutive errors before an endpoint's breaker opens
+    "reset_timeout": 30, # Seconds an open breaker waits before letting a probe call through
+    "negative_ttl": 300, # Seconds an empty or not-found answer is remembered
+}
+
+class ToolError(Exception):
+    '''Raised by a tool function when its provider failed (network error, timeout, server error).'''
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=3, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed" # closed: calls go through; open: calls fail fast; half_open: one probe call is allowed
+        self.failures = 0 # Consecutive failures
+        self.opened_at = None
+        self.probing = False # A half-open probe call is in flight
+        self.rejected = 0 # Calls skipped while open
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+            if self.state == "half_open" and not self.probing:
+                self.probing = True # This caller is the probe; everyone else keeps failing fast until it's back
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state, self.failures, self.probing = "closed", 0, False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    print(f"Circuit breaker for {self.name} opened after {self.failures} failures")
+                self.state, self.opened_at = "open", time.monotonic()
+            self.probing = False
+
+    def release(self):
+        # The call ended without telling us anything about the endpoint (e.g. the request deadline passed)
+        with self.lock:
+            self.probing = False
+
+_breakers = {}
+_negative_cache = {} # (tool name, endpoint, arguments) -> (expires at, empty answer)
+_failure_lock = threading.Lock()
+
+def breaker_for(endpoint):
+    with _failure_lock:
+        if endpoint not in _breakers:
+            _breakers[endpoint] = CircuitBreaker(endpoint, TOOL_SETTINGS["failure_threshold"], TOOL_SETTINGS["reset_timeout"])
+        return _breakers[endpoint]
+
+def breaker_stats():
+    with _failure_lock:
+        return {endpoint: {"state": b.state, "failures": b.failures, "rejected": b.rejected} for endpoint, b in _breakers.items()}
+
+def is_empty_result(result):
+    # No data: nothing at all, or only a "no results" message
+    return not result or (isinstance(result, dict) and set(result) == {"message"})
+
+def nothing_to_summarize(tools):
+    '''True when every remote tool of the list failed or was skipped by its breaker on its last call, and none of
+        the local tools (no endpoint, e.g. NewsArchive or EdgarFacts, which never "fail") had data either.'''
+    remote = [tool for tool in tools if tool.endpoint]
+    local = [tool for tool in tools if not tool.endpoint]
+    return (bool(remote) and all(tool.last_status in ("failed", "unavailable") for tool in remote)
+            and not any(tool.last_status == "ok" for tool in local))
+
+def client_error_status(e):
+    # HTTP status of a provider error when it's a client error (bad or unknown symbol), None otherwise
+    status = getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+    return status if status is not None and 400 <= status < 500 and status != 429 else None
+
+# Quotes held in memory by the streaming feed (see modules/quotestream.py), when it runs: callable(symbol) -> quote or None
+_quote_source = None
+
+def set_quote_source(source):
+    global _quote_source
+    _quote_source = source
+
+def streamed_quote(symbol):
+    # The in-memory quote of a symbol, or None when no stream runs or it has nothing recent for the symbol
+    return _quote_source(symbol) if _quote_source is not None and symbol else None
+
 # First, we'll define a generic Tool class, which will serve as a structure for all of our tools
 class Tool:
-    def __init__(self, name, function, description, api=None): # This is the initialization method of the class
+    def __init__(self, name, function, description, api=None, endpoint=None): # This is the initialization method of the class
         self.name = name # Placeholder for the name of the tool
         self.function = function # Placeholder for the code of the tool's function
         self.description = description # Placeholder for the description of the tool - very important since the agents will use this description to know what the tool does
         self.api = api  # Placeholder for API details when needed
+        self.endpoint = endpoint # Remote endpoint behind the tool, which gets its own circuit breaker (None for local tools)
+        self.last_status = None # Outcome of the last invoke: "ok", "empty", "failed" or "unavailable" (breaker open)
         
     def to_dict(self): # The structure of each class will always be a standard dictionary object that can be easily interpreted by the Agents
         return {
@@ -28,8 +126,45 @@ class Tool:
         }
     
     def invoke(self, **kwargs): # This is the placeholder of the function for the tool, which will receive a variable number of parameters
+        deadline = current_deadline() # The deadline of the user request (if any); abandoned or late requests don't call the API anymore
+        if deadline is not None:
+            deadline.check(self.name)
+        key = (self.name, self.endpoint, repr(sorted(kwargs.items())))
+        cached = _negative_cache.get(key) if self.endpoint else None # Local tools are cheap to ask and their data can change anytime
+        if cached is not None and cached[0] > time.monotonic(): # Asked recently and there was nothing
+            self.last_status = "empty"
+            return cached[1]
+        breaker = breaker_for(self.endpoint) if self.endpoint else None
+        if breaker is not None and not breaker.allow():
+            print(f"Skipping {self.name}: {self.endpoint} is unavailable")
+            self.last_status = "unavailable"
+            return {}
         print(f"Invoking {self.name} with arguments {kwargs}")
-        return self.function(**kwargs) # Returning the results of the function
+        try:
+            result = self.function(**kwargs)
+        except ToolError: # The tool already printed the error
+            if breaker is not None:
+                breaker.record_failure()
+            self.last_status = "failed"
+            return {}
+        finally:
+            if breaker is not None:
+                breaker.release()
+        if breaker is not None:
+            breaker.record_success()
+        if is_empty_result(result):
+            if not self.endpoint: # Not remembered: news ingested a minute from now must show up right away
+                self.last_status = "empty"
+                return result
+            now = time.monotonic()
+            if len(_negative_cache) > 10000: # Keeps the cache small: expired entries are dropped once it grows
+                for expired in [k for k, (expires, _) in list(_negative_cache.items()) if expires <= now]:
+                    _negative_cache.pop(expired, None)
+            _negative_cache[key] = (now + TOOL_SETTINGS["negative_ttl"], result)
+            self.last_status = "empty"
+        else:
+            self.last_status = "ok"
+        return result # Returning the results of the function
 
 # Next, we'll declare each individual tool as a class, inheriting from the generic class Tool above
 class YahooFinance(Tool): # The first tool is YahooFinance, which will pull stock quotes for a given financial symbol, like AAPL for Apple
@@ -39,9 +174,17 @@ class YahooFinance(Tool): # The first tool is YahooFinance, which will pull stoc
             function=self.get_stock_quote_yahoo, # Pointing to the YahooFinance function below as this class's own function
             description="Get the latest stock quote for a given symbol from Yahoo Finance.", # Definition of the tool for our agents
             api="""{ ""symbol": "AAPL"}""", # Parameter sample for the agent to use when it uses this class
+            endpoint="yahoo:fast_info", # Circuit breaker key
         )
+    def invoke(self, **kwargs):
+        quote = streamed_quote(kwargs.get("symbol")) # Memory first: no API call when the quote stream has the symbol
+        if quote is not None:
+            self.last_status = "ok"
+            return quote
+        return super().invoke(**kwargs)
     def get_stock_quote_yahoo(self, symbol: str, step: str='') -> dict: # This is the function that pulls the stock using YahooFinance API
         # Here we'll perform the call to YahooFinance to get the data from the specified symbol.
+        import yfinance as yf
         ticker = yf.Ticker(symbol)
         # Then, we'll use the 'fast_info' method, which pulls basic financial information, including the price.
         try:
@@ -55,14 +198,15 @@ class YahooFinance(Tool): # The first tool is YahooFinance, which will pull stoc
             }
         except Exception as e: # Should there be any errors, we will print the error message instead and return an empty dictionary
             print(f"Yahoo Finance API error: {e}")
-            return {}
+            raise ToolError(str(e)) # invoke() returns the empty dictionary and counts the failure
 #Now, we'll continue with the class that calls Financial Modeling Prep API
 class FMP(Tool):
     def __init__(self,name:str,function:Callable=None,description:str=None,api:str=None,endPoint:str=None):
-        super().__init__(name=name,function=self.execute if function==None else function,description=description,api=api)
-        self.endpoint = endPoint if endPoint!=None else  os.getenv("FMP_Endpoint") # It reads the endpoint from our .env file
+        endPoint = endPoint if endPoint!=None else  os.getenv("FMP_Endpoint") # It reads the endpoint from our .env file
+        super().__init__(name=name,function=self.execute if function==None else function,description=description,api=api,endpoint=endPoint)
         self.apikey = os.getenv("FMP_API_KEY") # It also reads the API key from our .env file
     def execute(self, symbol: str) -> dict: # This is the function that pulls the stock data using FMP API
+        import requests
         params = { #These are the parameters for the API call in a dictionary format
             "symbol": symbol,
             "apikey": self.apikey,
@@ -70,11 +214,14 @@ class FMP(Tool):
         }
         try: #Then we'll try to make the call to the API and return its formatted response as a JSON text
             # print(f'Calling FMP API at endpoint: {self.endpoint} with params: {params}')
-            response=requests.get(self.endpoint, params=params)
+            response=requests.get(self.endpoint, params=params, timeout=call_timeout(10, self.name)) # At most 10 seconds, less if the request deadline is closer
+            if response.status_code >= 500 or response.status_code == 429: # The service is down or throttling us
+                print(f'FMP API error: HTTP {response.status_code}')
+                raise ToolError(f"FMP returned HTTP {response.status_code}")
             return response.json()
         except requests.exceptions.RequestException as e: # Should there be any errors, we'll print the error message and return an empty dictionary
             print(f'FMP API error: {e}')
-            return {}
+            raise ToolError(str(e)) # invoke() returns the empty dictionary and counts the failure
         
 class StockQuote(FMP):
     def __init__(self):
@@ -84,6 +231,12 @@ class StockQuote(FMP):
             api="""{ "symbol": "AAPL"}""", # Parameter sample for the agent to use when it uses this class
             endPoint='https://financialmodelingprep.com/stable/quote' # It reads the endpoint from our .env file
         )
+    def invoke(self, **kwargs):
+        quote = streamed_quote(kwargs.get("symbol")) # Memory first: no API call when the quote stream has the symbol
+        if quote is not None:
+            self.last_status = "ok"
+            return quote
+        return super().invoke(**kwargs)
 
         
 class StockPriceChange(FMP):
@@ -121,11 +274,13 @@ class FinancialNews(Tool):
             name="FinnHub News", # Name of the tool
             function=self.get_stock_quote_finnhub, # Pointing to the FinnHub function below as this class's own function
             description="Get the latest financial news for a given symbol from FinnHub.", # Definition of the tool for our agents
-            api="""{ ""symbol": "AAPL"}""" # Parameter sample for the agent to use when it uses this class
+            api="""{ ""symbol": "AAPL"}""", # Parameter sample for the agent to use when it uses this class
+            endpoint="finnhub:company-news", # Circuit breaker key
         )
     def get_stock_quote_finnhub(self, symbol: str, step: str='') -> dict: # This is the function that pulls the news data using FinnHub
         FinnHubAPIKey = os.getenv("FINNHUB_API_KEY") # Gets the API key from our .env file
         # Next, we setup the client to perform calls:
+        import finnhub
         finn_client = finnhub.Client(api_key=FinnHubAPIKey)
 
         # Setting a time frame for the news, ending today and starting a week ago
@@ -153,7 +308,9 @@ class FinancialNews(Tool):
     
         except Exception as e: # Should there be any errors, we'll print the error message and return an empty dictionary
             print(f'Finnhub.io API error: {e}')
-            return {}
+            if client_error_status(e): # Bad or unknown symbol: nothing to find, but the service is fine
+                return {}
+            raise ToolError(str(e)) # invoke() returns the empty dictionary and counts the failure
 
 class RecommendationTrends(Tool):
     def __init__(self):
@@ -161,16 +318,20 @@ class RecommendationTrends(Tool):
             name="FinnHub Recommendation Trends", # Name of the tool
             function=self.get_recommendation_trends, # Pointing to the FinnHub function below as this class's own function
             description="Get the recommendation trends for a given symbol from FinnHub.", # Definition of the tool for our agents
-            api="""{ ""symbol": "AAPL"}""" # Parameter sample for the agent to use when this class
+            api="""{ ""symbol": "AAPL"}""", # Parameter sample for the agent to use when this class
+            endpoint="finnhub:recommendation", # Circuit breaker key
         )
     def get_recommendation_trends(self, symbol: str) -> dict:
         FinnHubAPIKey = os.getenv("FINNHUB_API_KEY") # Gets the API key from our .env file
+        import finnhub
         finn_client = finnhub.Client(api_key=FinnHubAPIKey)
         try:
             return finn_client.recommendation_trends(symbol)
         except Exception as e: # Should there be any errors, we'll print the error message and return an empty dictionary
             print(f'Finnhub.io API error: {e}')
-            return {}
+            if client_error_status(e): # Bad or unknown symbol: nothing to find, but the service is fine
+                return {}
+            raise ToolError(str(e)) # invoke() returns the empty dictionary and counts the failure
         
 class EarningSurprise(Tool):
     def __init__(self):
@@ -178,13 +339,80 @@ class EarningSurprise(Tool):
             name="FinnHub Earning Surprise", # Name of the tool
             function=self.get_earning_surprise, # Pointing to the FinnHub function below as this class's own function
             description="Get the earning surprise for a given symbol from FinnHub.", # Definition of the tool for our agents
-            api="""{ ""symbol": "AAPL"}""" # Parameter sample for the agent to use when this class
+            api="""{ ""symbol": "AAPL"}""", # Parameter sample for the agent to use when this class
+            endpoint="finnhub:earnings", # Circuit breaker key
         )
     def get_earning_surprise(self, symbol: str) -> dict:
         FinnHubAPIKey = os.getenv("FINNHUB_API_KEY") # Gets the API key from our .env file
+        import finnhub
         finn_client = finnhub.Client(api_key=FinnHubAPIKey)
         try:
             return finn_client.company_earnings(symbol,limit=5)
         except Exception as e: # Should there be any errors, we'll print the error message and return an empty dictionary
             print(f'Finnhub.io API error: {e}')
-            return {}
\ No newline at end of file
+            if client_error_status(e): # Bad or unknown symbol: nothing to find, but the service is fine
+                return {}
+            raise ToolError(str(e)) # invoke() returns the empty dictionary and counts the failure
+
+# Historical news served from the local news corpus (see modules/newsstore.py), without any network call
+class NewsArchive(Tool):
+    store = None # Shared store instance, loaded the first time any NewsArchive tool is used
+
+    def __init__(self, store_file='news_corpus.pkl'):
+        super().__init__(
+            name="News Archive", # Name of the tool
+            function=self.get_archived_news, # Pointing to the archive lookup below as this class's own function
+            description="Get historical financial news for a given symbol and date range from the local news archive.", # Definition of the tool for our agents
+            api="""{ "symbol": "AAPL", "start_date": "2024-01-01", "end_date": "2024-01-31", "query": "earnings"}""" # Parameter sample for the agent to use when this class
+        )
+        self.store_file = store_file
+
+    def get_archived_news(self, symbol: str, start_date: str=None, end_date: str=None, query: str=None, limit: int=20) -> dict:
+        from modules.newsstore import NewsCorpusStore
+        if NewsArchive.store is None or NewsArchive.store.store_file != self.store_file:
+            NewsArchive.store = NewsCorpusStore(self.store_file)
+        # By default we look at the same window as the FinnHub news tool: the last 7 days
+        if start_date is None and end_date is None:
+            start_date = (datetime.today() - timedelta(days=7)).strftime("%Y-%m-%d")
+        articles = NewsArchive.store.query(symbol=symbol, start=start_date, end=end_date, terms=query, limit=limit)
+        if not articles:
+            return {"message": f"No archived news found for symbol {symbol} from {start_date} to {end_date}."}
+        return {
+            "symbol": symbol,
+            "news": [{
+                "headline": item["headline"],
+                "summary": item["summary"],
+                "datetime": datetime.fromtimestamp(item["timestamp"], timezone.utc).strftime("%Y-%m-%d %H:%M:%S") # Stored as UTC
+            } for item in articles]
+        }
+
+# Company fundamentals from the offline SEC EDGAR store (see modules/edgar.py), without any network call
+class EdgarFacts(Tool):
+    store = None # Shared store instance, loaded the first time any EdgarFacts tool is used
+    concepts = ['Revenues', 'RevenueFromContractWithCustomerExcludingAssessedTax', 'NetIncomeLoss', 'OperatingIncomeLoss',
+                'Assets', 'Liabilities', 'StockholdersEquity', 'EarningsPerShareDiluted'] # Reported by default
+
+    def __init__(self, store_dir='edgar_store'):
+        super().__init__(
+            name="SEC EDGAR Company Facts", # Name of the tool
+            function=self.get_company_facts, # Pointing to the store lookup below as this class's own function
+            description="Get the annual values reported to the SEC (revenue, net income, assets, EPS...) for a given symbol from the local EDGAR store.", # Definition of the tool for our agents
+            api="""{ "symbol": "AAPL", "concepts": ["Revenues", "NetIncomeLoss"], "years": 3}""" # Parameter sample for the agent to use when this class
+        )
+        self.store_dir = store_dir
+
+    def get_company_facts(self, symbol: str, concepts: list=None, years: int=3) -> dict:
+        from modules.edgar import CompanyFactsStore
+        if EdgarFacts.store is None or EdgarFacts.store.store_dir != self.store_dir:
+            EdgarFacts.store = CompanyFactsStore(self.store_dir)
+        if not len(EdgarFacts.store): # No companyfacts dump ingested (CompanyFactsStore.ingest), so no SEC data at all
+            return {"message": "No SEC EDGAR facts available: the local EDGAR store is empty."}
+        facts = {}
+        for concept in concepts or self.concepts:
+            unit = 'USD/shares' if concept.startswith('EarningsPerShare') else 'USD'
+            values = EdgarFacts.store.facts(symbol, concept, unit=unit, annual=True)[-years:]
+            if len(values):
+                facts[concept] = {str(end): float(value) for end, value in zip(values['end'], values['value'])}
+        if not facts:
+            return {"message": f"No SEC EDGAR facts found for symbol {symbol}."}
+        return {"symbol": symbol, "facts": facts}
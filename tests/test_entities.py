@@ -0,0 +1,53 @@
+from datetime import date
+
+from modules.parser import EntityExtractor
+from modules.subagents import MarketResearchAgent, OFF_TOPIC_ANSWER
+
+
+def symbols(text):
+    return [entity["symbol"] for entity in EntityExtractor().extract_all(text)]
+
+
+def test_metric_and_index_words_are_not_tickers():
+    assert symbols("What does the RSI say about AAPL?") == ["AAPL"]
+    assert symbols("What's the VAR and BETA of a portfolio with AAPL, MSFT and GOOGL?") == ["AAPL", "MSFT", "GOOGL"]
+    assert symbols("Is the DOW or GOLD a better hedge?") == []
+
+
+def test_all_caps_input_only_keeps_known_symbols():
+    assert symbols("WHAT IS THE LATEST NEWS ABOUT TESLA AND NVDA TODAY") == ["TSLA", "NVDA"]
+
+
+def test_date_range():
+    extractor = EntityExtractor()
+    today = date(2026, 10, 19)
+    assert extractor.date_range("Apple news in March 2024", today=today) == ("2024-03-01", "2024-03-31")
+    assert extractor.date_range("TSLA from 2024-01-05 to 2024-02-10", today=today) == ("2024-01-05", "2024-02-10")
+    assert extractor.date_range("sentiment in Q4 2023", today=today) == ("2023-10-01", "2023-12-31")
+    assert extractor.date_range("How is Apple doing?", today=today) == (None, None)
+
+
+class ScriptedAgent(MarketResearchAgent):
+    # The model calls answer from a script instead of a provider, and are recorded
+    def __init__(self, answers):
+        super().__init__(memory_system=object())
+        self.answers = answers
+        self.prompts = []
+    def call_llm(self, input_prompt, task="default"):
+        self.prompts.append((task, input_prompt))
+        return self.answers.get(task, "")
+
+
+def test_market_questions_without_known_words_go_to_the_model_instead_of_being_refused():
+    for question in ["Is the yield curve inverted?", "What do you think about the Fed's next move?",
+                     "Should I take profits on my holdings?", "How are chip makers doing?"]:
+        agent = ScriptedAgent({})
+        assert not agent.is_off_topic(question, agent.getEntities(question)), question
+    agent = ScriptedAgent({"entities": "<SYMBOL>SNOW</SYMBOL><EXCHANGE>NYSE</EXCHANGE>"})
+    assert agent.getEntities("Tell me about Snowflake") == {"symbol": "SNOW", "exchange": "NYSE"}
+
+
+def test_off_topic_input_is_refused_when_the_small_model_says_so():
+    agent = ScriptedAgent({"entities": "<SYMBOL>N/A</SYMBOL>", "relevance": "NO"})
+    assert agent.processUserInput("What's a good pasta recipe?") == OFF_TOPIC_ANSWER
+    assert [task for task, _ in agent.prompts] == ["entities", "relevance"]
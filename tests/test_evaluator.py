@@ -0,0 +1,61 @@
+import time
+import threading
+
+from modules.deadline import DeadlineExceeded, current_deadline
+from modules.evaluator import EvaluatorOptimizer
+
+GOOD_DRAFT = "Great question! AAPL is up 2%.\n\nThe pros and cons are balanced."
+
+
+def slow_generate(content):
+    current_deadline().sleep(1.0) # Wakes up (and raises) as soon as the draft is cancelled
+    return GOOD_DRAFT
+
+
+def test_time_budget_applies_before_the_first_draft():
+    optimizer = EvaluatorOptimizer(slow_generate, refine=None, scorer=lambda d, c: (1.0, []), time_budget=0.2)
+    start = time.monotonic()
+    try:
+        optimizer.run("How is AAPL doing?")
+    except DeadlineExceeded:
+        pass
+    else:
+        raise AssertionError("expected DeadlineExceeded")
+    assert time.monotonic() - start < 0.5
+
+
+def test_losing_drafts_are_cancelled():
+    calls = iter(range(3))
+    cancelled = []
+    lock = threading.Lock()
+
+    def generate(content):
+        with lock:
+            first = next(calls) == 0
+        if first:
+            return GOOD_DRAFT
+        try:
+            current_deadline().sleep(1.0)
+        except DeadlineExceeded:
+            cancelled.append(True)
+            raise
+        return GOOD_DRAFT
+
+    optimizer = EvaluatorOptimizer(generate, refine=None, scorer=lambda d, c: (1.0, []))
+    assert optimizer.run("How is AAPL doing?") == GOOD_DRAFT
+    for _ in range(50): # The losers wake up in their own threads
+        if len(cancelled) == 2:
+            break
+        time.sleep(0.01)
+    assert len(cancelled) == 2
+
+
+def test_last_run_is_kept_per_thread():
+    optimizer = EvaluatorOptimizer(lambda content: GOOD_DRAFT, refine=None, scorer=lambda d, c: (1.0, []), candidates=1)
+    optimizer.run("How is AAPL doing?")
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append(optimizer.last_run))
+    thread.start()
+    thread.join()
+    assert optimizer.last_run["best_score"] == 1.0
+    assert seen == [{}]
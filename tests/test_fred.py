@@ -0,0 +1,15 @@
+import os
+
+import numpy as np
+
+from modules.fred import FredStore, OBSERVATION_DTYPE
+
+
+def test_store_folder_is_created_on_the_first_write(tmp_path):
+    store_dir = str(tmp_path / "fred_store")
+    store = FredStore(store_dir)
+    assert not os.path.exists(store_dir)
+    assert len(store.observations("DGS10")) == 0
+    records = np.array([(np.datetime64("2024-01-02"), 4.0), (np.datetime64("2024-01-03"), 3.9)], dtype=OBSERVATION_DTYPE)
+    assert store.append("DGS10", records) == 2
+    assert list(store.observations("DGS10")["value"]) == [4.0, 3.9]
@@ -0,0 +1,119 @@
+import time
+
+from modules.deadline import Deadline, DeadlineExceeded, deadline_scope
+from modules.llm import FakeProvider, LLMRouter, Route
+
+MESSAGES = [{"role": "user", "content": "How is AAPL doing?"}]
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def test_failover_answers_from_the_next_route():
+    primary = FakeProvider("primary", latency=0.01, fail_rate=1.0)
+    secondary = FakeProvider("secondary", latency=0.01)
+    router = LLMRouter([Route(primary, "model-a"), Route(secondary, "model-b")])
+    assert router.complete(MESSAGES).startswith("secondary/")
+    assert router.stats["failovers"] == 1
+    assert router.stats["failures"] == 0
+
+
+def test_all_routes_failing_raises():
+    router = LLMRouter([Route(FakeProvider("a", latency=0.01, fail_rate=1.0), "m"), Route(FakeProvider("b", latency=0.01, fail_rate=1.0), "m")])
+    try:
+        router.complete(MESSAGES)
+    except RuntimeError as e:
+        assert "All LLM routes failed" in str(e)
+    else:
+        raise AssertionError("expected RuntimeError")
+    assert router.stats["failures"] == 1
+
+
+def test_hedge_wins_and_the_losing_call_is_cancelled():
+    slow = FakeProvider("slow", latency=1.0)
+    fast = FakeProvider("fast", latency=0.01)
+    router = LLMRouter([Route(slow, "model-a"), Route(fast, "model-b")], hedge_delay=0.05)
+    start = time.monotonic()
+    assert router.complete(MESSAGES).startswith("fast/")
+    assert time.monotonic() - start < 0.5
+    assert router.stats["hedges"] == 1 and router.stats["hedge_wins"] == 1
+    assert router.stats["cancelled"] == 1
+    time.sleep(0.05) # The slow call wakes up from its cancelled deadline instead of running its full second
+    assert slow.cancelled == 1
+    assert list(router.routes[0].outcomes) == [] # A cancelled call isn't counted as a route error
+
+
+def test_hedging_cuts_the_tail_latency():
+    # 3% of the primary's calls take 0.5s; once the route has min_samples latencies it hedges after its p95
+    def run(max_hedges):
+        primary = FakeProvider("primary", latency=0.005, slow_rate=0.03, slow_latency=0.5, seed=7)
+        secondary = FakeProvider("secondary", latency=0.005, seed=8)
+        router = LLMRouter([Route(primary, "model-a"), Route(secondary, "model-b")],
+                           hedge_delay=0.05, min_hedge_delay=0.05, min_samples=20, max_hedges=max_hedges)
+        latencies = []
+        for _ in range(100):
+            start = time.monotonic()
+            router.complete(MESSAGES)
+            latencies.append(time.monotonic() - start)
+        return percentile(latencies, 0.99), router.stats["hedges"]
+
+    unhedged_p99, _ = run(max_hedges=0)
+    hedged_p99, hedges = run(max_hedges=1)
+    assert unhedged_p99 >= 0.45
+    assert hedged_p99 < 0.15
+    assert hedges <= 10 # Only the slow calls (about 3%) get a duplicate
+
+
+def test_request_deadline_still_applies():
+    router = LLMRouter([Route(FakeProvider("slow", latency=1.0), "m")], hedge_delay=5)
+    with deadline_scope(Deadline(0.1)):
+        start = time.monotonic()
+        try:
+            router.complete(MESSAGES)
+        except DeadlineExceeded:
+            pass
+        else:
+            raise AssertionError("expected DeadlineExceeded")
+    assert time.monotonic() - start < 0.5
+
+
+class FakeCompletions:
+    def __init__(self):
+        self.calls = []
+
+    def create(self, model, prompt, max_tokens, temperature, timeout):
+        self.calls.append((prompt, timeout))
+        return type("Response", (), {"choices": [type("Choice", (), {"index": i, "text": f"answer {i}"})() for i in range(len(prompt))]})()
+
+
+def test_instruct_batch_runs_under_the_tightest_caller_deadline(monkeypatch):
+    import contextvars
+    import modules.llm as llm
+    completions = FakeCompletions()
+    shared = llm.SharedClient("openai", type("Client", (), {"completions": completions})(), 1)
+    monkeypatch.setattr(llm, "get_shared_client", lambda model: shared)
+    monkeypatch.setattr(llm, "provider_for_model", lambda model: "openai")
+
+    def context_with(deadline):
+        with deadline_scope(deadline):
+            return contextvars.copy_context()
+
+    expired = Deadline(0)
+    contexts = [context_with(Deadline(5)), context_with(expired), context_with(None)]
+    results = llm.batch_complete("gpt-3.5-turbo-instruct", [MESSAGES] * 3, contexts=contexts)
+    assert results[0] == "answer 0" and results[2] == "answer 1"
+    assert isinstance(results[1], DeadlineExceeded)
+    prompts, timeout = completions.calls[0]
+    assert len(prompts) == 2 and timeout <= 5
+
+    with shared.slots: # No free connection: the wait ends with the callers' deadline
+        start = time.monotonic()
+        try:
+            llm.batch_complete("gpt-3.5-turbo-instruct", [MESSAGES], contexts=[context_with(Deadline(0.1))])
+        except DeadlineExceeded:
+            pass
+        else:
+            raise AssertionError("expected DeadlineExceeded")
+        assert time.monotonic() - start < 0.5
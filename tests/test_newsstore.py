@@ -0,0 +1,21 @@
+from modules.newsstore import NewsCorpusStore
+
+RECORDS = [
+    {'symbol': 'AAPL', 'headline': 'Apple beats earnings estimates', 'date': '2024-01-02'},
+    {'symbol': 'AAPL', 'headline': 'Apple launches the new iPhone', 'date': '2024-01-05'},
+    {'symbol': 'MSFT', 'headline': 'Microsoft earnings rise', 'date': '2024-01-03'},
+]
+
+
+def test_query_by_symbol_and_terms(tmp_path):
+    store = NewsCorpusStore(str(tmp_path / 'news_corpus.pkl'))
+    assert store.add_articles(RECORDS) == 3
+    assert [a['headline'] for a in store.query('AAPL', terms='earnings')] == ['Apple beats earnings estimates']
+    assert len(store.query(terms='earnings')) == 2
+
+
+def test_stopword_terms_do_not_filter_everything_out(tmp_path):
+    store = NewsCorpusStore(str(tmp_path / 'news_corpus.pkl'))
+    store.add_articles(RECORDS)
+    assert len(store.query('AAPL', terms='the')) == len(store.query('AAPL')) == 2
+    assert len(store.query(terms='?')) == 3
@@ -0,0 +1,30 @@
+from modules.parser import EntityExtractor
+from modules.portfolio import parse_holdings
+
+PRICES = {"AAPL": 200.0, "TSLA": 250.0}
+
+
+def holdings(text, price=PRICES.get):
+    return parse_holdings(text, EntityExtractor(), price=price)
+
+
+def test_metric_words_are_not_holdings():
+    assert holdings("What's the VAR and BETA of a portfolio with AAPL, MSFT and GOOGL?") == {"AAPL": 1.0, "MSFT": 1.0, "GOOGL": 1.0}
+
+
+def test_percentages_and_amounts():
+    assert holdings("40% AAPL, 35% MSFT and $5,000 of NVDA") == {"AAPL": 40.0, "MSFT": 35.0, "NVDA": 5000.0}
+
+
+def test_share_counts_are_valued_at_the_last_close():
+    assert holdings("100 shares of AAPL and 50 shares of TSLA") == {"AAPL": 20000.0, "TSLA": 12500.0}
+    assert holdings("AAPL: 100 shares, TSLA: 50 shares") == {"AAPL": 20000.0, "TSLA": 12500.0}
+
+
+def test_share_counts_without_a_price_are_reported():
+    try:
+        holdings("100 shares of AAPL and 50 shares of TSLA", price=lambda symbol: None)
+    except ValueError as e:
+        assert "AAPL" in str(e)
+    else:
+        raise AssertionError("expected ValueError")
@@ -0,0 +1,21 @@
+import time
+import threading
+
+from modules.quotestream import QuoteStream
+
+
+def test_counters_keep_every_update_across_threads():
+    stream = QuoteStream()
+    message = {"type": "trade", "data": [{"s": "AAPL", "p": 190.0, "v": 10, "t": time.time() * 1000}]}
+    def feed():
+        for _ in range(5000):
+            stream.on_message(message)
+    def requests():
+        for _ in range(5000):
+            stream.quote("AAPL", max_age=1e9)
+    threads = [threading.Thread(target=target) for target in (feed, feed, requests, requests)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert stream.stats == {"messages": 10000, "trades": 10000, "quotes_served": 10000, "quotes_missed": 0}
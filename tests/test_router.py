@@ -0,0 +1,41 @@
+import os
+import threading
+
+from modules.router import IntentRouter, MARKET_AGENT, SENTIMENT_AGENT
+
+MARKET_PLAN = [{"action": "SpecializedAgent", "parameters": {"agentName": MARKET_AGENT, "user_input": "..."}}]
+NEWS_PLAN = [{"action": "SpecializedAgent", "parameters": {"agentName": SENTIMENT_AGENT, "user_input": "..."}}]
+
+
+def test_no_plan_log_is_written_by_default(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    router = IntentRouter([MARKET_AGENT, SENTIMENT_AGENT], retrain_every=1000)
+    router.log_plan("How did AAPL trade today?", MARKET_PLAN)
+    assert os.listdir(tmp_path) == []
+    assert len(router.records) == 1
+
+
+def test_plan_log_is_opt_in_and_reloaded(tmp_path):
+    log_file = str(tmp_path / "plans.jsonl")
+    router = IntentRouter([MARKET_AGENT, SENTIMENT_AGENT], log_file=log_file, retrain_every=1000)
+    router.log_plan("How did AAPL trade today?", MARKET_PLAN)
+    router.log_plan("Any headlines on MSFT?", NEWS_PLAN)
+    assert len(IntentRouter([MARKET_AGENT], log_file=log_file).records) == 2
+
+
+def test_only_one_background_training_at_a_time(monkeypatch):
+    router = IntentRouter([MARKET_AGENT, SENTIMENT_AGENT], retrain_every=2)
+    started, release = [], threading.Event()
+    def slow_train(records=None):
+        started.append(1)
+        release.wait(2)
+        return True
+    monkeypatch.setattr(router, "train", slow_train)
+    for i in range(20): # Ten retrain thresholds reached while the first training still runs
+        router.log_plan(f"question {i} about AAPL", MARKET_PLAN if i % 2 else NEWS_PLAN)
+    release.set()
+    for _ in range(200): # Until the background training has finished
+        if not router.training:
+            break
+        threading.Event().wait(0.01)
+    assert len(started) == 1
@@ -0,0 +1,56 @@
+import time
+
+from modules.screener import Screener, ScreenerTable, parse_screen
+from modules.subagents import ScreenerAgent, SCREENER_BUILDING
+
+ROWS = {
+    'AAPL': {'sector': 'Technology', 'exchange': 'NASDAQ', 'piotroski_score': 8.0, 'change_1m': 3.0, 'pe_ratio': 30.0},
+    'MSFT': {'sector': 'Technology', 'exchange': 'NASDAQ', 'piotroski_score': 6.0, 'change_1m': 1.0, 'pe_ratio': 35.0},
+    'JPM': {'sector': 'Financial Services', 'exchange': 'NYSE', 'piotroski_score': 7.0, 'change_1m': -2.0, 'pe_ratio': 12.0},
+}
+
+
+def screener_with(rows, tmp_path):
+    screener = Screener(table_file=str(tmp_path / 'screener_table.pkl'), universe={})
+    screener.rows, screener.table, screener.built_at = rows, ScreenerTable(rows), time.time()
+    return screener
+
+
+def test_screen_answers_from_the_table(tmp_path):
+    agent = ScreenerAgent(screener=screener_with(ROWS, tmp_path))
+    answer = agent.processUserInput("Which tech names have a Piotroski score above 7 and positive 1-month momentum?")
+    assert answer.startswith("1 stocks meet the conditions")
+    assert "AAPL" in answer and "MSFT" not in answer
+    assert "JPM" in agent.processUserInput("banks with a P/E below 15")
+
+
+def test_missing_metric_is_reported_instead_of_no_stocks(tmp_path):
+    agent = ScreenerAgent(screener=screener_with(ROWS, tmp_path))
+    answer = agent.processUserInput("Tech names with a current ratio above 1.5")
+    assert "no data for current_ratio" in answer
+
+
+def test_first_request_does_not_build_the_table(tmp_path):
+    screener = Screener(table_file=str(tmp_path / 'screener_table.pkl'), universe={})
+    screener._refresh_in_background = lambda: None # The build itself isn't what we test here
+    start = time.monotonic()
+    answer = ScreenerAgent(screener=screener).processUserInput("Tech names with a Piotroski score above 7")
+    assert answer == SCREENER_BUILDING
+    assert time.monotonic() - start < 0.5
+
+
+def test_several_sectors_match_any_of_them():
+    criteria, _, _, _ = parse_screen("tech or energy stocks with a P/E below 15")
+    assert criteria == [('sector', '==', ['Technology', 'Energy']), ('pe_ratio', '<', 15.0)]
+
+
+def test_or_less_and_or_more_are_bounds():
+    assert parse_screen("banks with a P/E of 20 or less")[0] == [('sector', '==', 'Financial Services'), ('pe_ratio', '<=', 20.0)]
+    assert parse_screen("a Piotroski score of 7 or more")[0] == [('piotroski_score', '>=', 7.0)]
+    assert parse_screen("stocks with a P/E of 20")[0] == [] # No exact match on a float
+
+
+def test_screen_on_several_sectors(tmp_path):
+    agent = ScreenerAgent(screener=screener_with(ROWS, tmp_path))
+    answer = agent.processUserInput("tech or bank stocks with a P/E of 30 or less")
+    assert "AAPL" in answer and "JPM" in answer and "MSFT" not in answer
@@ -0,0 +1,43 @@
+from modules.tools import Tool, ToolError, nothing_to_summarize
+
+
+def failing(symbol):
+    raise ToolError("provider down")
+
+
+def test_local_empty_answers_are_not_negative_cached():
+    articles = []
+    tool = Tool("Local News", lambda symbol: {"news": list(articles)} if articles else {}, "local", endpoint=None)
+    assert tool.invoke(symbol="ZZZT") == {}
+    articles.append("Just ingested")
+    assert tool.invoke(symbol="ZZZT") == {"news": ["Just ingested"]}
+
+
+def test_remote_empty_answers_are_negative_cached():
+    calls = []
+    tool = Tool("Remote News", lambda symbol: calls.append(symbol) or {}, "remote", endpoint="test:remote-empty")
+    tool.invoke(symbol="ZZZU")
+    tool.invoke(symbol="ZZZU")
+    assert calls == ["ZZZU"]
+
+
+def test_nothing_to_summarize_only_when_remote_tools_are_down_and_local_ones_are_empty():
+    remote = Tool("Remote", failing, "remote", endpoint="test:remote-down")
+    local = Tool("Local", lambda symbol: {}, "local")
+    remote.invoke(symbol="ZZZV")
+    local.invoke(symbol="ZZZV")
+    assert nothing_to_summarize([remote, local])
+    local_with_data = Tool("Local with data", lambda symbol: {"news": ["Archived"]}, "local")
+    local_with_data.invoke(symbol="ZZZV")
+    assert not nothing_to_summarize([remote, local_with_data])
+
+
+def test_edgar_facts_without_an_ingested_store(tmp_path):
+    from modules.edgar import CompanyFactsStore
+    from modules.tools import EdgarFacts
+    store = CompanyFactsStore(str(tmp_path / "edgar_store"))
+    assert len(store.facts("AAPL", "Revenues")) == 0
+    assert store.statement("AAPL") is None
+    tool = EdgarFacts(store_dir=str(tmp_path / "edgar_store"))
+    assert tool.invoke(symbol="AAPL") == {"message": "No SEC EDGAR facts available: the local EDGAR store is empty."}
+    assert tool.last_status == "empty"
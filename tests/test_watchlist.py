@@ -0,0 +1,29 @@
+from modules.memory import MemorySystem
+from modules.subagents import MarketResearchAgent
+
+
+class CountingMemory(MemorySystem):
+    def __init__(self, memory_file):
+        super().__init__(memory_file=memory_file)
+        self.saves = 0
+    def save_memory(self):
+        self.saves += 1
+        super().save_memory()
+
+
+class OfflineAgent(MarketResearchAgent):
+    # Tool data is canned, and the model fails for one symbol the way call_llm_batch reports it
+    def marketSummaryPrompt(self, symbol):
+        return f"Summarize {symbol}"
+    def call_llm_batch(self, input_prompts, task="default"):
+        return [f"Mock response from {self.name}: ..." if "MSFT" in prompt else f"Summary of {prompt[10:]}" for prompt in input_prompts]
+
+
+def test_refresh_skips_failed_summaries_and_saves_once(tmp_path):
+    memory = CountingMemory(str(tmp_path / "memory.pkl"))
+    agent = OfflineAgent(memory_system=memory)
+    summaries = agent.refresh_watchlist(["AAPL", "MSFT", "NVDA"])
+    assert summaries == {"AAPL": "Summary of AAPL", "NVDA": "Summary of NVDA"}
+    assert "MSFT" not in memory.stock_insights
+    assert memory.saves == 1
+    assert MemorySystem(str(tmp_path / "memory.pkl")).stock_insights["NVDA"][-1]["insight"] == "Summary of NVDA"